@@ -3,6 +3,11 @@ ASGI config for AI_calendar project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn AI_calendar.asgi:application``)
+so the job event streams and long polls, guest extractions and Calendar calls in
+home/views.py are async tasks rather than blocked worker threads
+(``python manage.py load_test_views`` compares the two).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
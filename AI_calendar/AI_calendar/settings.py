@@ -34,6 +34,52 @@ LOGGING = {
 SESSION_ENGINE = "django.contrib.sessions.backends.db"
 
 
+# Extraction job queue (see home/jobs.py)
+EXTRACTION_WORKERS = config("EXTRACTION_WORKERS", default=4, cast=int)
+EXTRACTION_QUEUE_DEPTH = config("EXTRACTION_QUEUE_DEPTH", default=100, cast=int)
+EXTRACTION_MAX_ATTEMPTS = config("EXTRACTION_MAX_ATTEMPTS", default=3, cast=int)
+EXTRACTION_RETRY_BACKOFF = config("EXTRACTION_RETRY_BACKOFF", default=5, cast=float)
+EXTRACTION_LOCK_TIMEOUT = config("EXTRACTION_LOCK_TIMEOUT", default=900, cast=int)
+# Fair scheduling and admission control: estimated LLM tokens per PDF page and per text
+# query, owner weights, pending PDF jobs per user or session, the longest PDF backlog
+# accepted at the OPENAI_TPM limit, and the Retry-After used without a TPM limit.
+# At most EXTRACTION_BULK_WORKERS workers (default: all but one) run PDF jobs at a time.
+EXTRACTION_TOKENS_PER_PAGE = config("EXTRACTION_TOKENS_PER_PAGE", default=3000, cast=int)
+EXTRACTION_TOKENS_PER_QUERY = config("EXTRACTION_TOKENS_PER_QUERY", default=1500, cast=int)
+EXTRACTION_USER_WEIGHT = config("EXTRACTION_USER_WEIGHT", default=2.0, cast=float)
+EXTRACTION_SESSION_WEIGHT = config("EXTRACTION_SESSION_WEIGHT", default=1.0, cast=float)
+EXTRACTION_QUEUE_PER_OWNER = config("EXTRACTION_QUEUE_PER_OWNER", default=3, cast=int)
+EXTRACTION_MAX_BACKLOG_SECONDS = config("EXTRACTION_MAX_BACKLOG_SECONDS", default=300, cast=int)
+EXTRACTION_RETRY_AFTER = config("EXTRACTION_RETRY_AFTER", default=10, cast=int)
+EXTRACTION_BULK_WORKERS = config("EXTRACTION_BULK_WORKERS", default=None, cast=lambda v: int(v) if v else None)
+# Identical jobs running at the same time share one extraction
+EXTRACTION_COALESCE = config("EXTRACTION_COALESCE", default=True, cast=bool)
+# False when workers run out of process with `manage.py run_extraction_workers`
+EXTRACTION_RUN_IN_PROCESS = config("EXTRACTION_RUN_IN_PROCESS", default=True, cast=bool)
+
+# Job status push (see job_events in home/views.py). Streams check the job's version every
+# JOB_STREAM_INTERVAL seconds and close after JOB_STREAM_TIMEOUT; EventSource reconnects.
+JOB_STREAM_INTERVAL = config("JOB_STREAM_INTERVAL", default=0.5, cast=float)
+JOB_STREAM_TIMEOUT = config("JOB_STREAM_TIMEOUT", default=300, cast=int)
+JOB_LONG_POLL_TIMEOUT = config("JOB_LONG_POLL_TIMEOUT", default=25, cast=int)
+
+# Minimum seconds between Google Calendar syncs of a user's local event mirror
+# (see home/calendar_sync.py); page loads in between read only from the database
+CALENDAR_SYNC_INTERVAL = config("CALENDAR_SYNC_INTERVAL", default=60, cast=int)
+# Read every inserted event back from Google after creating it (debugging only)
+GOOGLE_CONFIRM_INSERTS = config("GOOGLE_CONFIRM_INSERTS", default=False, cast=bool)
+# Per-user Calendar services kept by home/google_services.py, and how long (seconds)
+# cached credentials are trusted before SocialToken is read again
+GOOGLE_SERVICE_POOL_USERS = config("GOOGLE_SERVICE_POOL_USERS", default=256, cast=int)
+GOOGLE_SERVICE_POOL_MAX_AGE = config("GOOGLE_SERVICE_POOL_MAX_AGE", default=3600, cast=int)
+# Bearer token a Prometheus scraper sends to /metrics/ (staff users need none)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# run_extraction_workers processes write their metrics for /metrics/ every
+# METRICS_FLUSH_INTERVAL seconds; a stopped process's are dropped after METRICS_SNAPSHOT_TTL
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=15, cast=float)
+METRICS_SNAPSHOT_TTL = config("METRICS_SNAPSHOT_TTL", default=7 * 86400, cast=int)
+
+
 GOOGLE_CLIENT_ID = config("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = config("GOOGLE_CLIENT_SECRET")
 
@@ -120,6 +166,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Transactions take the write lock when they begin, so enqueue_job's admission
+        # check and insert can't interleave with another process's (see home/jobs.py)
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
     }
 }
 
@@ -180,6 +229,12 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "AI_calendar/static"),
 ]
 
+# Uploaded PDFs wait here until their extraction job runs; workers on other nodes
+# need this directory on shared storage
+EXTRACTION_UPLOAD_DIR = config("EXTRACTION_UPLOAD_DIR", default=str(BASE_DIR / "uploads"))
+# Responses of completed LLM calls per running job, so retries resume (see home/jobs.py)
+EXTRACTION_CHECKPOINT_DIR = config("EXTRACTION_CHECKPOINT_DIR", default=str(BASE_DIR / "checkpoints"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
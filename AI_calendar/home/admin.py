@@ -1,3 +1,24 @@
 from django.contrib import admin
+from home.models import ExtractionJob, SyncedCalendar, CalendarEvent
 
 # Register your models here.
+
+
+@admin.register(ExtractionJob)
+class ExtractionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "attempts", "session_key", "user", "created_at", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("id", "session_key", "query")
+
+
+@admin.register(SyncedCalendar)
+class SyncedCalendarAdmin(admin.ModelAdmin):
+    list_display = ("calendar_id", "name", "user", "primary", "synced_at")
+    search_fields = ("calendar_id", "name")
+
+
+@admin.register(CalendarEvent)
+class CalendarEventAdmin(admin.ModelAdmin):
+    list_display = ("summary", "calendar_id", "user", "start", "end")
+    list_filter = ("calendar_id",)
+    search_fields = ("summary", "google_event_id")
@@ -0,0 +1,227 @@
+from datetime import datetime, timedelta
+from dateutil import parser, tz
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+from home.models import SyncedCalendar, CalendarEvent
+from home.calendar_batch import execute_batch, describe_error
+
+
+# Local mirror of each user's Google calendars, kept current with the Calendar API's
+# incremental sync protocol: the first sync of a calendar lists its events in full and
+# saves the nextSyncToken; later syncs send that token and get back only what changed
+# (cancelled events included), page by page via nextPageToken. The calendars are listed
+# together in batch requests. Page loads read from the mirror and sync at most every
+# CALENDAR_SYNC_INTERVAL seconds.
+
+# How far back the first (full) sync of a calendar reaches
+FULL_SYNC_LOOKBACK = timedelta(days=1)
+# Events per calendar the index view shows, as with the old maxResults=100
+INDEX_EVENTS_PER_CALENDAR = 100
+# SQLite limits the number of variables in one query
+DELETE_BATCH = 500
+
+_all_day_timezone = tz.gettz("America/New_York")
+
+
+def is_sync_due(user) -> bool:
+    interval = getattr(settings, "CALENDAR_SYNC_INTERVAL", 60)
+    oldest = SyncedCalendar.objects.filter(user=user).aggregate(oldest=Min("synced_at"))["oldest"]
+    return oldest is None or oldest < timezone.now() - timedelta(seconds=interval)
+
+
+def sync_user_calendars(service, user) -> None:
+    entries = list_calendars(service)
+
+    # Calendars the user removed or unsubscribed from disappear from the mirror
+    calendar_ids = [entry["id"] for entry in entries]
+    with transaction.atomic():
+        SyncedCalendar.objects.filter(user=user).exclude(calendar_id__in=calendar_ids).delete()
+        CalendarEvent.objects.filter(user=user).exclude(calendar_id__in=calendar_ids).delete()
+
+    calendars = []
+    for entry in entries:
+        calendar, _ = SyncedCalendar.objects.update_or_create(
+            user=user,
+            calendar_id=entry["id"],
+            defaults={
+                "name": entry.get("summary", ""),
+                "color": entry.get("backgroundColor", "#3788d8"),
+                "primary": entry.get("primary", False),
+            }
+        )
+        calendars.append(calendar)
+
+    for calendar, (items, sync_token, full) in fetch_changes(service, calendars).items():
+        save_changes(calendar, items, sync_token, full)
+
+
+def list_calendars(service) -> list[dict]:
+    entries = []
+    page_token = None
+    while True:
+        result = service.calendarList().list(pageToken=page_token).execute()
+        entries.extend(result.get("items", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return entries
+
+
+# Pages through the changes of every calendar at once: each round is one batch request
+# holding the next events.list page of every calendar that still has one. A calendar
+# without a sync token gets a full listing. Returns {calendar: (items, new sync token,
+# whether it was a full listing)}; calendars whose listing failed are left out.
+def fetch_changes(service, calendars: list[SyncedCalendar]) -> dict:
+    states = {
+        calendar: {"items": [], "sync_token": calendar.sync_token, "page_token": None}
+        for calendar in calendars
+    }
+    pending = list(calendars)
+    done = {}
+
+    while pending:
+        requests = [
+            service.events().list(**list_params(calendar.calendar_id, states[calendar]))
+            for calendar in pending
+        ]
+        results = execute_batch(service, requests)
+
+        still_pending = []
+        for calendar, (result, exception) in zip(pending, results):
+            state = states[calendar]
+            if exception is not None:
+                # 410 Gone: the sync token expired and Google asks for a new full sync
+                if isinstance(exception, HttpError) and exception.resp.status == 410 and state["sync_token"]:
+                    print(f"Sync token expired for calendar {calendar.calendar_id}, running a full sync")
+                    states[calendar] = {"items": [], "sync_token": "", "page_token": None}
+                    still_pending.append(calendar)
+                else:
+                    print(f"Error syncing calendar {calendar.calendar_id}:", describe_error(exception))
+                continue
+
+            state["items"].extend(result.get("items", []))
+            state["page_token"] = result.get("nextPageToken")
+            if state["page_token"]:
+                still_pending.append(calendar)
+            else:
+                done[calendar] = (state["items"], result.get("nextSyncToken"), not state["sync_token"])
+
+        pending = still_pending
+
+    return done
+
+
+def list_params(calendar_id: str, state: dict) -> dict:
+    params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 250}
+    if state["sync_token"]:
+        params["syncToken"] = state["sync_token"]
+    else:
+        params["timeMin"] = (timezone.now() - FULL_SYNC_LOOKBACK).isoformat()
+    if state["page_token"]:
+        params["pageToken"] = state["page_token"]
+    return params
+
+
+# Everything is fetched before anything is written, so no transaction stays open across
+# HTTP calls
+def save_changes(calendar: SyncedCalendar, items: list[dict], sync_token: str | None, full: bool) -> None:
+    with transaction.atomic():
+        if full:
+            CalendarEvent.objects.filter(user=calendar.user, calendar_id=calendar.calendar_id).delete()
+        apply_changes(calendar, items)
+        calendar.sync_token = sync_token or ""
+        calendar.synced_at = timezone.now()
+        calendar.save(update_fields=["sync_token", "synced_at"])
+
+
+def apply_changes(calendar: SyncedCalendar, items: list[dict]) -> None:
+    changed_ids = [item["id"] for item in items]
+    rows = {}
+    for item in items:
+        row = make_event(calendar.user, calendar.calendar_id, item)
+        if row is not None:
+            rows[item["id"]] = row
+
+    # Changed events are replaced; cancelled ones (and ones without times) are only removed
+    existing = CalendarEvent.objects.filter(user=calendar.user, calendar_id=calendar.calendar_id)
+    for i in range(0, len(changed_ids), DELETE_BATCH):
+        existing.filter(google_event_id__in=changed_ids[i:i + DELETE_BATCH]).delete()
+    CalendarEvent.objects.bulk_create(rows.values())
+
+
+# Builds the mirror row for an API event, or returns None for a cancelled or timeless one
+def make_event(user, calendar_id: str, item: dict) -> CalendarEvent | None:
+    if item.get("status") == "cancelled":
+        return None
+
+    start = item.get("start", {}).get("dateTime") or item.get("start", {}).get("date")
+    end = item.get("end", {}).get("dateTime") or item.get("end", {}).get("date")
+    if not start or not end:
+        return None
+
+    return CalendarEvent(
+        user=user,
+        calendar_id=calendar_id,
+        google_event_id=item["id"],
+        summary=item.get("summary", "No Title"),
+        start=start,
+        end=end,
+        start_at=parse_event_time(start),
+        end_at=parse_event_time(end),
+        location=item.get("location", ""),
+        description=item.get("description", ""),
+        creator=item.get("creator", {}).get("email", ""),
+        html_link=item.get("htmlLink", ""),
+    )
+
+
+# dateTime values carry an offset; all-day dates are taken as midnight local time
+def parse_event_time(value: str) -> datetime:
+    parsed = parser.isoparse(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_all_day_timezone)
+    return parsed
+
+
+# The views address the user's main calendar as "primary"; the mirror uses its real id
+def resolve_calendar_id(user, calendar_id: str) -> str:
+    if calendar_id != "primary":
+        return calendar_id
+    calendar = SyncedCalendar.objects.filter(user=user, primary=True).first()
+    return calendar.calendar_id if calendar is not None else calendar_id
+
+
+# Writes through an event the app itself created or updated, so it shows up before the
+# next sync
+def store_event(user, calendar_id: str, item: dict) -> None:
+    calendar_id = resolve_calendar_id(user, calendar_id)
+    with transaction.atomic():
+        CalendarEvent.objects.filter(user=user, calendar_id=calendar_id, google_event_id=item["id"]).delete()
+        row = make_event(user, calendar_id, item)
+        if row is not None:
+            row.save()
+
+
+def remove_event(user, calendar_id: str, event_id: str) -> None:
+    calendar_id = resolve_calendar_id(user, calendar_id)
+    CalendarEvent.objects.filter(user=user, calendar_id=calendar_id, google_event_id=event_id).delete()
+
+
+# Calendars and upcoming events for the index view, read from the mirror only
+def load_events(user) -> tuple[list[dict], list[dict]]:
+    calendars = list(SyncedCalendar.objects.filter(user=user))
+    colors = {calendar.calendar_id: calendar.color for calendar in calendars}
+
+    since = timezone.now() - timedelta(minutes=5)
+    counts = {}
+    events = []
+    for event in CalendarEvent.objects.filter(user=user, end_at__gte=since).order_by("start_at"):
+        if event.calendar_id not in colors:
+            continue
+        counts[event.calendar_id] = counts.get(event.calendar_id, 0) + 1
+        if counts[event.calendar_id] <= INDEX_EVENTS_PER_CALENDAR:
+            events.append(event.to_dict(colors[event.calendar_id]))
+
+    return events, [calendar.to_dict() for calendar in calendars]
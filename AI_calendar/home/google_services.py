@@ -0,0 +1,184 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from allauth.socialaccount.models import SocialToken
+
+
+# Per-user Calendar API clients. build('calendar', 'v3') reads and parses the discovery
+# document on every call, and the views also queried SocialToken and built Credentials on
+# every request; access tokens refreshed along the way were thrown away.
+# The pool keeps each user's Credentials (LRU, at most max_users) with a few idle service
+# objects, builds services from a discovery document parsed once per process, and writes
+# refreshed tokens back to SocialToken.
+# Service objects are not thread-safe (they share one httplib2.Http), so each request
+# checks one out exclusively and returns it afterwards.
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+
+@lru_cache(maxsize=None)
+def get_discovery_document(name: str = "calendar", version: str = "v3") -> dict:
+    return json.loads(get_static_doc(name, version))
+
+
+class UserServices:
+    def __init__(self, token: SocialToken):
+        self.token_id = token.id
+        self.credentials = Credentials(
+            token=token.token,
+            refresh_token=token.token_secret,
+            token_uri=TOKEN_URI,
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET,
+            scopes=SCOPES,
+            # google-auth compares naive UTC datetimes; a known expiry lets it refresh
+            # before a call fails instead of after
+            expiry=timezone.make_naive(token.expires_at, dt_timezone.utc) if token.expires_at else None
+        )
+        self.saved_token = token.token
+        self.saved_refresh_token = token.token_secret
+        self.idle = []
+        self.created_at = time.monotonic()
+
+
+class CalendarServicePool:
+    def __init__(self, max_users: int = 256, max_idle_per_user: int = 2, max_age: float = 3600):
+        self.max_users = max_users
+        self.max_idle_per_user = max_idle_per_user
+        self.max_age = max_age
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__stats = {
+            "hits": 0,
+            "misses": 0,
+            "builds": 0,
+            "evictions": 0,
+            "tokens_written_back": 0,
+            "cold_setup_seconds": 0.0,
+            "warm_setup_seconds": 0.0,
+        }
+
+    # Raises SocialToken.DoesNotExist when the user has no Google token
+    @contextmanager
+    def service(self, user):
+        started = time.perf_counter()
+        entry, service, hit = self.__checkout(user)
+        self.__record_setup(hit, time.perf_counter() - started)
+
+        try:
+            yield service
+        finally:
+            self.__checkin(entry, service)
+            self.save_refreshed_token(entry)
+
+    def __checkout(self, user):
+        with self.__lock:
+            entry = self.__entries.get(user.pk)
+            if entry is not None and time.monotonic() - entry.created_at > self.max_age:
+                del self.__entries[user.pk]
+                entry = None
+            if entry is not None:
+                self.__entries.move_to_end(user.pk)
+                if entry.idle:
+                    return entry, entry.idle.pop(), True
+
+        hit = entry is not None
+        if entry is None:
+            entry = UserServices(SocialToken.objects.get(account__user=user, account__provider='google'))
+            with self.__lock:
+                # Another request may have added the user meanwhile; keep the first entry
+                entry = self.__entries.setdefault(user.pk, entry)
+                self.__entries.move_to_end(user.pk)
+                while len(self.__entries) > self.max_users:
+                    self.__entries.popitem(last=False)
+                    self.__stats["evictions"] += 1
+
+        service = build_from_document(get_discovery_document(), credentials=entry.credentials)
+        with self.__lock:
+            self.__stats["builds"] += 1
+        return entry, service, hit
+
+    def __checkin(self, entry: UserServices, service) -> None:
+        with self.__lock:
+            if len(entry.idle) < self.max_idle_per_user:
+                entry.idle.append(service)
+
+    def __record_setup(self, hit: bool, seconds: float) -> None:
+        with self.__lock:
+            if hit:
+                self.__stats["hits"] += 1
+                self.__stats["warm_setup_seconds"] += seconds
+            else:
+                self.__stats["misses"] += 1
+                self.__stats["cold_setup_seconds"] += seconds
+
+    # google-auth refreshes expired access tokens in place; persist them so the next
+    # process (or the next entry after an eviction) does not refresh again
+    def save_refreshed_token(self, entry: UserServices) -> None:
+        credentials = entry.credentials
+        with self.__lock:
+            if credentials.token == entry.saved_token and credentials.refresh_token == entry.saved_refresh_token:
+                return
+            entry.saved_token = credentials.token
+            entry.saved_refresh_token = credentials.refresh_token
+            self.__stats["tokens_written_back"] += 1
+
+        expires_at = credentials.expiry.replace(tzinfo=dt_timezone.utc) if credentials.expiry else None
+        SocialToken.objects.filter(id=entry.token_id).update(
+            token=credentials.token,
+            token_secret=credentials.refresh_token or "",
+            expires_at=expires_at
+        )
+
+    # Drops a user's cached credentials, e.g. after they signed in again
+    def invalidate(self, user) -> None:
+        with self.__lock:
+            self.__entries.pop(user.pk, None)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+    # Mean setup time per request with and without a cached entry, and the total saved
+    def get_stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["users"] = len(self.__entries)
+
+        cold = stats["cold_setup_seconds"] / stats["misses"] if stats["misses"] else 0.0
+        warm = stats["warm_setup_seconds"] / stats["hits"] if stats["hits"] else 0.0
+        stats["mean_cold_setup_ms"] = round(cold * 1000, 3)
+        stats["mean_warm_setup_ms"] = round(warm * 1000, 3)
+        stats["setup_ms_saved"] = round(max(cold - warm, 0.0) * stats["hits"] * 1000, 3)
+        return stats
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_service_pool() -> CalendarServicePool:
+    global _default_pool
+
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = CalendarServicePool(
+                max_users=getattr(settings, "GOOGLE_SERVICE_POOL_USERS", 256),
+                max_age=getattr(settings, "GOOGLE_SERVICE_POOL_MAX_AGE", 3600),
+            )
+        return _default_pool
+
+
+# Checks out a Calendar service for user from the process-wide pool
+def calendar_service(user):
+    return get_service_pool().service(user)
@@ -0,0 +1,642 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import random
+import socket
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from home.models import ExtractionJob, ExtractionOwner, ChatTurn
+from home.llm.metrics import get_registry
+
+
+# Durable extraction queue on top of the ExtractionJob table.
+# Web processes enqueue jobs; a bounded pool of worker threads claims them with an atomic
+# status update, so several processes or nodes can share the same queue. Failed jobs are
+# retried with exponential backoff, and jobs whose worker died are picked up again once
+# their lock times out. A running job's lock is refreshed every EXTRACTION_HEARTBEAT
+# seconds, and a worker only writes the outcome of a job it still holds the lock of.
+# Every change to a job bumps its version, which is what the event stream and the
+# long-poll endpoint watch.
+# Identical jobs running at the same time in one process share a single extraction
+# (see JobCoalescer).
+# Every completed LLM call of a job is checkpointed to a file, so a retried attempt only
+# makes the calls that are left.
+# Scheduling is fair per owner (a user, or a session for anonymous visitors): short
+# text queries are claimed before bulk PDF extractions, and within a priority jobs are
+# claimed in the order of their finish tags (see finish_tag). Enqueueing is refused with
+# a retry-after estimate once the backlog would take too long at the OpenAI limits.
+# Concurrent enqueues by one owner are serialized (see lock_owner), so the owner's limit
+# and finish tags hold under load.
+
+
+class QueueFull(Exception):
+    # retry_after is in seconds
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_job(session_key: str, user, query: str, pdf_path: str = "", timezone: str = "") -> ExtractionJob:
+    user = user if user is not None and user.is_authenticated else None
+    owner = f"user:{user.pk}" if user is not None else f"session:{session_key or ''}"
+    priority = ExtractionJob.PRIORITY_BULK if pdf_path else ExtractionJob.PRIORITY_INTERACTIVE
+    tokens = estimate_job_tokens(query, pdf_path)
+
+    # Admission, the finish tag and the insert run under the owner's row lock, so two
+    # concurrent enqueues can't both pass the owner's limit or get the same tag
+    with transaction.atomic():
+        lock_owner(owner)
+        admit(owner, priority, tokens)
+        job = ExtractionJob.objects.create(
+            session_key=session_key or "",
+            user=user,
+            query=query,
+            pdf_path=pdf_path or "",
+            user_timezone=timezone,
+            max_attempts=get_setting("EXTRACTION_MAX_ATTEMPTS", 3),
+            owner=owner,
+            priority=priority,
+            estimated_tokens=tokens,
+            virtual_finish=finish_tag(owner, priority, tokens, owner_weight(user)),
+        )
+
+        # Workers can only claim the job once it is committed
+        if get_setting("EXTRACTION_RUN_IN_PROCESS", True):
+            transaction.on_commit(wake_workers)
+
+    return job
+
+
+def wake_workers() -> None:
+    pool = get_worker_pool()
+    pool.start()
+    pool.notify()
+
+
+# Must run inside a transaction; the lock is held until it ends. On SQLite, which has no
+# row locks, the transaction's write lock does the same (see DATABASES in settings.py)
+def lock_owner(owner: str) -> ExtractionOwner:
+    ExtractionOwner.objects.get_or_create(owner=owner)
+    return ExtractionOwner.objects.select_for_update().get(owner=owner)
+
+
+def estimate_job_tokens(query: str, pdf_path: str = "") -> int:
+    if pdf_path:
+        from home.llm.pdf_ingest import count_pages
+        return count_pages(pdf_path) * get_setting("EXTRACTION_TOKENS_PER_PAGE", 3000)
+    return len(query) // 4 + get_setting("EXTRACTION_TOKENS_PER_QUERY", 1500)
+
+
+def owner_weight(user) -> float:
+    if user is not None:
+        return get_setting("EXTRACTION_USER_WEIGHT", 2.0)
+    return get_setting("EXTRACTION_SESSION_WEIGHT", 1.0)
+
+
+# Admission control; raises QueueFull when the queue is at EXTRACTION_QUEUE_DEPTH, when
+# the owner already has EXTRACTION_QUEUE_PER_OWNER bulk jobs pending, or when the
+# pending bulk work would take more than EXTRACTION_MAX_BACKLOG_SECONDS at the OPENAI_TPM
+# limit. Interactive jobs are only held to the depth, since they are claimed first.
+def admit(owner: str, priority: int, tokens: int) -> None:
+    from home.llm.rate_limit import get_default_limiter
+
+    limiter = get_default_limiter()
+    pending = ExtractionJob.objects.filter(status__in=(ExtractionJob.STATUS_QUEUED, ExtractionJob.STATUS_RUNNING))
+
+    def retry_after(backlog) -> int:
+        if limiter is None or not limiter.tpm:
+            return get_setting("EXTRACTION_RETRY_AFTER", 10)
+        seconds = limiter.drain_seconds(backlog.aggregate(tokens=Sum("estimated_tokens"))["tokens"] or 0)
+        return max(1, int(seconds + 0.5))
+
+    count = pending.count()
+    if count >= get_setting("EXTRACTION_QUEUE_DEPTH", 100):
+        raise QueueFull(f"{count} extraction jobs are already pending", retry_after(pending))
+
+    if priority != ExtractionJob.PRIORITY_BULK:
+        return
+
+    owned = pending.filter(owner=owner, priority=ExtractionJob.PRIORITY_BULK)
+    count = owned.count()
+    if count >= get_setting("EXTRACTION_QUEUE_PER_OWNER", 3):
+        raise QueueFull(f"{owner} already has {count} PDF extractions pending", retry_after(owned))
+
+    if limiter is not None and limiter.tpm:
+        bulk = pending.filter(priority=ExtractionJob.PRIORITY_BULK)
+        backlog = (bulk.aggregate(tokens=Sum("estimated_tokens"))["tokens"] or 0) + tokens
+        seconds = limiter.drain_seconds(backlog, bulk=True)
+        limit = get_setting("EXTRACTION_MAX_BACKLOG_SECONDS", 300)
+        if seconds > limit:
+            raise QueueFull(f"{backlog} tokens of PDF extraction are pending", max(1, int(seconds - limit + 0.5)))
+
+
+# Start-time fair queuing over estimated tokens. The virtual clock is the highest tag
+# already claimed in the priority; a job starts at the clock or where the owner's
+# pending jobs finish, whichever is later, and takes tokens / weight. An owner who
+# queues ten PDFs pushes only their own tags back, and owners who come back after
+# being idle start from the clock rather than from their old tags.
+def finish_tag(owner: str, priority: int, tokens: int, weight: float) -> float:
+    jobs = ExtractionJob.objects.filter(priority=priority)
+    clock = jobs.exclude(status=ExtractionJob.STATUS_QUEUED).aggregate(tag=Max("virtual_finish"))["tag"] or 0.0
+    owner_finish = jobs.filter(
+        owner=owner, status__in=(ExtractionJob.STATUS_QUEUED, ExtractionJob.STATUS_RUNNING)
+    ).aggregate(tag=Max("virtual_finish"))["tag"] or 0.0
+    return max(clock, owner_finish) + tokens / weight
+
+
+# Atomically moves one due job from queued to running; returns None when nothing is due.
+# Without allow_bulk only interactive jobs are claimed.
+def claim_next_job(worker_id: str, allow_bulk: bool = True) -> ExtractionJob | None:
+    now = timezone.now()
+    requeue_stale_jobs(now)
+
+    due = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_QUEUED, run_after__lte=now)
+    if not allow_bulk:
+        due = due.filter(priority=ExtractionJob.PRIORITY_INTERACTIVE)
+    candidates = due.order_by("priority", "virtual_finish", "created_at").values_list("id", flat=True)[:10]
+
+    for job_id in candidates:
+        claimed = ExtractionJob.objects.filter(id=job_id, status=ExtractionJob.STATUS_QUEUED).update(
+            status=ExtractionJob.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+            progress={},
+            partial_events=[],
+            version=F("version") + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return ExtractionJob.objects.get(id=job_id)
+
+    return None
+
+
+# A running job whose lock is older than EXTRACTION_LOCK_TIMEOUT lost its worker
+def requeue_stale_jobs(now) -> int:
+    timeout = timedelta(seconds=get_setting("EXTRACTION_LOCK_TIMEOUT", 900))
+    return ExtractionJob.objects.filter(
+        status=ExtractionJob.STATUS_RUNNING, locked_at__lt=now - timeout
+    ).update(
+        status=ExtractionJob.STATUS_QUEUED,
+        locked_by="",
+        locked_at=None,
+        version=F("version") + 1,
+        updated_at=now
+    )
+
+
+def run_job(job: ExtractionJob) -> None:
+    print(f"Running extraction job {job.id} (attempt {job.attempts})")
+
+    from home.llm.backend import Checkpoint
+    from home.llm.event_llm import EventExtraction
+
+    publish = progress_publisher(job)
+    flight, leader = join_flight(job, publish)
+    if not leader:
+        print(f"Extraction job {job.id} attached to job {flight.leader.id}")
+        return
+
+    pages = []
+    extractor = None
+    started = time.perf_counter()
+
+    try:
+        extractor = EventExtraction(
+            timezone=job.user_timezone or None,
+            bulk=bool(job.pdf_path),
+            checkpoint=Checkpoint(checkpoint_path(job)),
+        )
+        if job.pdf_path:
+            # With a PDF, the query is an instruction for filtering its events
+            instruction = job.query if job.query else None
+            stream = extractor.stream_pdf_async(instruction, job.pdf_path, pages)
+        else:
+            stream = extractor.stream_async(None, job.query)
+        with Heartbeat(lambda: [job, *flight.followers] if flight else [job]):
+            events = asyncio.run(publish_stream(stream, extractor, flight.publish if flight else publish))
+
+    except Exception as e:
+        followers = get_coalescer().land(flight)
+        print(f"Extraction job {job.id} failed:", str(e))
+        if extractor is not None:
+            job.metrics = extractor.get_metrics()
+        seconds = time.perf_counter() - started
+        if retry_or_fail(job, e):
+            record_job_metrics(job, seconds)
+        for follower in followers:
+            follower.metrics = {"coalesced_with": str(job.id)}
+            if retry_or_fail(follower, e):
+                record_job_metrics(follower, seconds)
+        return
+
+    followers = get_coalescer().land(flight)
+    seconds = time.perf_counter() - started
+    file_text = "".join(pages)
+    if complete_job(job, events, extractor.get_metrics(), file_text):
+        record_job_metrics(job, seconds)
+    for follower in followers:
+        if complete_job(follower, events, {"coalesced_with": str(job.id)}, file_text):
+            record_job_metrics(follower, seconds)
+    print(f"Extraction job {job.id} saved {len(job.result)} events for {1 + len(followers)} jobs")
+
+
+# Both return False, leaving the job alone, when the worker lost the job's lock
+def complete_job(job: ExtractionJob, events: list[dict], metrics: dict, file_text: str) -> bool:
+    job.result = [normalize_event(ev) for ev in events]
+    job.metrics = metrics
+    job.status = ExtractionJob.STATUS_SUCCEEDED
+    job.error = ""
+    if not release_job(job, "result", "metrics", "status", "error"):
+        return False
+
+    attach_file_text(job, file_text)
+    remove_upload(job)
+    remove_checkpoint(job)
+    return True
+
+
+def retry_or_fail(job: ExtractionJob, error: Exception) -> bool:
+    job.error = str(error)
+
+    if job.attempts < job.max_attempts:
+        # Exponential backoff with jitter, so retries of a burst don't line up
+        base = get_setting("EXTRACTION_RETRY_BACKOFF", 5)
+        delay = base * (2 ** (job.attempts - 1)) * random.uniform(0.5, 1.5)
+        job.status = ExtractionJob.STATUS_QUEUED
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        return release_job(job, "error", "metrics", "status", "run_after")
+
+    job.status = ExtractionJob.STATUS_FAILED
+    job.result = []
+    if not release_job(job, "error", "metrics", "status", "result"):
+        return False
+    remove_upload(job)
+    remove_checkpoint(job)
+    return True
+
+
+# A retried attempt is counted under status "queued"
+def record_job_metrics(job: ExtractionJob, seconds: float) -> None:
+    registry = get_registry()
+    registry.increment("extraction_jobs_total", 1, status=job.status)
+    registry.increment("extraction_job_seconds_total", seconds, status=job.status)
+
+
+# Saves only the given fields (so the progress columns written by the extraction threads
+# are not overwritten with the worker's stale copy) and unlocks the job, if the worker
+# still holds its lock. A job whose lock went stale may have been requeued and claimed
+# by another worker, which then owns its outcome.
+def release_job(job: ExtractionJob, *fields: str) -> bool:
+    values = {field: getattr(job, field) for field in fields}
+    updated = ExtractionJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        **values,
+        locked_by="",
+        version=F("version") + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        print(f"Extraction job {job.id} is no longer locked by {job.locked_by or 'this worker'}; its outcome is dropped")
+        return False
+
+    job.locked_by = ""
+    job.refresh_from_db(fields=["version"])
+    return True
+
+
+# Refreshes the locks of the running jobs (the leader and its followers) every
+# EXTRACTION_HEARTBEAT seconds, so a long extraction isn't requeued as stale
+class Heartbeat:
+    def __init__(self, jobs, interval: float = None):
+        if interval is None:
+            interval = get_setting("EXTRACTION_HEARTBEAT", get_setting("EXTRACTION_LOCK_TIMEOUT", 900) / 3)
+        self.jobs = jobs
+        self.interval = interval
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> "Heartbeat":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+    def run(self) -> None:
+        try:
+            while not self.__stop.wait(self.interval):
+                self.beat()
+        finally:
+            connection.close()
+
+    def beat(self) -> None:
+        now = timezone.now()
+        for job in self.jobs():
+            try:
+                ExtractionJob.objects.filter(
+                    id=job.id, status=ExtractionJob.STATUS_RUNNING, locked_by=job.locked_by
+                ).update(locked_at=now)
+            except Exception as e:
+                print(f"Extraction job {job.id} heartbeat failed:", str(e))
+
+
+# Runs a streaming extraction to the end, publishing every finished chunk's events
+async def publish_stream(stream, extractor, publish) -> list[dict]:
+    events = []
+    async for batch in stream:
+        events.extend(batch)
+        progress = {"done": extractor.stats["done"], "queued": extractor.stats["queued"]}
+        await asyncio.to_thread(publish, progress, batch)
+    return events
+
+
+# Jobs with the same key extract the same events: the content hash of the PDF (or the
+# query text), the instruction, the timezone and the day the relative dates resolve to.
+# The PDF's bytes are hashed rather than its text, which isn't parsed until the
+# extraction runs; the same bytes always give the same text.
+def coalescing_key(job: ExtractionJob) -> str:
+    from home.llm.event_llm import current_time, date_anchor
+    from home.llm.page_store import file_digest
+
+    if job.pdf_path:
+        content = file_digest(job.pdf_path)
+        instruction = job.query
+    else:
+        content = hashlib.sha256(job.query.encode("utf-8")).hexdigest()
+        instruction = ""
+    anchor = date_anchor(current_time(job.user_timezone or None))
+    payload = json.dumps([content, instruction, job.user_timezone, anchor])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# The job's flight and whether the job leads it; (None, True) when coalescing is off or
+# the job can't be keyed (it then runs, and fails, on its own)
+def join_flight(job: ExtractionJob, publish) -> tuple["Flight | None", bool]:
+    if not get_setting("EXTRACTION_COALESCE", True):
+        return None, True
+
+    try:
+        key = coalescing_key(job)
+    except OSError as e:
+        print(f"Extraction job {job.id} can't be coalesced:", str(e))
+        return None, True
+
+    return get_coalescer().join(key, job, publish)
+
+
+# One running extraction and the jobs waiting on it. Every batch the leader publishes
+# goes to all of them; a job that attaches late first gets the events published so far.
+class Flight:
+    def __init__(self, key: str, leader: ExtractionJob, publish):
+        self.key = key
+        self.leader = leader
+        self.followers = []
+        self.__publishers = [publish]
+        self.__progress = {}
+        self.__events = []
+        self.__lock = threading.Lock()
+
+    def attach(self, job: ExtractionJob, publish) -> None:
+        with self.__lock:
+            self.followers.append(job)
+            self.__publishers.append(publish)
+            if self.__events or self.__progress:
+                publish(self.__progress, list(self.__events))
+
+    def publish(self, progress: dict, events: list[dict]) -> None:
+        with self.__lock:
+            self.__progress = progress
+            self.__events.extend(events)
+            for publish in self.__publishers:
+                publish(progress, events)
+
+
+# Single-flight for extraction jobs. A follower's worker thread returns right away; the
+# job stays running under that worker's lock until the leader finishes it, so if the
+# leader's process dies the follower is requeued with the other stale jobs.
+class JobCoalescer:
+    def __init__(self):
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def join(self, key: str, job: ExtractionJob, publish) -> tuple[Flight, bool]:
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = Flight(key, job, publish)
+            else:
+                flight.attach(job, publish)
+
+        record_coalescing("leader" if leader else "follower")
+        return flight, leader
+
+    # Closes the flight to new jobs and returns the jobs that attached to it
+    def land(self, flight: Flight | None) -> list[ExtractionJob]:
+        if flight is None:
+            return []
+
+        with self.__lock:
+            if self.__flights.get(flight.key) is flight:
+                del self.__flights[flight.key]
+            return list(flight.followers)
+
+    def in_flight(self) -> int:
+        with self.__lock:
+            return len(self.__flights)
+
+
+# Share of jobs that attached to another job's extraction instead of running their own
+def record_coalescing(role: str) -> None:
+    registry = get_registry()
+    registry.increment("extraction_coalesced_jobs_total", 1, role=role)
+    leaders = registry.get("extraction_coalesced_jobs_total", role="leader")
+    followers = registry.get("extraction_coalesced_jobs_total", role="follower")
+    registry.set("extraction_coalescing_ratio", followers / (leaders + followers))
+
+
+_coalescer = JobCoalescer()
+
+
+def get_coalescer() -> JobCoalescer:
+    return _coalescer
+
+
+# Appends the events of every finished chunk, already deduplicated and filtered, to the
+# job's partial_events, so clients see suggestions before the whole document is done
+def progress_publisher(job: ExtractionJob):
+    lock = threading.Lock()
+    partial_events = []
+
+    def publish(progress: dict, events: list[dict]) -> None:
+        with lock:
+            partial_events.extend(normalize_event(ev) for ev in events)
+            now = timezone.now()
+            ExtractionJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+                progress=progress,
+                partial_events=list(partial_events),
+                locked_at=now,
+                version=F("version") + 1,
+                updated_at=now
+            )
+
+    return publish
+
+
+def normalize_event(ev: dict) -> dict:
+    return {
+        "title": ev["title"],
+        "start": ev["start"],
+        "end": ev["end"],
+        "location": ev["location"],
+        "description": ev["description"],
+        "backgroundColor": "#3788d8",
+        "calendarId": "primary",
+        "extendedProps": {
+            "location": ev["location"],
+            "description": ev["description"],
+            "creator": "",
+            "htmlLink": "",
+            "googleEventId": ""
+        }
+    }
+
+
+# The chat turn that started the job keeps the extracted text (compressed, by hash)
+def attach_file_text(job: ExtractionJob, file_text: str) -> None:
+    if not file_text:
+        return
+
+    for turn in ChatTurn.objects.filter(job=job):
+        turn.set_file_text(file_text)
+        turn.save(update_fields=["file_text", "file_preview"])
+
+
+def remove_upload(job: ExtractionJob) -> None:
+    if job.pdf_path and os.path.exists(job.pdf_path):
+        os.remove(job.pdf_path)
+
+
+# The responses of the job's completed LLM calls, kept until the job succeeds or fails
+def checkpoint_path(job: ExtractionJob) -> str:
+    directory = get_setting("EXTRACTION_CHECKPOINT_DIR", os.path.join(settings.BASE_DIR, "checkpoints"))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{job.id}.jsonl")
+
+
+def remove_checkpoint(job: ExtractionJob) -> None:
+    path = checkpoint_path(job)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Fixed number of worker threads pulling from the job table. Idle workers sleep for
+# poll_interval, or until notify() is called by an enqueue in the same process.
+# At most bulk_workers of them (all but one by default) run PDF jobs at a time, so a
+# short query never waits for a PDF extraction to finish.
+class JobWorkerPool:
+    def __init__(self, workers: int, poll_interval: float = 2.0, bulk_workers: int = None):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.bulk_workers = bulk_workers if bulk_workers is not None else max(1, workers - 1)
+        self.__bulk_running = 0
+        self.__wake = threading.Event()
+        self.__stop = threading.Event()
+        self.__threads = []
+        self.__lock = threading.Lock()
+        self.__bulk_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__threads:
+                return
+            self.__stop.clear()
+            for i in range(self.workers):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+                thread = threading.Thread(target=self.run_worker, args=(worker_id,), daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def notify(self) -> None:
+        self.__wake.set()
+
+    def stop(self, timeout: float = None) -> None:
+        self.__stop.set()
+        self.__wake.set()
+        with self.__lock:
+            for thread in self.__threads:
+                thread.join(timeout)
+            self.__threads = []
+
+    def join(self) -> None:
+        for thread in list(self.__threads):
+            thread.join()
+
+    def run_worker(self, worker_id: str) -> None:
+        while not self.__stop.is_set():
+            close_old_connections()
+            try:
+                if self.run_next(worker_id):
+                    continue
+            except Exception as e:
+                print(f"Extraction worker {worker_id} error:", str(e))
+
+            self.__wake.wait(self.poll_interval)
+            self.__wake.clear()
+
+        close_old_connections()
+
+    # Claims and runs one job; False when nothing was due
+    def run_next(self, worker_id: str) -> bool:
+        with self.__bulk_lock:
+            allow_bulk = self.__bulk_running < self.bulk_workers
+            if allow_bulk:
+                self.__bulk_running += 1
+
+        reserved = allow_bulk
+        try:
+            job = claim_next_job(worker_id, allow_bulk)
+            if job is None:
+                return False
+            # The slot is only held while a bulk job runs
+            if reserved and job.priority != ExtractionJob.PRIORITY_BULK:
+                self.__release_bulk(reserved)
+                reserved = False
+            run_job(job)
+            return True
+        finally:
+            self.__release_bulk(reserved)
+
+    def __release_bulk(self, reserved: bool) -> None:
+        if reserved:
+            with self.__bulk_lock:
+                self.__bulk_running -= 1
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> JobWorkerPool:
+    global _worker_pool
+
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = JobWorkerPool(
+                workers=get_setting("EXTRACTION_WORKERS", 4),
+                poll_interval=get_setting("EXTRACTION_POLL_INTERVAL", 2.0),
+                bulk_workers=get_setting("EXTRACTION_BULK_WORKERS", None),
+            )
+        return _worker_pool
@@ -0,0 +1,254 @@
+import os
+import json
+import random
+import asyncio
+import threading
+import time
+import weakref
+from openai import OpenAI, AsyncOpenAI
+
+
+# Where APICaller's structured-output calls go. Every backend takes the chat request
+# APICaller built plus a stable request key (the same key ResponseCache uses: model,
+# instruction, text, schema and anchor date), and returns an LLMResponse.
+#  - OpenAIBackend calls the API (or any OpenAI-compatible server via base_url)
+#  - RecordingBackend passes calls through to another backend and saves every response
+#    to a cassette file
+#  - ReplayBackend answers from a cassette without any network access, optionally after
+#    an injected latency, so extraction can be measured and tested offline
+# get_default_backend() picks one from LLM_BACKEND (openai, record or replay). OpenAI
+# backends are shared by every extraction in the process, so their HTTP connection pools
+# are too.
+# Backends make a single attempt per call; retries, hedging and circuit breaking are
+# added around them by ResilientBackend (see home/llm/resilience.py).
+
+
+# retries counts the failed attempts before this response; it is not recorded in cassettes
+class LLMResponse:
+    def __init__(self, content: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.retries = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "content": self.content,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LLMResponse":
+        return cls(**data)
+
+
+class CassetteMiss(KeyError):
+    pass
+
+
+# The client's own retries are turned off so every retry goes through ResilientBackend
+# and is counted. timeout (OPENAI_TIMEOUT seconds) bounds each attempt.
+class OpenAIBackend:
+    def __init__(self, api_key: str = None, base_url: str = None, timeout: float = None):
+        if api_key is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment.")
+        if timeout is None:
+            timeout = float(os.getenv("OPENAI_TIMEOUT", "30"))
+        self.timeout = timeout
+        self.__api_key = api_key
+        self.__base_url = base_url if base_url is not None else os.getenv("OPENAI_BASE_URL")
+        self.__client = OpenAI(api_key=api_key, base_url=self.__base_url, max_retries=0, timeout=timeout)
+
+        # An async client belongs to one event loop, so there is one per running loop:
+        # a single one under ASGI, one per request thread under WSGI
+        self.__async_clients = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        return to_response(self.__client.beta.chat.completions.parse(**request))
+
+    def __async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        with self.__lock:
+            client = self.__async_clients.get(loop)
+            if client is None:
+                client = AsyncOpenAI(api_key=self.__api_key, base_url=self.__base_url, max_retries=0, timeout=self.timeout)
+                self.__async_clients[loop] = client
+            return client
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        return to_response(await self.__async_client().beta.chat.completions.parse(**request))
+
+
+def to_response(completion) -> LLMResponse:
+    message = completion.choices[0].message
+    if message.content is None:
+        raise ValueError(f"Model returned no content: {getattr(message, 'refusal', None)}")
+
+    usage = completion.usage
+    cached = 0
+    if usage is not None and getattr(usage, "prompt_tokens_details", None) is not None:
+        cached = usage.prompt_tokens_details.cached_tokens or 0
+    return LLMResponse(
+        content=message.content,
+        model=completion.model,
+        prompt_tokens=usage.prompt_tokens if usage is not None else 0,
+        completion_tokens=usage.completion_tokens if usage is not None else 0,
+        cached_tokens=cached,
+    )
+
+
+# A JSON file mapping request keys to recorded responses
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.__entries = json.load(file)
+
+    def get(self, key: str) -> LLMResponse | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+        return LLMResponse.from_dict(entry) if entry is not None else None
+
+    # Written after every response, so an interrupted recording keeps what it has
+    def put(self, key: str, response: LLMResponse) -> None:
+        with self.__lock:
+            self.__entries[key] = response.to_dict()
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self.__entries, file, indent=1, sort_keys=True, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+# The responses of one extraction's completed calls, one JSON line each. A put appends
+# its line instead of rewriting the file, and a line cut off by a crash is skipped when
+# the checkpoint is loaded again.
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__needs_newline = False
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    self.__needs_newline = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.__entries[entry["key"]] = entry["response"]
+
+    def get(self, key: str) -> LLMResponse | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+        return LLMResponse.from_dict(entry) if entry is not None else None
+
+    def put(self, key: str, response: LLMResponse) -> None:
+        entry = response.to_dict()
+        line = json.dumps({"key": key, "response": entry}, ensure_ascii=False) + "\n"
+        with self.__lock:
+            self.__entries[key] = entry
+            if self.__needs_newline:
+                line = "\n" + line
+                self.__needs_newline = False
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+    # For async extractions: the write happens off the event loop
+    async def put_async(self, key: str, response: LLMResponse) -> None:
+        await asyncio.to_thread(self.put, key, response)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class RecordingBackend:
+    def __init__(self, inner, cassette_path: str):
+        self.inner = inner
+        self.cassette = Cassette(cassette_path)
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        response = self.inner.complete(request, key)
+        self.cassette.put(key, response)
+        return response
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        response = await self.inner.complete_async(request, key)
+        self.cassette.put(key, response)
+        return response
+
+
+# latency (seconds) plus a uniform random jitter in [0, jitter) is added to every call;
+# seed makes the jitter reproducible
+class ReplayBackend:
+    def __init__(self, cassette_path: str, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.cassette = Cassette(cassette_path)
+        self.latency = latency
+        self.jitter = jitter
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    def __lookup(self, key: str) -> LLMResponse:
+        response = self.cassette.get(key)
+        if response is None:
+            raise CassetteMiss(f"No recorded response for request {key} in {self.cassette.path}")
+        return response
+
+    def __delay(self) -> float:
+        with self.__lock:
+            return self.latency + (self.__random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        response = self.__lookup(key)
+        time.sleep(self.__delay())
+        return response
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        response = self.__lookup(key)
+        await asyncio.sleep(self.__delay())
+        return response
+
+
+_shared_backends = {}
+_shared_backends_lock = threading.Lock()
+
+
+# One OpenAIBackend per API key, base URL and timeout
+def get_openai_backend() -> OpenAIBackend:
+    key = (os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL"), os.getenv("OPENAI_TIMEOUT"))
+    with _shared_backends_lock:
+        backend = _shared_backends.get(key)
+        if backend is None:
+            backend = _shared_backends[key] = OpenAIBackend()
+        return backend
+
+
+def get_default_backend():
+    kind = os.getenv("LLM_BACKEND", "openai")
+    cassette_path = os.getenv("LLM_CASSETTE", os.path.join(os.path.dirname(__file__), "cassette.json"))
+
+    if kind == "replay":
+        return ReplayBackend(
+            cassette_path,
+            latency=float(os.getenv("LLM_REPLAY_LATENCY", "0")),
+            jitter=float(os.getenv("LLM_REPLAY_JITTER", "0")),
+        )
+    if kind == "record":
+        return RecordingBackend(get_openai_backend(), cassette_path)
+    if kind == "openai":
+        return get_openai_backend()
+    raise ValueError(f"Unknown LLM_BACKEND: {kind}")
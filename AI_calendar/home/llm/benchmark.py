@@ -0,0 +1,319 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import textwrap
+from datetime import datetime, timedelta
+from pypdf import PdfReader
+from home.llm.event_llm import EventExtraction, Event
+from home.llm.backend import OpenAIBackend, RecordingBackend, ReplayBackend
+from home.llm.stub_server import StubOpenAIServer
+from home.llm.dedup import EventDeduplicator
+from home.llm.chunker import TextChunker, PAGE_BREAK, estimate_tokens
+
+
+# Compares the fused single-call mode against the staged high-precision mode.
+# Runs against the live API, so OPENAI_API_KEY must be set, except for --suite with
+# --replay or --stub.
+# Usage (from the AI_calendar directory):
+#   python -m home.llm.benchmark                  -> built-in text query
+#   python -m home.llm.benchmark a.pdf b.pdf      -> one row per document and mode
+#   python -m home.llm.benchmark --dedup 5000     -> local deduplication only, no API calls
+#   python -m home.llm.benchmark --chunking       -> chunk count and tokens, no API calls
+#   python -m home.llm.benchmark --suite --stub --record cassette.json
+#   python -m home.llm.benchmark --suite --replay cassette.json --latency 0.5
+#                                                 -> fixed scenario suite, see run_suite
+
+
+def read_pdf_text(file_name: str) -> str:
+    reader = PdfReader(file_name)
+    return PAGE_BREAK.join(page.extract_text() or "" for page in reader.pages)
+
+
+def run_mode(text: str, high_precision: bool, instruction: str = None) -> dict:
+    extractor = EventExtraction(high_precision=high_precision)
+
+    start = time.perf_counter()
+    events = extractor.extract(instruction, text)
+    elapsed = time.perf_counter() - start
+
+    usage = extractor.get_usage()
+    usage["calls_saved"] = extractor.get_stats().get("calls_saved", 0)
+    usage["mode"] = "staged" if high_precision else "fused"
+    usage["events"] = len(events)
+    usage["wall_time"] = elapsed
+    return usage
+
+
+def compare_modes(documents: dict[str, str], instruction: str = None) -> list[dict]:
+    rows = []
+    for name, text in documents.items():
+        for high_precision in (False, True):
+            row = run_mode(text, high_precision, instruction)
+            row["document"] = name
+            rows.append(row)
+    return rows
+
+
+def print_report(rows: list[dict]) -> None:
+    header = f"{'document':<30} {'mode':<7} {'calls':>6} {'prompt':>8} {'compl.':>8} {'saved':>6} {'events':>7} {'time (s)':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['document'][:30]:<30} {row['mode']:<7} {row['calls']:>6} "
+            f"{row['prompt_tokens']:>8} {row['completion_tokens']:>8} "
+            f"{row['calls_saved']:>6} {row['events']:>7} {row['wall_time']:>9.2f}"
+        )
+
+
+# Synthetic extraction output: every event appears twice (overlapping chunks),
+# sometimes with a slightly different title
+def synthetic_events(count: int, seed: int = 0) -> list[Event]:
+    rng = random.Random(seed)
+    base = datetime(2025, 1, 6, 8, 0)
+    events = []
+    for i in range(count // 2):
+        start = base + timedelta(minutes=30 * rng.randrange(0, 24 * 2 * 365))
+        end = start + timedelta(minutes=rng.choice((50, 75, 90)))
+        title = f"CS {1000 + i % 50} Lecture {i}"
+        event = Event(
+            title=title,
+            start=start.isoformat(),
+            end=end.isoformat(),
+            location=f"Room {i % 30}",
+            description=""
+        )
+        copy = event.model_copy(update={"title": title + " (review)" if rng.random() < 0.3 else title})
+        events.extend((event, copy))
+    rng.shuffle(events)
+    return events
+
+
+def benchmark_dedup(count: int) -> None:
+    events = synthetic_events(count)
+
+    start = time.perf_counter()
+    merged, ambiguous = EventDeduplicator().deduplicate(events)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(events)} events -> {len(merged)} unique, {len(ambiguous)} ambiguous clusters in {elapsed * 1000:.1f} ms")
+
+
+# The fixed-width splitter EventExtraction used before TextChunker: 500-character pieces,
+# each sent together with the next one
+def legacy_split(text: str, length: int = 500) -> list[str]:
+    small_chunks = list(text[i: length + i] for i in range(0, len(text), length))
+    if len(small_chunks) <= 1:
+        return small_chunks
+    return list(small_chunks[i] + small_chunks[i+1] for i in range(len(small_chunks) - 1))
+
+
+# Syllabus-like text: schedule lines mixed with prose paragraphs, split into pages
+def synthetic_document(pages: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    topics = ["sorting", "graphs", "dynamic programming", "greedy algorithms", "hashing", "NP-completeness"]
+    day = datetime(2025, 1, 6)
+    page_texts = []
+    for page in range(pages):
+        lines = []
+        for _ in range(8):
+            day += timedelta(days=rng.choice((2, 5)))
+            lines.append(f"{day.strftime('%a %b %d')}: Lecture on {rng.choice(topics)}, Room {rng.randrange(100, 400)}.")
+        prose = " ".join(
+            "Students are expected to read the assigned chapters before class and to participate in discussion."
+            for _ in range(rng.randrange(3, 8))
+        )
+        page_texts.append("\n".join(lines) + "\n\n" + prose)
+    return PAGE_BREAK.join(page_texts)
+
+
+def benchmark_chunking(page_counts: list[int]) -> None:
+    chunker = TextChunker()
+    header = f"{'pages':>6} {'splitter':<8} {'chunks':>7} {'tokens':>8}"
+    print(header)
+    print("-" * len(header))
+    for pages in page_counts:
+        text = synthetic_document(pages)
+        for name, chunks in (("legacy", legacy_split(text)), ("chunker", list(chunker.iter_chunks(text)))):
+            tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+            print(f"{pages:>6} {name:<8} {len(chunks):>7} {tokens:>8}")
+
+
+# Writes a PDF with one page per entry of page_texts (Helvetica, lines wrapped at 90
+# characters), so the suite needs no PDF files or extra packages
+def make_pdf(path: str, page_texts: list[str]) -> None:
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        lines = [wrapped for line in text.splitlines() for wrapped in (textwrap.wrap(line, 90) or [""])]
+        stream = "BT /F1 10 Tf 12 TL 50 750 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        data = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as file:
+        file.write(output)
+
+
+SUITE_TEXT_QUERY = "I have a meeting on this thursday at 2pm for 1 hour at Starbucks about the CS 2340 project."
+SUITE_FILTER_INSTRUCTION = "Only keep the lectures on graphs."
+SUITE_SMALL_PAGES = 3
+SUITE_LARGE_PAGES = 60
+
+# Recorded responses key on the date anchor, so the suite pins it
+SUITE_NOW = "2025-01-06T09:00:00-05:00"
+
+
+# The suite's documents, written to workdir: (name, text or PDF path, instruction)
+def suite_scenarios(workdir: str) -> list[tuple[str, str, str | None]]:
+    small_pdf = os.path.join(workdir, "small.pdf")
+    large_pdf = os.path.join(workdir, "large.pdf")
+    make_pdf(small_pdf, synthetic_document(SUITE_SMALL_PAGES).split(PAGE_BREAK))
+    make_pdf(large_pdf, synthetic_document(SUITE_LARGE_PAGES, seed=1).split(PAGE_BREAK))
+    return [
+        ("text query", SUITE_TEXT_QUERY, None),
+        (f"small pdf ({SUITE_SMALL_PAGES} pages)", small_pdf, None),
+        (f"large pdf ({SUITE_LARGE_PAGES} pages)", large_pdf, None),
+        ("filtered small pdf", small_pdf, SUITE_FILTER_INSTRUCTION),
+    ]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+# Calls run(), which returns the calls and tokens it used, repeat times
+def run_scenario(name: str, run, repeat: int) -> dict:
+    row = {"scenario": name, "runs": repeat, "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "events": 0}
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        usage = run()
+        latencies.append(time.perf_counter() - start)
+        for key in ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "events"):
+            row[key] += usage.get(key, 0)
+
+    total = sum(latencies)
+    row["p50"] = percentile(latencies, 0.5)
+    row["p95"] = percentile(latencies, 0.95)
+    row["docs_per_min"] = repeat * 60 / total if total else 0.0
+    return row
+
+
+def print_suite_report(rows: list[dict]) -> None:
+    header = (
+        f"{'scenario':<26} {'runs':>5} {'calls':>6} {'prompt':>8} {'cached':>8} {'compl.':>8} "
+        f"{'events':>7} {'p50 (s)':>8} {'p95 (s)':>8} {'docs/min':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario'][:26]:<26} {row['runs']:>5} {row['calls']:>6} {row['prompt_tokens']:>8} {row['cached_tokens']:>8} "
+            f"{row['completion_tokens']:>8} {row['events']:>7} {row['p50']:>8.3f} {row['p95']:>8.3f} "
+            f"{row['docs_per_min']:>9.1f}"
+        )
+
+
+def extraction_run(backend, source: str, instruction: str | None):
+    def run() -> dict:
+        extractor = EventExtraction(backend=backend)
+        if source.endswith(".pdf"):
+            events = extractor.extract_pdf(instruction, source)
+        else:
+            events = extractor.extract(instruction, source)
+        usage = extractor.get_usage()
+        usage["events"] = len(events)
+        return usage
+    return run
+
+
+# Runs every suite scenario against backend with the response cache and page store off,
+# so each run pays for its calls and replays hit the same cassette entries
+def run_suite(backend, repeat: int = 5) -> list[dict]:
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ["PAGE_STORE_ENABLED"] = "0"
+    os.environ.setdefault("LLM_NOW", SUITE_NOW)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        return [
+            run_scenario(name, extraction_run(backend, source, instruction), repeat)
+            for name, source, instruction in suite_scenarios(workdir)
+        ]
+
+
+# --replay answers from a cassette, --stub points the client at a local StubOpenAIServer,
+# --record saves whatever answered (the API or the stub) to a cassette
+def suite_backend(args):
+    if args.replay:
+        return ReplayBackend(args.replay, latency=args.latency, jitter=args.jitter), None
+
+    server = None
+    if args.stub:
+        server = StubOpenAIServer(latency=args.latency, jitter=args.jitter).start()
+        backend = OpenAIBackend(api_key="stub", base_url=server.base_url)
+    else:
+        backend = OpenAIBackend()
+    if args.record:
+        backend = RecordingBackend(backend, args.record)
+    return backend, server
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("pdfs", nargs="*")
+    arg_parser.add_argument("--dedup", type=int, metavar="EVENTS")
+    arg_parser.add_argument("--chunking", action="store_true")
+    arg_parser.add_argument("--suite", action="store_true")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--replay", metavar="CASSETTE")
+    arg_parser.add_argument("--record", metavar="CASSETTE")
+    arg_parser.add_argument("--stub", action="store_true")
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    if args.suite:
+        backend, stub = suite_backend(args)
+        try:
+            print_suite_report(run_suite(backend, args.repeat))
+        finally:
+            if stub is not None:
+                stub.stop()
+    elif args.dedup:
+        benchmark_dedup(args.dedup)
+    elif args.chunking:
+        benchmark_chunking([1, 10, 50, 200])
+    else:
+        if args.pdfs:
+            documents = {name: read_pdf_text(name) for name in args.pdfs}
+        else:
+            documents = {
+                "text query": "I have a meeting on this thusday at 2pm for 1 hour at Starbucks about the CS 2340 project."
+            }
+
+        print_report(compare_modes(documents))
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Iterator
+from contextlib import closing, contextmanager
+from collections import OrderedDict
+from functools import lru_cache
+
+
+# Two-tier cache for structured LLM responses.
+# Keys are content addressed (model, instruction, input text, response schema and
+# date anchor), values are the parsed response serialized as JSON.
+#  - memory tier: per-process LRU, bounded by entry count
+#  - disk tier: SQLite file shared by every process, bounded by total size
+# Both tiers drop entries older than the TTL.
+class ResponseCache:
+    def __init__(self, path: str, ttl: float = 86400, max_bytes: int = 50 * 1024 * 1024, memory_entries: int = 512):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self.__memory = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    # Connection that commits (or rolls back) and is closed when the block exits
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    @staticmethod
+    def make_key(model: str, instruction: str, text: str, response_format, anchor: str) -> str:
+        payload = json.dumps(
+            [model, instruction, text, schema_fingerprint(response_format), anchor],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        value = self.__memory_get(key)
+        if value is not None:
+            return value
+        return self.__disk_get(key)
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        self.__remember(key, value, expires_at)
+        self.__disk_set(key, value, expires_at)
+
+    # For async extractions: memory hits are answered on the event loop, disk reads and
+    # writes happen off it
+    async def get_async(self, key: str) -> str | None:
+        value = self.__memory_get(key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.__disk_get, key)
+
+    async def set_async(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        self.__remember(key, value, expires_at)
+        await asyncio.to_thread(self.__disk_set, key, value, expires_at)
+
+    def __memory_get(self, key: str) -> str | None:
+        now = time.time()
+        with self.__lock:
+            entry = self.__memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.__memory.move_to_end(key)
+                    self.__stats["memory_hits"] += 1
+                    return value
+                del self.__memory[key]
+        return None
+
+    def __disk_get(self, key: str) -> str | None:
+        now = time.time()
+        with self.__connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                self.__remember(key, row[0], row[1])
+                with self.__lock:
+                    self.__stats["disk_hits"] += 1
+                return row[0]
+
+        with self.__lock:
+            self.__stats["misses"] += 1
+        return None
+
+    def __disk_set(self, key: str, value: str, expires_at: float) -> None:
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), expires_at, now)
+            )
+            self.__evict(conn, now)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__memory.clear()
+        with self.__connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["memory_entries"] = len(self.__memory)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+    def __remember(self, key: str, value: str, expires_at: float) -> None:
+        with self.__lock:
+            self.__memory[key] = (expires_at, value)
+            self.__memory.move_to_end(key)
+            while len(self.__memory) > self.memory_entries:
+                self.__memory.popitem(last=False)
+                self.__stats["evictions"] += 1
+
+    # Drop expired rows, then least recently used rows until the file fits in max_bytes
+    def __evict(self, conn: sqlite3.Connection, now: float) -> None:
+        removed = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+            removed += len(stale)
+
+        if removed:
+            with self.__lock:
+                self.__stats["evictions"] += removed
+
+
+@lru_cache(maxsize=None)
+def schema_fingerprint(response_format) -> str:
+    return json.dumps(response_format.model_json_schema(), sort_keys=True)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# Process-wide cache configured from the environment, or None when LLM_CACHE_ENABLED=0
+def get_default_cache() -> ResponseCache | None:
+    global _default_cache
+
+    if os.getenv("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                path=os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "llm_cache.sqlite3")),
+                ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+                memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512")),
+            )
+        return _default_cache
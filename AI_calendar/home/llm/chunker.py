@@ -0,0 +1,125 @@
+import re
+from typing import Iterable, Iterator
+
+# tiktoken gives exact gpt-4o token counts when it is installed; otherwise a
+# 4-characters-per-token estimate is close enough to size chunks
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    _encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+# PDF text is joined with form feeds, one per page
+PAGE_BREAK = "\f"
+
+_paragraph_break = re.compile(r"\n\s*\n")
+_sentence_break = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+# Packs sentences, lines and paragraphs into chunks of at most max_tokens, never cutting
+# inside a word. Consecutive chunks share about overlap_tokens of trailing text, so an
+# event near a boundary is still seen whole at least once.
+# page_break=True starts a new chunk (without overlap) at every page.
+class TextChunker:
+    def __init__(self, max_tokens: int = 400, overlap_tokens: int = 40, page_break: bool = False):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.page_break = page_break
+
+    # source is either the whole text (pages separated by form feeds) or an iterable of
+    # page texts, which is consumed lazily
+    def iter_chunks(self, source: str | Iterable[str]) -> Iterator[str]:
+        if isinstance(source, str):
+            pages = source.split(PAGE_BREAK)
+        else:
+            pages = source
+
+        units = []  # (text, separator that follows it, tokens)
+        size = 0
+        fresh = False  # whether units holds anything beyond the previous chunk's overlap
+
+        for page in pages:
+            for unit in self.iter_units(page):
+                if size + unit[2] > self.max_tokens and fresh:
+                    yield join(units)
+                    units = self.overlap(units)
+                    size = sum(u[2] for u in units)
+                    fresh = False
+                    if size + unit[2] > self.max_tokens:
+                        units = []
+                        size = 0
+                units.append(unit)
+                size += unit[2]
+                fresh = True
+
+            if self.page_break:
+                if fresh:
+                    yield join(units)
+                units = []
+                size = 0
+                fresh = False
+
+        if fresh:
+            yield join(units)
+
+    # Sentences within lines, lines within paragraphs; units longer than the budget are
+    # cut at whitespace
+    def iter_units(self, page: str) -> Iterator[tuple[str, str, int]]:
+        for paragraph in _paragraph_break.split(page):
+            lines = [line.strip() for line in paragraph.splitlines()]
+            lines = [line for line in lines if line]
+            for line_index, line in enumerate(lines):
+                sentences = _sentence_break.split(line)
+                for sentence_index, sentence in enumerate(sentences):
+                    if sentence_index < len(sentences) - 1:
+                        separator = " "
+                    elif line_index < len(lines) - 1:
+                        separator = "\n"
+                    else:
+                        separator = "\n\n"
+                    yield from self.split_long(sentence, separator)
+
+    def split_long(self, sentence: str, separator: str) -> Iterator[tuple[str, str, int]]:
+        tokens = estimate_tokens(sentence)
+        if tokens <= self.max_tokens:
+            yield sentence, separator, tokens
+            return
+
+        words = sentence.split()
+        piece = []
+        piece_tokens = 0
+        for word in words:
+            word_tokens = estimate_tokens(word + " ")
+            if piece and piece_tokens + word_tokens > self.max_tokens - self.overlap_tokens:
+                yield " ".join(piece), " ", piece_tokens
+                piece = []
+                piece_tokens = 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            yield " ".join(piece), separator, piece_tokens
+
+    # Trailing units that fit in overlap_tokens
+    def overlap(self, units: list) -> list:
+        kept = []
+        size = 0
+        for unit in reversed(units):
+            if size + unit[2] > self.overlap_tokens:
+                break
+            kept.append(unit)
+            size += unit[2]
+        kept.reverse()
+        return kept
+
+
+def join(units: list) -> str:
+    return "".join(text + separator for text, separator, _ in units).strip()
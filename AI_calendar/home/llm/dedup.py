@@ -0,0 +1,294 @@
+import re
+import heapq
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from dateutil import parser, tz
+
+
+# Local replacement for the remove_duplicate_event LLM call.
+# Events are parsed into datetime intervals and swept in start order, so each event
+# is only compared with the events whose interval it overlaps and whose title shares
+# a word stem with its own. Overlapping events with near-identical titles (and
+# compatible locations) are merged; pairs that are close but not clearly the same are
+# reported as ambiguous clusters, which the caller may send to the LLM or keep as they are.
+class EventDeduplicator:
+    def __init__(
+        self,
+        title_threshold: float = 0.85,
+        ambiguous_threshold: float = 0.6,
+        location_threshold: float = 0.6,
+        tolerance: timedelta = timedelta(minutes=1),
+        timezone: str = "America/New_York",
+    ):
+        self.title_threshold = title_threshold
+        self.ambiguous_threshold = ambiguous_threshold
+        self.location_threshold = location_threshold
+        self.tolerance = tolerance
+        self.timezone = tz.gettz(timezone)
+
+    # Returns the merged events (in first-seen order) and the clusters of merged
+    # events that might still be duplicates of each other
+    def deduplicate(self, events: list) -> tuple[list, list[list]]:
+        if len(events) == 0:
+            return [], []
+
+        parent, ambiguous_pairs = self.cluster(events)
+
+        clusters = {}
+        for i in range(len(events)):
+            clusters.setdefault(find(parent, i), []).append(i)
+
+        merged = []
+        position = {}
+        for root, members in clusters.items():
+            position[root] = len(merged)
+            merged.append(merge([events[i] for i in members]))
+
+        # Ambiguous pairs that ended up in the same cluster are already resolved
+        group_parent = list(range(len(merged)))
+        for i, j in ambiguous_pairs:
+            a = position[find(parent, i)]
+            b = position[find(parent, j)]
+            if a != b:
+                union(group_parent, a, b)
+
+        groups = {}
+        for k in range(len(merged)):
+            groups.setdefault(find(group_parent, k), []).append(merged[k])
+        ambiguous = [group for group in groups.values() if len(group) > 1]
+
+        return merged, ambiguous
+
+    # For streaming: the events that duplicate none of the already emitted ones, merged
+    # among themselves. Emitted events can't change any more, so ambiguous pairs are
+    # kept as distinct events.
+    def deduplicate_new(self, events: list, emitted: list) -> list:
+        if len(events) == 0:
+            return []
+
+        combined = list(emitted) + list(events)
+        parent, _ = self.cluster(combined)
+
+        # A cluster's root is its lowest index, so clusters rooted at a new event hold
+        # only new events
+        clusters = {}
+        for i in range(len(emitted), len(combined)):
+            root = find(parent, i)
+            if root >= len(emitted):
+                clusters.setdefault(root, []).append(combined[i])
+        return [merge(members) for members in clusters.values()]
+
+    # Union-find parents of the duplicate clusters, and the (i, j) pairs that may be duplicates
+    def cluster(self, events: list) -> tuple[list[int], list[tuple[int, int]]]:
+        parent = list(range(len(events)))
+        ambiguous_pairs = []
+
+        timed = []
+        untimed = {}
+        for i, event in enumerate(events):
+            interval = self.parse_interval(event)
+            if interval is None:
+                # Without usable times, only exact repeats can be merged
+                key = (normalize(event.title), event.start, event.end, normalize(event.location))
+                if key in untimed:
+                    union(parent, untimed[key], i)
+                else:
+                    untimed[key] = i
+            else:
+                timed.append((interval[0], interval[1], i))
+
+        timed.sort()
+        titles = [Label(event.title) for event in events]
+        locations = [Label(event.location) for event in events]
+
+        # Sweep line: heap holds (end, index) for intervals that can still overlap.
+        # Active events are indexed by title stem (see Label.keys), so each event is only
+        # compared with the overlapping ones whose titles could be similar. Of events with
+        # the same title and location only the one ending last stays active, since the
+        # others would be compared exactly like it.
+        heap = []
+        active = {}
+        index = {}
+        representative = {}
+        for start, end, i in timed:
+            while heap and heap[0][0] + self.tolerance < start:
+                _, j = heapq.heappop(heap)
+                if j in active:
+                    self.__deactivate(j, active, index, representative, titles, locations)
+
+            same = (titles[i].text, locations[i].text)
+            j = representative.get(same)
+            if j is not None:
+                union(parent, i, j)
+                if end <= active[j]:
+                    continue
+                self.__deactivate(j, active, index, representative, titles, locations)
+            else:
+                candidates = set()
+                for key in titles[i].queries():
+                    candidates.update(index.get(key, ()))
+                for j in sorted(candidates):
+                    verdict = self.compare(titles[i], titles[j], locations[i], locations[j])
+                    if verdict == "duplicate":
+                        union(parent, i, j)
+                    elif verdict == "ambiguous":
+                        ambiguous_pairs.append((i, j))
+
+            active[i] = end
+            representative[same] = i
+            for key in titles[i].keys():
+                index.setdefault(key, set()).add(i)
+            heapq.heappush(heap, (end, i))
+
+        return parent, ambiguous_pairs
+
+    @staticmethod
+    def __deactivate(j: int, active: dict, index: dict, representative: dict, titles: list, locations: list) -> None:
+        del active[j]
+        same = (titles[j].text, locations[j].text)
+        if representative.get(same) == j:
+            del representative[same]
+        for key in titles[j].keys():
+            index[key].discard(j)
+
+    def compare(self, title_a, title_b, location_a, location_b) -> str:
+        score = title_a.similarity(title_b, self.ambiguous_threshold)
+        if score < self.ambiguous_threshold:
+            return "distinct"
+
+        # An empty location is compatible with any other
+        if location_a.text and location_b.text and location_a.similarity(location_b, self.location_threshold) < self.location_threshold:
+            return "distinct"
+
+        if score >= self.title_threshold:
+            return "duplicate"
+        return "ambiguous"
+
+    def parse_interval(self, event) -> tuple[datetime, datetime] | None:
+        start = self.parse_time(event.start)
+        if start is None:
+            return None
+
+        end = self.parse_time(event.end)
+        if end is None:
+            end = start
+
+        if end < start:
+            end = start
+        return start, end
+
+    def parse_time(self, value: str) -> datetime | None:
+        try:
+            return self.to_local(datetime.fromisoformat(value))
+        except (ValueError, TypeError):
+            pass
+        # Slower, but accepts the looser formats the model sometimes returns
+        try:
+            return self.to_local(parser.parse(value))
+        except (ValueError, TypeError, OverflowError):
+            return None
+
+    # Naive times are already local; aware times are converted so both can be compared
+    def to_local(self, value: datetime) -> datetime:
+        if value.tzinfo is not None:
+            value = value.astimezone(self.timezone).replace(tzinfo=None)
+        return value
+
+
+_non_word = re.compile(r"[^\w]+")
+
+# Length of the token prefixes titles are indexed by
+STEM_LENGTH = 3
+
+
+def normalize(value: str) -> str:
+    return _non_word.sub(" ", (value or "").lower()).strip()
+
+
+# Normalized title or location with its tokens precomputed, since each one is compared many times
+class Label:
+    __slots__ = ("text", "tokens", "numbers", "stems")
+
+    def __init__(self, value: str):
+        self.text = normalize(value)
+        self.tokens = set(self.text.split())
+        self.numbers = set(token for token in self.tokens if token.isdigit())
+        self.stems = set(token[:STEM_LENGTH] for token in self.tokens)
+
+    def similarity(self, other, floor: float = 0.0) -> float:
+        # "Homework 3" and "Homework 4" (or "Room 5" and "Room 12") differ however similar the text is
+        if self.numbers and other.numbers and not (self.numbers <= other.numbers or other.numbers <= self.numbers):
+            return 0.0
+        return similarity(self.text, other.text, self.tokens, other.tokens, floor)
+
+    # Index keys: titles are only compared when they share a token stem (which also
+    # covers typos past the first letters) and their numbers don't rule them out, so a
+    # numbered title is filed under each of its numbers
+    def keys(self) -> list[tuple]:
+        if not self.numbers:
+            return [("stem", stem) for stem in self.stems]
+        keys = [("numbered", stem) for stem in self.stems]
+        keys.extend(("number", stem, number) for stem in self.stems for number in self.numbers)
+        return keys
+
+    # Keys of the titles this one may be similar to: unnumbered titles, and numbered ones
+    # sharing a number unless this title has none
+    def queries(self) -> list[tuple]:
+        queries = [("stem", stem) for stem in self.stems]
+        if not self.numbers:
+            queries.extend(("numbered", stem) for stem in self.stems)
+        else:
+            queries.extend(("number", stem, number) for stem in self.stems for number in self.numbers)
+        return queries
+
+
+# Best of character-level and token-level similarity, so reordered titles still match.
+# Scores below floor are not computed exactly; anything under it is treated the same.
+def similarity(a: str, b: str, tokens_a: set = None, tokens_b: set = None, floor: float = 0.0) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+
+    if tokens_a is None:
+        tokens_a = set(a.split())
+    if tokens_b is None:
+        tokens_b = set(b.split())
+    jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    if tokens_a <= tokens_b or tokens_b <= tokens_a:
+        jaccard = max(jaccard, 0.9)
+
+    # The quick ratios are upper bounds of ratio(), so they can rule it out cheaply
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    bound = max(jaccard, floor)
+    if matcher.real_quick_ratio() <= bound or matcher.quick_ratio() <= bound:
+        return jaccard
+    return max(jaccard, matcher.ratio())
+
+
+# Keeps the most complete event of a cluster and fills its empty fields from the others
+def merge(events: list):
+    if len(events) == 1:
+        return events[0]
+    best = max(events, key=lambda e: len(e.title) + len(e.location) + len(e.description))
+    fields = {}
+    for name in ("location", "description"):
+        value = getattr(best, name)
+        if not value:
+            value = next((getattr(e, name) for e in events if getattr(e, name)), value)
+        fields[name] = value
+    return best.model_copy(update=fields)
+
+
+def find(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def union(parent: list[int], i: int, j: int) -> None:
+    root_i = find(parent, i)
+    root_j = find(parent, j)
+    if root_i != root_j:
+        parent[max(root_i, root_j)] = min(root_i, root_j)
@@ -0,0 +1,216 @@
+import os
+import re
+import math
+from datetime import datetime, date, timedelta
+from home.llm.fast_path import DATE_PATTERNS, MONTH_NUMBERS, explicit_date
+from home.llm.prefilter import _months
+from home.llm.router import parse_timestamp
+
+# sentence-transformers adds semantic similarity to the keyword ranking when it is
+# installed and LLM_FILTER_EMBEDDINGS names a local model; otherwise ranking is BM25 only
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+# Local stage in front of filter_event. The instruction is split into a date window
+# ("this week", "in March", "before April 5") and keywords, and the events are ranked
+# against the keywords with BM25 over title, description and location.
+#  - a date window alone, or keywords that every kept event contains, is applied
+#    locally and the LLM is not called
+#  - anything else (negations, comparisons, words no event contains) goes to the LLM,
+#    but only with the events inside the date window, and at most max_candidates of
+#    them when the ranking can tell which ones are relevant
+
+FILLER_WORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "at", "event", "find", "for", "from", "get", "give", "in",
+    "is", "it", "keep", "list", "me", "my", "of", "on", "only", "please", "related", "regarding", "show",
+    "that", "the", "to", "which", "with",
+}
+
+# Instructions the keyword match cannot be trusted with
+NEEDS_LLM = re.compile(
+    r"\b(?:not|no|except|excluding|without|other|unless|or|but|more|less|longer|shorter|first|last|"
+    r"earliest|latest|important|similar|like)\b|n't\b",
+    re.IGNORECASE
+)
+
+_date = (
+    rf"(?:{_months}\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{_months}"
+    rf"|\d{{4}}-\d{{2}}-\d{{2}}|\d{{1,2}}/\d{{1,2}}(?:/\d{{2,4}})?|today|tomorrow)"
+)
+DATE_WINDOWS = [
+    ("between", re.compile(rf"\b(?:between|from)\s+(?P<first>{_date})\s+(?:and|to|until|-)\s+(?P<second>{_date})", re.IGNORECASE)),
+    ("before", re.compile(rf"\b(?:before|until|by)\s+(?P<first>{_date})", re.IGNORECASE)),
+    ("after", re.compile(rf"\bafter\s+(?P<first>{_date})", re.IGNORECASE)),
+    ("since", re.compile(rf"\b(?:from|since)\s+(?P<first>{_date})", re.IGNORECASE)),
+    ("days", re.compile(r"\b(?:in\s+)?(?:the\s+)?next\s+(?P<count>\d{1,3})\s+days\b", re.IGNORECASE)),
+    ("period", re.compile(r"\b(?P<which>this|next)\s+(?P<unit>week|weekend|month)\b", re.IGNORECASE)),
+    ("month", re.compile(rf"\b(?:in|during)\s+(?P<month>{_months})(?:\s+(?P<year>\d{{4}}))?(?!\w)", re.IGNORECASE)),
+    ("day", re.compile(rf"\b(?:on\s+)?(?P<first>{_date})(?!\w)", re.IGNORECASE)),
+]
+
+_token = re.compile(r"[a-z0-9]+")
+
+
+# Lowercased words with plural endings removed, so "graphs" matches "graph"
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for word in _token.findall(text.lower()):
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def event_text(event) -> str:
+    return f"{event.title} {event.description} {event.location}"
+
+
+class FilterDecision:
+    # kind: "date", "keyword" or "all" when answered locally, "llm" when events still
+    # have to go through filter_event
+    def __init__(self, kind: str, events: list, needs_llm: bool):
+        self.kind = kind
+        self.events = events
+        self.needs_llm = needs_llm
+
+
+class EventFilter:
+    def __init__(self, max_candidates: int = None, embedding_model: str = None):
+        if max_candidates is None:
+            max_candidates = int(os.getenv("LLM_FILTER_CANDIDATES", "40"))
+        if embedding_model is None:
+            embedding_model = os.getenv("LLM_FILTER_EMBEDDINGS", "")
+        self.max_candidates = max_candidates
+        self.embedder = None
+        if embedding_model and SentenceTransformer is not None:
+            self.embedder = SentenceTransformer(embedding_model)
+
+    def shortlist(self, instruction: str, events: list, now: datetime) -> FilterDecision:
+        window, rest = parse_date_window(instruction, now.date())
+        if window is not None:
+            events = [event for event in events if in_window(event, window)]
+
+        if NEEDS_LLM.search(rest):
+            return FilterDecision("llm", self.rank(rest, events), True)
+
+        terms = [term for term in tokenize(rest) if term not in FILLER_WORDS and (len(term) > 1 or term.isdigit())]
+        if not terms:
+            return FilterDecision("date" if window is not None else "all", events, False)
+
+        documents = [set(tokenize(event_text(event))) for event in events]
+        if all(any(term in document for document in documents) for term in terms):
+            matching = [event for event, document in zip(events, documents) if all(term in document for term in terms)]
+            if matching:
+                return FilterDecision("keyword", matching, False)
+
+        return FilterDecision("llm", self.rank(" ".join(terms), events), True)
+
+    # The events most relevant to query, best first; all of them when nothing in the
+    # ranking stands out (the LLM then has to judge every event)
+    def rank(self, query: str, events: list) -> list:
+        if len(events) <= self.max_candidates:
+            return events
+
+        scores = bm25_scores(tokenize(query), [tokenize(event_text(event)) for event in events])
+        if self.embedder is not None:
+            texts = [event_text(event) for event in events]
+            vectors = self.embedder.encode([query] + texts, normalize_embeddings=True)
+            scores = [score + float(vectors[0] @ vector) for score, vector in zip(scores, vectors[1:])]
+
+        if not any(score > 0 for score in scores):
+            return events
+        order = sorted(range(len(events)), key=lambda i: scores[i], reverse=True)
+        return [events[i] for i in sorted(order[:self.max_candidates])]
+
+
+def bm25_scores(query: list[str], documents: list[list[str]], k1: float = 1.2, b: float = 0.75) -> list[float]:
+    if not documents:
+        return []
+    average_length = sum(len(document) for document in documents) / len(documents) or 1
+    frequencies = {}
+    for document in documents:
+        for term in set(document):
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+    scores = []
+    for document in documents:
+        score = 0.0
+        for term in set(query):
+            count = document.count(term)
+            if count == 0:
+                continue
+            idf = math.log(1 + (len(documents) - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            score += idf * count * (k1 + 1) / (count + k1 * (1 - b + b * len(document) / average_length))
+        scores.append(score)
+    return scores
+
+
+# ((first day, day after the last), instruction without the date phrase), or (None, instruction)
+def parse_date_window(instruction: str, today: date):
+    for kind, pattern in DATE_WINDOWS:
+        match = pattern.search(instruction)
+        if match is None:
+            continue
+        window = date_window(kind, match, today)
+        if window is not None:
+            return window, instruction[:match.start()] + " " + instruction[match.end():]
+    return None, instruction
+
+
+def date_window(kind: str, match: re.Match, today: date):
+    groups = match.groupdict()
+    if kind == "days":
+        return today, today + timedelta(days=int(groups["count"]) + 1)
+    if kind == "period":
+        offset = 1 if groups["which"].lower() == "next" else 0
+        unit = groups["unit"].lower()
+        if unit == "month":
+            first = date(today.year + (today.month + offset - 1) // 12, (today.month + offset - 1) % 12 + 1, 1)
+            return first, date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        monday = today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+        if unit == "weekend":
+            return monday + timedelta(days=5), monday + timedelta(days=7)
+        return monday, monday + timedelta(days=7)
+    if kind == "month":
+        month = MONTH_NUMBERS[groups["month"].lower()[:3]]
+        year = int(groups["year"]) if groups.get("year") else today.year + (1 if month < today.month else 0)
+        return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+    first = parse_date(groups["first"], today)
+    if first is None:
+        return None
+    if kind == "day":
+        return first, first + timedelta(days=1)
+    if kind == "before":
+        return date.min, first
+    # "after" leaves the day itself out; "from" and "since" include it
+    if kind == "after":
+        return first + timedelta(days=1), date.max
+    if kind == "since":
+        return first, date.max
+    second = parse_date(groups["second"], today)
+    if second is None or second < first:
+        return None
+    return first, second + timedelta(days=1)
+
+
+def parse_date(text: str, today: date) -> date | None:
+    for pattern in DATE_PATTERNS[1:]:
+        match = pattern.fullmatch(text.strip())
+        if match is not None:
+            return explicit_date(match, today)
+    return None
+
+
+# Events whose start cannot be read are kept, so the window never drops them silently
+def in_window(event, window) -> bool:
+    try:
+        start = parse_timestamp(event.start).date()
+    except ValueError:
+        return True
+    return window[0] <= start < window[1]
@@ -1,15 +1,58 @@
 import os
-from openai import OpenAI
+import time
+import asyncio
+from typing import Iterable, AsyncIterator, Awaitable, Callable
 from datetime import datetime
 from dateutil import tz
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from pypdf import PdfReader
+from pydantic import BaseModel, ValidationError
+from home.llm.cache import ResponseCache, get_default_cache
+from home.llm.backend import LLMResponse, Checkpoint, get_default_backend
+from home.llm.resilience import ResilientBackend, RetryBudget
+from home.llm.metrics import PipelineMetrics, get_registry, timed
+from home.llm.router import ModelRouter, get_default_router
+from home.llm.rate_limit import RateLimiter, get_default_limiter, estimate_tokens
+from home.llm.fast_path import FastPathParser
+from home.llm.event_filter import EventFilter
+from home.llm.dedup import EventDeduplicator
+from home.llm.prefilter import TemporalPrefilter
+from home.llm.chunker import TextChunker
+from home.llm.pdf_ingest import iter_pdf_pages
+from home.llm.page_store import PageStore, get_default_store, file_digest, page_digest
 
 
 load_dotenv()
 
 
+DEFAULT_TIMEZONE = os.getenv("LLM_TIMEZONE", "America/New_York")
+
+
+# Anchor for relative dates ("next Thursday") in the user's timezone (an IANA name).
+# LLM_NOW pins it to an ISO timestamp, so recorded responses replay the same way on any day.
+def current_time(timezone: str = None) -> datetime:
+    zone = tz.gettz(timezone or DEFAULT_TIMEZONE)
+    fixed = os.getenv("LLM_NOW")
+    if fixed:
+        now = datetime.fromisoformat(fixed)
+        return now.astimezone(zone) if now.tzinfo is not None else now
+    return datetime.now(tz=zone)
+
+
+# The anchor is rounded to the day, like the response cache key, so every prompt of the
+# day shares it
+def date_anchor(now: datetime) -> str:
+    anchor = f"Today is {now.date().isoformat()}, {now.strftime('%A')}"
+    offset = now.strftime("%z")
+    if offset:
+        anchor += f", UTC{offset[:3]}:{offset[3:]}"
+    return anchor + "."
+
+
+# One minified JSON object per line
+def serialize_events(events: Iterable[BaseModel]) -> str:
+    return "\n".join(event.model_dump_json() for event in events)
+
+
 # Class that describes the variables of a calender event
 class Event(BaseModel):
     title: str
@@ -52,129 +95,385 @@ class EventDescriptionWrapper(BaseModel):
 
 
 class APICaller:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment.")
-        self.__client = OpenAI(api_key=api_key)
-    
-    # Function to extract events
-    def get_events(self, instruction: str, text: str, response_format, mini_model: bool = True):
-        if mini_model:
-            model = "gpt-4o-mini-2024-07-18"
-        else:
-            model = "gpt-4o-2024-08-06"
+    # cache defaults to the process-wide ResponseCache (see home/llm/cache.py), backend to
+    # the one selected by LLM_BACKEND (see home/llm/backend.py), router to the
+    # process-wide ModelRouter (see home/llm/router.py), limiter to the process-wide
+    # RateLimiter, if OpenAI limits are configured (see home/llm/rate_limit.py)
+    # Every call goes through ResilientBackend: retries within a per-extraction budget,
+    # a circuit breaker per backend, optional hedging (see home/llm/resilience.py).
+    # checkpoint keeps every completed response of the extraction, so that
+    # a retried job resumes from the calls that already succeeded.
+    # timezone anchors relative dates in every prompt
+    # bulk calls are paced below the full rate limits, leaving room for interactive ones
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        cache: ResponseCache = None,
+        backend=None,
+        router: ModelRouter = None,
+        timezone: str = None,
+        limiter: RateLimiter = None,
+        bulk: bool = False,
+        checkpoint: Checkpoint = None
+    ):
+        self.timezone = timezone
+        self.bulk = bulk
+        self.checkpoint = checkpoint
+        self.__backend = ResilientBackend(backend if backend is not None else get_default_backend())
+        self.__router = router if router is not None else get_default_router()
+        self.__limiter = limiter if limiter is not None else get_default_limiter()
+
+        # The semaphore belongs to one event loop, so it is created lazily for whichever
+        # loop is running the extraction
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+        self.max_concurrency = max_concurrency
+        self.__async_loop = None
+        self.__semaphore = None
+
+        self.__cache = cache if cache is not None else get_default_cache()
+
+        # Per-stage numbers of the current extraction, set by EventExtraction
+        self.metrics = None
+
+        # Usage counters, so callers can compare extraction modes
+        self.call_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cache_hits = 0
+
+    def now(self) -> datetime:
+        return current_time(self.timezone)
+
+    # Retries and hedges are budgeted per extraction
+    def reset_retry_budget(self) -> None:
+        self.__backend.budget = RetryBudget()
+
+    def reset_usage(self) -> None:
+        self.call_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cache_hits = 0
+
+    def get_usage(self) -> dict:
+        return {
+            "calls": self.call_count,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hits": self.cache_hits,
+        }
+
+    # Providers cache the longest prompt prefix they have seen recently, so a request is
+    # laid out from the most to the least shared part: the static instruction of the
+    # stage, the date anchor, the text, and last the per-call context (the event being
+    # completed, the user's filter). All events of a chunk then share the chunk's prefix.
+    def __build_request(self, instruction: str, context: str, text: str, response_format, model: str, now: datetime) -> dict:
+        content = instruction
+        if now is not None:
+            content += "\n" + date_anchor(now)
 
         messages = [
             {
                 "role": "system",
-                "content": instruction
+                "content": content
             },
             {   
                 "role": "user",
                 "content": text
             }
         ]
-
-        completion = self.__client.beta.chat.completions.parse(
-            model = model,
-            messages = messages,
-            temperature = 0,
-            response_format = response_format
-        )
-
-        return completion.choices[0].message.parsed
-    
+        if context:
+            messages.append({"role": "system", "content": context})
+
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": 0,
+            "response_format": response_format
+        }
+
+    def __record_usage(self, response: LLMResponse, stage: str, seconds: float) -> None:
+        self.call_count += 1
+        self.prompt_tokens += response.prompt_tokens
+        self.completion_tokens += response.completion_tokens
+        self.cached_tokens += response.cached_tokens
+        self.__router.observe_latency(response.model, seconds)
+        if self.metrics is not None:
+            self.metrics.record_call(stage, response, seconds, response.retries)
+
+    def __record_error(self, error: Exception, stage: str, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.record_error(stage, seconds, getattr(error, "retries", 0))
+
+    def __record_wait(self, seconds: float) -> None:
+        if seconds > 0 and self.metrics is not None:
+            self.metrics.add_time("rate_limit", seconds)
+
+    # response is None when the call failed
+    def __settle(self, tokens: int, response: LLMResponse | None) -> None:
+        if self.__limiter is None:
+            return
+        used = response.prompt_tokens + response.completion_tokens if response is not None else 0
+        self.__limiter.settle(tokens, used, self.bulk)
+
+    # Identifies a request for both the response cache and recorded cassettes
+    def __request_key(self, request: dict, instruction: str, context: str, text: str, response_format, now: datetime) -> str:
+        anchor = now.date().isoformat() if now is not None else ""
+        if context:
+            instruction += "\n\n" + context
+        return ResponseCache.make_key(request["model"], instruction, text, response_format, anchor)
+
+    def __cache_lookup(self, key: str, response_format, stage: str):
+        parsed = self.__checkpoint_lookup(key, response_format, stage)
+        if parsed is not None or self.__cache is None:
+            return parsed
+        return self.__cache_hit(self.__cache.get(key), response_format, stage)
+
+    async def __cache_lookup_async(self, key: str, response_format, stage: str):
+        parsed = self.__checkpoint_lookup(key, response_format, stage)
+        if parsed is not None or self.__cache is None:
+            return parsed
+        return self.__cache_hit(await self.__cache.get_async(key), response_format, stage)
+
+    def __checkpoint_lookup(self, key: str, response_format, stage: str):
+        if self.checkpoint is None:
+            return None
+        checkpointed = self.checkpoint.get(key)
+        if checkpointed is None:
+            return None
+        if self.metrics is not None:
+            self.metrics.record_resumed(stage)
+        return response_format.model_validate_json(checkpointed.content)
+
+    def __cache_hit(self, cached: str | None, response_format, stage: str):
+        if cached is None:
+            return None
+        self.cache_hits += 1
+        if self.metrics is not None:
+            self.metrics.record_cache_hit(stage)
+        return response_format.model_validate_json(cached)
+
+    def __cache_store(self, key: str, response: LLMResponse) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.put(key, response)
+        if self.__cache is not None:
+            self.__cache.set(key, response.content)
+
+    async def __cache_store_async(self, key: str, response: LLMResponse) -> None:
+        if self.checkpoint is not None:
+            await self.checkpoint.put_async(key, response)
+        if self.__cache is not None:
+            await self.__cache.set_async(key, response.content)
+
+    def __get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self.__async_loop is not loop:
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.__async_loop = loop
+        return self.__semaphore
     
+    # The first step of a cascade failed validation (or its output did not parse) if this
+    # returns True
+    def __escalate(self, stage: str, text: str, parsed) -> bool:
+        reason = "unparseable_output" if parsed is None else self.__router.validate_result(stage, text, parsed)
+        self.__router.observe_cascade(stage, text, reason is not None)
+        if reason is not None and self.metrics is not None:
+            self.metrics.record_escalation(stage, reason)
+        return reason is not None
+
+    def __route(self, stage: str, text: str, mini_model: bool) -> list[str]:
+        route, models = self.__router.route(stage, text, mini_model)
+        if self.metrics is not None:
+            self.metrics.record_route(stage, route)
+        return models
+
+    # One call to one model, answered from the cache when possible
+    def __complete(self, instruction: str, context: str, text: str, response_format, model: str, now: datetime, stage: str):
+        request = self.__build_request(instruction, context, text, response_format, model, now)
+        key = self.__request_key(request, instruction, context, text, response_format, now)
+
+        parsed = self.__cache_lookup(key, response_format, stage)
+        if parsed is not None:
+            return parsed
+
+        tokens = estimate_tokens(request)
+        if self.__limiter is not None:
+            self.__record_wait(self.__limiter.acquire(tokens, self.bulk))
+
+        start = time.perf_counter()
+        try:
+            response = self.__backend.complete(request, key)
+        except Exception as e:
+            self.__settle(tokens, None)
+            self.__record_error(e, stage, time.perf_counter() - start)
+            raise
+        self.__settle(tokens, response)
+        self.__record_usage(response, stage, time.perf_counter() - start)
+
+        parsed = response_format.model_validate_json(response.content)
+        self.__cache_store(key, response)
+        return parsed
+
+    async def __complete_async(self, instruction: str, context: str, text: str, response_format, model: str, now: datetime, stage: str):
+        request = self.__build_request(instruction, context, text, response_format, model, now)
+        key = self.__request_key(request, instruction, context, text, response_format, now)
+
+        parsed = await self.__cache_lookup_async(key, response_format, stage)
+        if parsed is not None:
+            return parsed
+
+        # Waiting for the rate limit doesn't hold a semaphore slot, and neither wait is
+        # part of the call
+        tokens = estimate_tokens(request)
+        if self.__limiter is not None:
+            self.__record_wait(await self.__limiter.acquire_async(tokens, self.bulk))
+
+        async with self.__get_semaphore():
+            start = time.perf_counter()
+            try:
+                response = await self.__backend.complete_async(request, key)
+            except Exception as e:
+                self.__settle(tokens, None)
+                self.__record_error(e, stage, time.perf_counter() - start)
+                raise
+        self.__settle(tokens, response)
+        self.__record_usage(response, stage, time.perf_counter() - start)
+
+        parsed = response_format.model_validate_json(response.content)
+        await self.__cache_store_async(key, response)
+        return parsed
+
+    # Function to extract events. stage names the pipeline step, which is also the task
+    # the router picks a model for; mini_model=True or False skips the router.
+    # instruction should be the same for every call of a stage; what changes from call to
+    # call goes in context, which is sent after the text.
+    def get_events(self, instruction: str, text: str, response_format, mini_model: bool = None, now: datetime = None, stage: str = "llm", context: str = ""):
+        models = self.__route(stage, text, mini_model)
+        for model in models[:-1]:
+            try:
+                parsed = self.__complete(instruction, context, text, response_format, model, now, stage)
+            except ValidationError:
+                parsed = None
+            if not self.__escalate(stage, text, parsed):
+                return parsed
+        return self.__complete(instruction, context, text, response_format, models[-1], now, stage)
+
+    # Same as get_events, but at most max_concurrency calls are in flight at once
+    async def get_events_async(self, instruction: str, text: str, response_format, mini_model: bool = None, now: datetime = None, stage: str = "llm", context: str = ""):
+        models = self.__route(stage, text, mini_model)
+        for model in models[:-1]:
+            try:
+                parsed = await self.__complete_async(instruction, context, text, response_format, model, now, stage)
+            except ValidationError:
+                parsed = None
+            if not self.__escalate(stage, text, parsed):
+                return parsed
+        return await self.__complete_async(instruction, context, text, response_format, models[-1], now, stage)
+
 
 class ExtractInfo:
     @staticmethod
-    def get_time(text: str, api_caller: APICaller) -> list[EventTime]:
-        now = datetime.now(tz=tz.gettz("America/New_York")).isoformat()
-        weekday = datetime.now(tz=tz.gettz("America/New_York")).strftime("%A")
+    async def get_time(text: str, api_caller: APICaller) -> list[EventTime]:
+        now = api_caller.now()
 
         instruction = (
-            f"You extract calendar events from natural language. Today is {now}, {weekday}. "
-
+            "You extract calendar events from natural language. "
             "Return structured JSON as: {\"events\": [ ... ]}. "
             "Return all times in yyyy-mm-ddThh:mm:ss format."
             "If nothing can be parsed, return an empty list inside: {\"events\": []}."
         )
         print("Instruction: ", instruction)
-        print(now)
-        print(weekday)
 
-        result = api_caller.get_events(instruction, text, EventTimeWrapper, False)
+        result = await api_caller.get_events_async(instruction, text, EventTimeWrapper, now=now, stage="get_time")
+
+        return result.events
+
+    # Single call that returns the full Event schema for every event in the text
+    @staticmethod
+    async def get_full_event(text: str, api_caller: APICaller) -> list[Event]:
+        now = api_caller.now()
+
+        instruction = (
+            "You extract calendar events from natural language. "
+            "For every event, fill in title, start, end, location and description. "
+            "Return structured JSON as: {\"events\": [ ... ]}. "
+            "Return all times in yyyy-mm-ddThh:mm:ss format."
+            "If location or description information cannot be found, return an empty string for that field. "
+            "If title information cannot be found, create a title based on start time, end time, location and description. "
+            "If nothing can be parsed, return an empty list inside: {\"events\": []}."
+        )
+
+        result = await api_caller.get_events_async(instruction, text, EventWrapper, now=now, stage="get_full_event")
 
         return result.events
 
     @staticmethod
-    def get_location(text: str, event_str: str, api_caller: APICaller) -> EventLocation:
-        now = datetime.now(tz=tz.gettz("America/New_York")).isoformat()
-        weekday = datetime.now(tz=tz.gettz("America/New_York")).strftime("%A")
+    async def get_location(text: str, event_str: str, api_caller: APICaller) -> EventLocation:
+        now = api_caller.now()
 
         instruction = (
-            f"Add location information to the following event:\n{event_str} \nToday is {now}, {weekday}. "
+            "Add location information to the event given after the text. "
             "Return structured JSON as: {\"start\": ... , \"end\": ... , \"location\": ... }. "
             "Return all times in yyyy-mm-ddThh:mm:ss format."
             "If location information cannot be found, return an empty string for the \"location\" field."
         )
 
-        result = api_caller.get_events(instruction, text, EventLocation)
+        result = await api_caller.get_events_async(instruction, text, EventLocation, now=now, stage="get_location", context=f"Event: {event_str}")
 
         return result
 
     @staticmethod
-    def get_description(text: str, event_str: str, api_caller: APICaller) -> EventDescription:
-        now = datetime.now(tz=tz.gettz("America/New_York")).isoformat()
-        weekday = datetime.now(tz=tz.gettz("America/New_York")).strftime("%A")
+    async def get_description(text: str, event_str: str, api_caller: APICaller) -> EventDescription:
+        now = api_caller.now()
 
         instruction = (
-            f"Add description information to the following event:\n{event_str} \nToday is {now}, {weekday}. "
+            "Add description information to the event given after the text. "
             "Return structured JSON as: {\"start\": ... , \"end\": ... , \"location\": ... , \"description\": ... }. "
             "Return all times in yyyy-mm-ddThh:mm:ss format."
             "If description information cannot be found, return an empty string for the \"description\" field."
         )
 
-        result = api_caller.get_events(instruction, text, EventDescription)
+        result = await api_caller.get_events_async(instruction, text, EventDescription, now=now, stage="get_description", context=f"Event: {event_str}")
 
         return result
 
     @staticmethod
-    def get_title(text: str, event_str: str, api_caller: APICaller) -> Event:
-        now = datetime.now(tz=tz.gettz("America/New_York")).isoformat()
-        weekday = datetime.now(tz=tz.gettz("America/New_York")).strftime("%A")
+    async def get_title(text: str, event_str: str, api_caller: APICaller) -> Event:
+        now = api_caller.now()
 
         instruction = (
-            f"Add title information to the following event:\n{event_str} \nToday is {now}, {weekday}. "
+            "Add title information to the event given after the text. "
             "Return structured JSON as: {\"title\": ... , \"start\": ... , \"end\": ... , \"location\": ... , \"description\": ... }. "
             "Return all times in yyyy-mm-ddThh:mm:ss format."
             "If title information cannot be found, create a title based on start time, end time, location and description."
         )
 
-        result = api_caller.get_events(instruction, text, Event)
+        result = await api_caller.get_events_async(instruction, text, Event, now=now, stage="get_title", context=f"Event: {event_str}")
 
         return result
     
     @staticmethod
-    def filter_event(user_instruction: str, event_str: str, api_caller: APICaller) -> list[Event]:
+    async def filter_event(user_instruction: str, event_str: str, api_caller: APICaller) -> list[Event]:
         instruction = (
-            f"Filter events according to the following instruction: {user_instruction} "
+            "Filter the events (one JSON object per line) according to the instruction given after them. "
             "Return structured JSON as: {\"events\": [ ... ]}. "
         )
 
-        result = api_caller.get_events(instruction, event_str, EventWrapper, False)
+        result = await api_caller.get_events_async(instruction, event_str, EventWrapper, stage="filter_event", context=f"Instruction: {user_instruction}")
 
         return result.events
     
     @staticmethod
-    def remove_duplicate_event(event_str: str, api_caller: APICaller) -> list[Event]:
+    async def remove_duplicate_event(event_str: str, api_caller: APICaller) -> list[Event]:
         instruction = (
-            f"Remove duplicated events."
+            "Remove duplicated events (one JSON object per line). "
             "Return structured JSON as: {\"events\": [ ... ]}. "
         )
 
-        result = api_caller.get_events(instruction, event_str, EventWrapper, False)
+        result = await api_caller.get_events_async(instruction, event_str, EventWrapper, stage="remove_duplicate_event")
 
         return result.events
     
@@ -183,93 +482,362 @@ class ExtractInfo:
 
 # Class to extract an event given a text field or a PDF
 class EventExtraction:
-    def __init__(self):
-        self.__api_caller = APICaller()
-        self.chunk_length = 500
+    # high_precision runs the staged time -> location -> description -> title chain,
+    # otherwise every chunk is extracted with a single structured-output call.
+    # max_concurrency bounds the number of API calls in flight at once.
+    # Duplicates are removed locally; llm_dedup sends only the ambiguous clusters
+    # the local pass could not settle to remove_duplicate_event.
+    # prefilter drops chunks without any date or time expression before any API call.
+    # page_store (the process-wide PageStore by default) lets extract_pdf reuse the pages
+    # and per-page events of PDFs it has seen before.
+    # backend replaces the LLM backend from LLM_BACKEND (e.g. a ReplayBackend).
+    # on_progress(progress, events), if given, is called from a worker thread whenever a
+    # chunk (or a PDF page) is done, with the raw events found in it.
+    # Per-stage time, calls, tokens and cost of the last extract call are in get_metrics()
+    # and in the process-wide registry (see home/llm/metrics.py).
+    # timezone (an IANA name, LLM_TIMEZONE by default) is the user's, for relative dates.
+    # fast_path answers simple one-line text queries locally (see home/llm/fast_path.py).
+    # bulk marks a PDF extraction, whose calls the rate limiter paces below the full
+    # OpenAI limits so short queries keep their share (see home/llm/rate_limit.py).
+    # checkpoint (a Checkpoint) keeps the responses of completed calls; an extraction
+    # given the checkpoint of an earlier, failed one only makes the calls that are left.
+    # An instruction is applied locally when it is a plain date window or keywords, and
+    # otherwise only a shortlist of candidates reaches filter_event (home/llm/event_filter.py).
+    def __init__(
+        self,
+        high_precision: bool = False,
+        max_concurrency: int = None,
+        llm_dedup: bool = False,
+        prefilter: bool = True,
+        page_store: PageStore = None,
+        on_progress: Callable[[dict, list[dict]], None] = None,
+        backend=None,
+        timezone: str = None,
+        fast_path: bool = True,
+        bulk: bool = False,
+        checkpoint: Checkpoint = None
+    ):
+        self.__api_caller = APICaller(max_concurrency, backend=backend, timezone=timezone, bulk=bulk, checkpoint=checkpoint)
+        self.fast_path = FastPathParser() if fast_path else None
+        self.chunker = TextChunker()
+        self.page_chunker = TextChunker(page_break=True)
+        self.page_store = page_store if page_store is not None else get_default_store()
+        self.high_precision = high_precision
+        self.llm_dedup = llm_dedup
+        # Model output with an offset is compared with naive local times in the user's timezone
+        self.deduplicator = EventDeduplicator(timezone=timezone or DEFAULT_TIMEZONE)
+        self.prefilter = TemporalPrefilter() if prefilter else None
+        self.event_filter = EventFilter()
+        self.on_progress = on_progress
+        self.stats = {}
+        self.metrics = PipelineMetrics()
+
+    def get_usage(self) -> dict:
+        return self.__api_caller.get_usage()
+
+    def reset_usage(self) -> None:
+        self.__api_caller.reset_usage()
+
+    # Per-document numbers from the last extract call
+    def get_stats(self) -> dict:
+        return dict(self.stats)
+
+    def get_metrics(self) -> dict:
+        return self.metrics.summary()
 
     # for testing purposes
     def extract_from_pdf(self, instruction: str, file_name: str) -> list[Event]:
-        reader = PdfReader(file_name)
-        main_text = ""
+        return self.extract_pdf(instruction, file_name)
 
-        for page in reader.pages:
-            page_text = page.extract_text()
-            main_text += page_text + " "
+    # Blocking entry point for synchronous callers (views, background threads).
+    # text is either a string or an iterable of page texts, e.g. from iter_pdf_pages.
+    def extract(self, instruction: str, text: str | Iterable[str]) -> list[Event]:
+        return asyncio.run(self.extract_async(instruction, text))
 
-        return self.extract(instruction, main_text)
+    # Page texts are appended to pages, if given, as they are read
+    def extract_pdf(self, instruction: str, path: str, pages: list = None) -> list[Event]:
+        return asyncio.run(self.extract_pdf_async(instruction, path, pages))
 
-    # TODO: If start time == end time, increment end time by 1s
-    def extract(self, instruction: str, text: str) -> list[Event]:
-        chunk_list = self.split_text_into_chunks(text, self.chunk_length)
-
-        event_time_list = []
-        for chunk in chunk_list:
-            event_time_list.append(ExtractInfo.get_time(chunk, self.__api_caller))
-
-        print(event_time_list)
-
-        for i in range(len(event_time_list)):
-            for j in range(len(event_time_list[i])):
-                text = chunk_list[i]
-                event_str = event_time_list[i][j].model_dump_json(indent=2)
-                new_event = ExtractInfo.get_location(text, event_str, self.__api_caller)
-                event_time_list[i][j] = new_event
-
-        for i in range(len(event_time_list)):
-            for j in range(len(event_time_list[i])):
-                text = chunk_list[i]
-                event_str = event_time_list[i][j].model_dump_json(indent=2)
-                new_event = ExtractInfo.get_description(text, event_str, self.__api_caller)
-                event_time_list[i][j] = new_event
-
-        for i in range(len(event_time_list)):
-            for j in range(len(event_time_list[i])):
-                text = chunk_list[i]
-                event_str = event_time_list[i][j].model_dump_json(indent=2)
-                new_event = ExtractInfo.get_title(text, event_str, self.__api_caller)
-                event_time_list[i][j] = new_event
+    async def extract_async(self, instruction: str, text: str | Iterable[str]) -> list[Event]:
+        self.reset_stats()
 
-        event_list = [event for row in event_time_list for event in row]
-        #print(event_list)
+        if isinstance(text, str) and not instruction:
+            event = self.parse_locally(text)
+            if event is not None:
+                return [event]
 
-        if instruction != None and len(instruction) != 0:
-            event_str = ""
-            for event in event_list:
-                event_str += event.model_dump_json(indent=2)
-            #print(event_str)
+        # asyncio.gather keeps results in chunk order, whatever order the calls finish in
+        tasks = [task async for task in self.chunk_tasks(text)]
+        event_time_list = await asyncio.gather(*tasks)
 
-            event_list = ExtractInfo.filter_event(instruction, event_str, self.__api_caller)
+        event_list = [event for row in event_time_list for event in row]
+        return await self.finish(instruction, event_list)
+
+    # Like extract_async, but chunks never cross pages, so the events of each page can be
+    # stored by page hash. A re-uploaded PDF is not parsed again, and an edited one only
+    # sends its changed pages to the model.
+    async def extract_pdf_async(self, instruction: str, path: str, pages: list = None) -> list[Event]:
+        self.reset_stats()
+
+        tasks = [task async for task in self.pdf_tasks(path, pages)]
+        page_events = await asyncio.gather(*tasks)
+
+        event_list = [event for row in page_events for event in row]
+        return await self.finish(instruction, event_list)
+
+    # Streaming versions of extract_async and extract_pdf_async: they yield the events of
+    # every chunk (or page) as soon as it is done, in the order the chunks finish. Each
+    # batch is deduplicated against the events already yielded and then filtered by
+    # instruction, so a batch may be empty. An event can't be taken back once it is
+    # yielded, so llm_dedup does not apply and pairs that are only possibly duplicates
+    # are both kept; a filter that needs the LLM is called once per batch.
+    async def stream_async(self, instruction: str, text: str | Iterable[str]) -> AsyncIterator[list[dict]]:
+        self.reset_stats()
+
+        if isinstance(text, str) and not instruction:
+            event = self.parse_locally(text)
+            if event is not None:
+                yield [event]
+                return
+
+        async for events in self.finish_each(instruction, self.chunk_tasks(text)):
+            yield events
+
+    async def stream_pdf_async(self, instruction: str, path: str, pages: list = None) -> AsyncIterator[list[dict]]:
+        self.reset_stats()
+
+        async for events in self.finish_each(instruction, self.pdf_tasks(path, pages)):
+            yield events
+
+    # Calls for a chunk start as soon as it is produced, while later pages are still parsed
+    async def chunk_tasks(self, text: str | Iterable[str]) -> AsyncIterator[asyncio.Future]:
+        chunks = timed(self.chunker.iter_chunks(text), self.metrics, "chunking")
+        async for chunk in iterate(chunks, in_thread=not isinstance(text, str)):
+            if self.keep_chunk(chunk):
+                yield asyncio.ensure_future(self.report(self.extract_chunk(chunk)))
+
+    async def pdf_tasks(self, path: str, pages: list = None) -> AsyncIterator[asyncio.Future]:
+        if self.page_store is None:
+            source = iter_pdf_pages(path)
+            if pages is not None:
+                source = collect(source, pages)
+            async for task in self.chunk_tasks(source):
+                yield task
+            return
+
+        self.stats.update({"pages": 0, "pages_reused": 0})
+
+        # Hashing the file and the store's sqlite reads and writes happen off the event loop
+        file_hash = await asyncio.to_thread(file_digest, path)
+        stored_pages = await self.page_store.get_pages_async(file_hash)
+        source = stored_pages if stored_pages is not None else timed(iter_pdf_pages(path), self.metrics, "pdf_pages")
+
+        page_texts = [] if pages is None else pages
+        async for page_text in iterate(source, in_thread=stored_pages is None):
+            page_texts.append(page_text)
+            yield asyncio.ensure_future(self.report(self.extract_page(page_text)))
+
+        if stored_pages is None:
+            await self.page_store.put_pages_async(file_hash, page_texts)
+
+    # The fast path's event for a simple query, or None if the query needs the LLM
+    def parse_locally(self, text: str) -> dict | None:
+        if self.fast_path is None:
+            return None
+
+        with self.metrics.timer("fast_path"):
+            fields = self.fast_path.parse(text, self.__api_caller.now())
+        self.metrics.record_fast_path(fields is not None)
+        self.stats["fast_path"] = fields is not None
+        if fields is None:
+            return None
+        return vars(Event(**fields))
+
+    async def extract_page(self, page_text: str) -> list[Event]:
+        self.stats["pages"] += 1
+
+        # Relative dates resolve differently on another day or in another timezone, so the
+        # anchor and the timezone are part of the key
+        page_hash = page_digest(page_text)
+        anchor = self.__api_caller.now().date().isoformat()
+        zone = self.__api_caller.timezone or DEFAULT_TIMEZONE
+        variant = f"{'staged' if self.high_precision else 'fused'}:{anchor}:{zone}"
+
+        stored = await self.page_store.get_events_async(page_hash, variant)
+        if stored is not None:
+            self.stats["pages_reused"] += 1
+            return [Event(**event) for event in stored]
+
+        with self.metrics.timer("chunking"):
+            chunks = [chunk for chunk in self.page_chunker.iter_chunks([page_text]) if self.keep_chunk(chunk)]
+        rows = await asyncio.gather(*(self.extract_chunk(chunk) for chunk in chunks))
+        events = [event for row in rows for event in row]
+
+        await self.page_store.put_events_async(page_hash, variant, [event.model_dump() for event in events])
+        return events
+
+    # Deduplication, the optional instruction filter, and conversion to dicts
+    # TODO: If start time == end time, increment end time by 1s
+    async def finish(self, instruction: str, event_list: list[Event]) -> list[dict]:
+        #print(event_list)
 
-        event_str = ""
-        for event in event_list:
-            event_str += event.model_dump_json(indent=2)
-        #print(event_str)
+        # Deduplicate before filtering, so the filter prompt only sees unique events
+        event_list = await self.remove_duplicates(event_list)
 
-        event_list = ExtractInfo.remove_duplicate_event(event_str, self.__api_caller)
+        if instruction != None and len(instruction) != 0:
+            event_list = await self.filter_events(instruction, event_list)
 
         for i in range(len(event_list)):
             event_list[i] = vars(event_list[i])
         
         return event_list
 
+    # finish() for streaming: deduplication against the events yielded so far, the filter,
+    # and conversion to dicts, per finished chunk
+    async def finish_each(self, instruction: str, tasks: AsyncIterator[asyncio.Future]) -> AsyncIterator[list[dict]]:
+        emitted = []
+        async for event_list in as_finished(tasks):
+            with self.metrics.timer("dedup"):
+                event_list = self.deduplicator.deduplicate_new(event_list, emitted)
+            emitted.extend(event_list)
+
+            if instruction != None and len(instruction) != 0 and len(event_list) != 0:
+                event_list = await self.filter_events(instruction, event_list)
+
+            yield [vars(event) for event in event_list]
+
+    # Clear keyword or date-window instructions are applied locally; otherwise only the
+    # shortlisted candidates are sent to filter_event (see home/llm/event_filter.py)
+    async def filter_events(self, instruction: str, event_list: list[Event]) -> list[Event]:
+        with self.metrics.timer("filter_rank"):
+            decision = self.event_filter.shortlist(instruction, event_list, self.__api_caller.now())
+        self.metrics.record_filter(decision.kind, len(event_list), len(decision.events))
+        self.stats["filter"] = decision.kind
+        self.stats["filter_candidates"] = len(decision.events)
+        if not decision.needs_llm or len(decision.events) == 0:
+            return decision.events
+
+        return await ExtractInfo.filter_event(instruction, serialize_events(decision.events), self.__api_caller)
+
+    def reset_stats(self) -> None:
+        self.stats = {"chunks": 0, "chunks_skipped": 0, "calls_saved": 0, "queued": 0, "done": 0}
+        self.metrics = PipelineMetrics(get_registry())
+        self.__api_caller.metrics = self.metrics
+        self.__api_caller.reset_retry_budget()
+
+    # Whether a chunk can hold an event at all
+    def keep_chunk(self, chunk: str) -> bool:
+        self.stats["chunks"] += 1
+        if self.prefilter is None:
+            return True
+
+        kept = self.prefilter.has_temporal_expression(chunk)
+        self.metrics.record_prefilter(kept)
+        if kept:
+            return True
+
+        # A chunk without dates yields no events, so both modes save exactly its first call
+        self.stats["chunks_skipped"] += 1
+        self.stats["calls_saved"] += 1
+        return False
+
+    # Awaits one chunk's (or page's) extraction and passes its events on to on_progress
+    async def report(self, work: Awaitable[list[Event]]) -> list[Event]:
+        self.stats["queued"] += 1
+        events = await work
+        self.stats["done"] += 1
+
+        if self.on_progress is not None:
+            progress = {"done": self.stats["done"], "queued": self.stats["queued"]}
+            await asyncio.to_thread(self.on_progress, progress, [event.model_dump() for event in events])
+        return events
+
+    async def extract_chunk(self, chunk: str) -> list[Event]:
+        if not self.high_precision:
+            return await ExtractInfo.get_full_event(chunk, self.__api_caller)
+
+        # Each event's enrichment steps depend on each other, but different events don't
+        event_times = await ExtractInfo.get_time(chunk, self.__api_caller)
+        return list(await asyncio.gather(*(self.enrich_event(chunk, event_time) for event_time in event_times)))
+
+    async def remove_duplicates(self, event_list: list[Event]) -> list[Event]:
+        with self.metrics.timer("dedup"):
+            event_list, ambiguous = self.deduplicator.deduplicate(event_list)
+        if not self.llm_dedup or len(ambiguous) == 0:
+            return event_list
+
+        async def resolve(cluster: list[Event]) -> list[Event]:
+            return await ExtractInfo.remove_duplicate_event(serialize_events(cluster), self.__api_caller)
+
+        resolved = await asyncio.gather(*(resolve(cluster) for cluster in ambiguous))
+
+        # Replace every ambiguous cluster with the LLM's answer for it
+        clustered = set(id(event) for cluster in ambiguous for event in cluster)
+        result = [event for event in event_list if id(event) not in clustered]
+        for events in resolved:
+            result.extend(events)
+        return result
 
-    def split_text_into_chunks(self, text: str, length: int) -> list[str]:
-        small_chunks = list(text[i: length + i] for i in range(0, len(text), length))
+    async def enrich_event(self, text: str, event_time: EventTime) -> Event:
+        event = await ExtractInfo.get_location(text, event_time.model_dump_json(), self.__api_caller)
+        event = await ExtractInfo.get_description(text, event.model_dump_json(), self.__api_caller)
+        event = await ExtractInfo.get_title(text, event.model_dump_json(), self.__api_caller)
 
-        if len(small_chunks) == 0:
-            big_chunks = list()
-        elif len(small_chunks) == 1:
-            big_chunks = small_chunks
-        else:
-            big_chunks = list(small_chunks[i] + small_chunks[i+1] for i in range(len(small_chunks) - 1))
-        
-        return big_chunks
-    
+        return event
 
     def print_events(self, events: list[Event]) -> None:
         for event in events:
             print(event.model_dump_json(indent=2))
 
+# Iterates a (possibly blocking) iterable from async code. Blocking sources such as PDF
+# page generators are advanced in a worker thread so they don't stall the event loop.
+async def iterate(items: Iterable, in_thread: bool = True) -> AsyncIterator:
+    iterator = iter(items)
+    done = object()
+    while True:
+        if in_thread:
+            item = await asyncio.to_thread(next, iterator, done)
+        else:
+            item = next(iterator, done)
+        if item is done:
+            break
+        yield item
+
+
+# Yields the results of the tasks from source in the order they finish, while source may
+# still be producing more. Tasks still running when the consumer stops are cancelled.
+async def as_finished(source: AsyncIterator[asyncio.Future]) -> AsyncIterator:
+    finished = asyncio.Queue()
+    tasks = []
+
+    async def start_all() -> int:
+        async for task in source:
+            task.add_done_callback(finished.put_nowait)
+            tasks.append(task)
+        return len(tasks)
+
+    starter = asyncio.ensure_future(start_all())
+    starter.add_done_callback(finished.put_nowait)
+    total, count = None, 0
+    try:
+        while total is None or count < total:
+            task = await finished.get()
+            if task is starter:
+                total = starter.result()
+                continue
+            count += 1
+            yield task.result()
+    finally:
+        for task in [starter, *tasks]:
+            task.cancel()
+
+
+def collect(items: Iterable, collected: list) -> Iterable:
+    for item in items:
+        collected.append(item)
+        yield item
+
+
 if __name__ == "__main__":
     event_extraction = EventExtraction()
 
@@ -0,0 +1,266 @@
+import re
+from datetime import datetime, date, timedelta
+from home.llm.prefilter import TemporalPrefilter, _months, _weekdays
+
+
+# Deterministic parser for one-line queries such as
+#   "meeting Thursday 2pm for 1 hour at Starbucks"
+#   "Dentist tomorrow 9:30-10:15am in Room 204"
+# It recognizes one date (weekday, today/tomorrow, month and day, ISO or m/d), one time or
+# time range, an optional duration ("for 90 minutes", default one hour) and an optional
+# place ("at Starbucks", "in Room 204"); the rest of the text becomes the title.
+# It only answers when nothing is left to guess: a second date or time, a recurrence, a
+# question, a relative phrase like "next Thursday" or any other date-like text left over
+# all return None, and EventExtraction falls back to the LLM pipeline.
+
+MAX_QUERY_LENGTH = 200
+MAX_TITLE_WORDS = 10
+DEFAULT_DURATION = timedelta(hours=1)
+
+_time = r"(?:\d{1,2}(?::\d{2})?\s*[ap]\.?m\.?|\d{1,2}:\d{2}|noon|midnight)"
+_loose_time = r"(?:\d{1,2}(?::\d{2})?(?:\s*[ap]\.?m\.?)?|noon|midnight)"
+_place_stop = r"(?:about|for|on|from|to|with|regarding|and|this|tomorrow|today|tonight)"
+
+TIME_RANGE = re.compile(
+    rf"\b(?:from\s+)?(?P<first>{_loose_time})\s*(?:-|–|to|until|till)\s*(?P<second>{_loose_time})(?!\w)",
+    re.IGNORECASE
+)
+SINGLE_TIME = re.compile(rf"(?:\bat\s+|@\s*)?\b(?P<time>{_time})(?!\w)", re.IGNORECASE)
+
+DATE_PATTERNS = [
+    re.compile(rf"\b(?:on\s+)?(?:(?:this|coming)\s+)?(?P<weekday>{_weekdays})(?!\w)", re.IGNORECASE),
+    re.compile(r"\b(?P<relative>today|tonight|tomorrow)\b", re.IGNORECASE),
+    re.compile(
+        rf"\b(?:on\s+)?(?P<month>{_months})\s+(?P<day>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(?P<year>\d{{4}}))?(?!\w)",
+        re.IGNORECASE
+    ),
+    re.compile(
+        rf"\b(?:on\s+)?(?:the\s+)?(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month>{_months})(?:,?\s+(?P<year>\d{{4}}))?(?!\w)",
+        re.IGNORECASE
+    ),
+    re.compile(r"\b(?:on\s+)?(?P<iso>\d{4}-\d{2}-\d{2})\b"),
+    re.compile(r"\b(?:on\s+)?(?P<numeric_month>\d{1,2})/(?P<day>\d{1,2})(?:/(?P<year>\d{2}|\d{4}))?\b"),
+]
+
+DURATION = re.compile(
+    r"\bfor\s+(?:(?P<number>\d+(?:\.\d+)?)|(?P<word>an?|one|two|three|half\s+an?))\s*"
+    r"(?P<unit>hours?|hrs?|h|minutes?|mins?)\b",
+    re.IGNORECASE
+)
+PLACE = re.compile(
+    rf"(?:(?:\b(?i:at)\s+|@\s*)(?P<place>(?:(?!(?i:{_place_stop})\b)[^\s,.;!]+\s*)+)"
+    rf"|\b(?i:in)\s+(?P<room>(?:(?i:room|rm\.?|building|bldg\.?|hall)\b|[A-Z])[^\s,.;!]*(?:\s+(?!(?i:{_place_stop})\b)[^\s,.;!]+)*))"
+)
+
+# Phrasings the parser would have to guess at
+AMBIGUOUS = re.compile(
+    r"\?|\b(?:every|each|daily|weekly|biweekly|monthly|next|last|after|before|between|or)\b",
+    re.IGNORECASE
+)
+LEADING_FILLER = re.compile(
+    r"^(?:(?:i\s+have|i've\s+got|i\s+got|we\s+have|there\s+is|there's|schedule|add|set\s+up|book|put)\s+)?"
+    r"(?:(?:an?|the|my|our)\s+)?",
+    re.IGNORECASE
+)
+DANGLING_WORDS = re.compile(r"\b(?:on|at|this|from|for|in)\s*$|^\s*(?:on|at|this|from|for|in)\b", re.IGNORECASE)
+
+WEEKDAY_NUMBERS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+MONTH_NUMBERS = {name: i for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1
+)}
+COUNT_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "half a": 0.5, "half an": 0.5}
+
+
+class FastPathParser:
+    def __init__(self):
+        self.prefilter = TemporalPrefilter()
+
+    # Returns the fields of an Event, or None when the query needs the LLM. now is the
+    # current time in the user's timezone; times are returned as local wall-clock times.
+    def parse(self, text: str, now: datetime) -> dict | None:
+        text = " ".join(text.split())
+        if not text or len(text) > MAX_QUERY_LENGTH or AMBIGUOUS.search(text):
+            return None
+
+        rest = text
+        times, rest = find_times(rest)
+        if times is None:
+            return None
+        day, rest = self.find_date(rest, now, times[0])
+        if day is None:
+            return None
+
+        duration = None
+        match = DURATION.search(rest)
+        if match is not None:
+            if times[1] is not None:
+                return None
+            duration = parse_duration(match)
+            rest = mask(rest, match)
+
+        # Anything date-like that is left (a second date, "week 5", "in 3 days") is ambiguous
+        if self.prefilter.has_temporal_expression(rest):
+            return None
+
+        location = ""
+        match = PLACE.search(rest)
+        if match is not None:
+            location = (match.group("place") or match.group("room")).strip()
+            rest = mask(rest, match)
+
+        title = clean_title(rest)
+        if not title or len(title.split()) > MAX_TITLE_WORDS:
+            return None
+
+        start = datetime.combine(day, times[0])
+        if times[1] is not None:
+            end = datetime.combine(day, times[1])
+            if end <= start:
+                end += timedelta(days=1)
+        else:
+            end = start + (duration or DEFAULT_DURATION)
+
+        return {
+            "title": title,
+            "start": start.isoformat(timespec="seconds"),
+            "end": end.isoformat(timespec="seconds"),
+            "location": location,
+            "description": "",
+        }
+
+    # Exactly one date expression (a weekday next to an explicit date must agree with it)
+    def find_date(self, text: str, now: datetime, start_time) -> tuple[date | None, str]:
+        today = now.date()
+        found = []
+        for pattern in DATE_PATTERNS:
+            for match in pattern.finditer(text):
+                found.append((match, pattern))
+        if not found:
+            return None, text
+
+        weekdays = [m for m, _ in found if m.groupdict().get("weekday")]
+        explicit = [m for m, _ in found if not m.groupdict().get("weekday")]
+        if len(weekdays) > 1 or len(explicit) > 1:
+            return None, text
+
+        if explicit:
+            day = explicit_date(explicit[0], today)
+            if day is None:
+                return None, text
+            if weekdays and day.weekday() != weekday_number(weekdays[0].group("weekday")):
+                return None, text
+        else:
+            # The coming occurrence; today only if the time has not passed yet
+            target = weekday_number(weekdays[0].group("weekday"))
+            day = today + timedelta(days=(target - today.weekday()) % 7)
+            if day == today and start_time <= now.time().replace(tzinfo=None):
+                day += timedelta(days=7)
+
+        for match, _ in found:
+            text = mask(text, match)
+        return day, text
+
+
+# (start, end or None) as times of day, and the text without them
+def find_times(text: str):
+    match = TIME_RANGE.search(text)
+    if match is not None and re.search(r"[ap]\.?m|:|noon|midnight", match.group(0), re.IGNORECASE):
+        second = parse_time(match.group("second"))
+        first = parse_time(match.group("first"), meridiem_of(match.group("second")))
+        if first is None or second is None:
+            return None, text
+        # "11-1pm" means 11am to 1pm
+        if first > second and not meridiem_of(match.group("first")) and first.hour >= 12:
+            first = first.replace(hour=first.hour - 12)
+        text = mask(text, match)
+        if SINGLE_TIME.search(text):
+            return None, text
+        return (first, second), text
+
+    matches = list(SINGLE_TIME.finditer(text))
+    if len(matches) != 1:
+        return None, text
+    start = parse_time(matches[0].group("time"))
+    if start is None:
+        return None, text
+    return (start, None), mask(text, matches[0])
+
+
+def meridiem_of(value: str) -> str:
+    match = re.search(r"([ap])\.?m", value, re.IGNORECASE)
+    return match.group(1).lower() if match else ""
+
+
+def parse_time(value: str, default_meridiem: str = ""):
+    value = value.strip().lower()
+    if value == "noon":
+        return datetime(2000, 1, 1, 12).time()
+    if value == "midnight":
+        return datetime(2000, 1, 1, 0).time()
+
+    match = re.match(r"(\d{1,2})(?::(\d{2}))?", value)
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = meridiem_of(value) or default_meridiem
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return datetime(2000, 1, 1, hour, minute).time()
+
+
+def parse_duration(match: re.Match) -> timedelta:
+    if match.group("number"):
+        count = float(match.group("number"))
+    else:
+        count = COUNT_WORDS[" ".join(match.group("word").lower().split())]
+    if match.group("unit").lower().startswith("h"):
+        return timedelta(hours=count)
+    return timedelta(minutes=count)
+
+
+def weekday_number(value: str) -> int:
+    return WEEKDAY_NUMBERS[value.lower()[:3]]
+
+
+def explicit_date(match: re.Match, today: date) -> date | None:
+    groups = match.groupdict()
+    try:
+        if groups.get("relative"):
+            return today + timedelta(days=1 if groups["relative"].lower() == "tomorrow" else 0)
+        if groups.get("iso"):
+            return date.fromisoformat(groups["iso"])
+
+        if groups.get("numeric_month"):
+            month = int(groups["numeric_month"])
+        else:
+            month = MONTH_NUMBERS[groups["month"].lower()[:3]]
+        day = int(groups["day"])
+
+        if groups.get("year"):
+            year = int(groups["year"])
+            return date(year + 2000 if year < 100 else year, month, day)
+
+        # Without a year, the next time that date comes around
+        result = date(today.year, month, day)
+        if result < today:
+            result = date(today.year + 1, month, day)
+        return result
+    except ValueError:
+        return None
+
+
+# Blanks out a match, keeping the offsets of other matches in text valid
+def mask(text: str, match: re.Match) -> str:
+    return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+
+def clean_title(text: str) -> str:
+    title = " ".join(text.split()).strip(" ,.;:!-")
+    title = LEADING_FILLER.sub("", title)
+    previous = None
+    while previous != title:
+        previous = title
+        title = DANGLING_WORDS.sub("", title).strip(" ,.;:!-")
+    return title[:1].upper() + title[1:]
@@ -0,0 +1,334 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+
+# Per-stage instrumentation for EventExtraction.
+# A PipelineMetrics collects one extraction's numbers per stage: LLM stages (get_time,
+# get_full_event, get_location, ...) count calls, tokens, cost, retries and errors per
+# model, plus the routes the model router chose and how often it escalated (see
+# home/llm/router.py) and how many calls a retried job resumed from its checkpoint.
+# Prompt tokens are split into the ones the provider served from its prompt prefix
+# cache (cached_tokens) and the rest. Local stages (chunking, pdf_pages, dedup,
+# fast_path, filter_rank, and rate_limit, the time calls waited for the rate limiter)
+# only add wall time; how the fast path, the temporal prefilter and the instruction
+# filter decided is kept separately. Every record is also added to the process-wide
+# MetricsRegistry, which renders the running totals in the Prometheus text format for
+# the /metrics/ endpoint. Worker processes outside the web process flush a snapshot of
+# their registry to the database (see home/worker_metrics.py), and /metrics/ adds them
+# in: counters are summed, gauges are reported per process with a process label.
+# The seconds of an LLM stage are the summed durations of its calls; calls run
+# concurrently, so they can add up to more than the extraction's elapsed time.
+
+# USD per million tokens: (uncached prompt, cached prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o-2024-08-06": (2.50, 1.25, 10.00),
+    "gpt-4o-mini-2024-07-18": (0.15, 0.075, 0.60),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    uncached_price, cached_price, completion_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * uncached_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+def new_stage() -> dict:
+    return {
+        "seconds": 0.0,
+        "calls": 0,
+        "cache_hits": 0,
+        "resumed": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "uncached_tokens": 0,
+        "cost_usd": 0.0,
+        "models": {},
+        "routes": {},
+        "escalations": {},
+    }
+
+
+class PipelineMetrics:
+    def __init__(self, registry: "MetricsRegistry" = None):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.fast_path = None
+        self.prefilter = None
+        self.filter = None
+        self.__stages = {}
+        self.__lock = threading.Lock()
+
+    def __stage(self, stage: str) -> dict:
+        if stage not in self.__stages:
+            self.__stages[stage] = new_stage()
+        return self.__stages[stage]
+
+    # response is the LLMResponse of one completed call
+    def record_call(self, stage: str, response, seconds: float, retries: int = 0) -> None:
+        cost = estimate_cost(response.model, response.prompt_tokens, response.completion_tokens, response.cached_tokens)
+        with self.__lock:
+            entry = self.__stage(stage)
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["retries"] += retries
+            entry["prompt_tokens"] += response.prompt_tokens
+            entry["completion_tokens"] += response.completion_tokens
+            entry["cached_tokens"] += response.cached_tokens
+            entry["uncached_tokens"] += response.prompt_tokens - response.cached_tokens
+            entry["cost_usd"] += cost
+            entry["models"][response.model] = entry["models"].get(response.model, 0) + 1
+
+        if self.registry is not None:
+            self.registry.record_call(stage, response, seconds, retries, cost)
+
+    def record_error(self, stage: str, seconds: float, retries: int = 0) -> None:
+        with self.__lock:
+            entry = self.__stage(stage)
+            entry["seconds"] += seconds
+            entry["errors"] += 1
+            entry["retries"] += retries
+
+        if self.registry is not None:
+            self.registry.record_error(stage, seconds, retries)
+
+    def record_route(self, stage: str, route: str) -> None:
+        with self.__lock:
+            routes = self.__stage(stage)["routes"]
+            routes[route] = routes.get(route, 0) + 1
+
+        if self.registry is not None:
+            self.registry.increment("extraction_route_decisions_total", 1, stage=stage, route=route)
+
+    def record_escalation(self, stage: str, reason: str) -> None:
+        with self.__lock:
+            escalations = self.__stage(stage)["escalations"]
+            escalations[reason] = escalations.get(reason, 0) + 1
+
+        if self.registry is not None:
+            self.registry.increment("extraction_route_escalations_total", 1, stage=stage, reason=reason)
+
+    # Whether the rule-based parser answered the query without the LLM
+    def record_fast_path(self, hit: bool) -> None:
+        self.fast_path = "hit" if hit else "miss"
+
+        if self.registry is not None:
+            self.registry.increment("extraction_fast_path_total", 1, result=self.fast_path)
+
+    # Whether the temporal prefilter kept a chunk for the LLM or skipped it
+    def record_prefilter(self, kept: bool) -> None:
+        result = "kept" if kept else "skipped"
+        with self.__lock:
+            if self.prefilter is None:
+                self.prefilter = {"kept": 0, "skipped": 0}
+            self.prefilter[result] += 1
+
+        if self.registry is not None:
+            self.registry.increment("extraction_prefilter_chunks_total", 1, result=result)
+
+    # How an instruction was applied and how many of the events reached filter_event
+    def record_filter(self, decision: str, events: int, candidates: int) -> None:
+        self.filter = {"decision": decision, "events": events, "candidates": candidates}
+
+        if self.registry is not None:
+            self.registry.increment("extraction_filter_total", 1, decision=decision)
+            self.registry.increment("extraction_filter_events_total", events, decision=decision)
+            self.registry.increment("extraction_filter_candidates_total", candidates, decision=decision)
+
+    def record_cache_hit(self, stage: str) -> None:
+        with self.__lock:
+            self.__stage(stage)["cache_hits"] += 1
+
+        if self.registry is not None:
+            self.registry.increment("extraction_stage_cache_hits_total", 1, stage=stage)
+
+    # A call answered from the checkpoint of an earlier attempt
+    def record_resumed(self, stage: str) -> None:
+        with self.__lock:
+            self.__stage(stage)["resumed"] += 1
+
+        if self.registry is not None:
+            self.registry.increment("extraction_stage_resumed_total", 1, stage=stage)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            self.__stage(stage)["seconds"] += seconds
+
+        if self.registry is not None:
+            self.registry.increment("extraction_stage_seconds_total", seconds, stage=stage)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    # Per-stage numbers plus totals, rounded for storing with a job
+    def summary(self) -> dict:
+        with self.__lock:
+            stages = {
+                name: {key: dict(value) if isinstance(value, dict) else value for key, value in entry.items()}
+                for name, entry in self.__stages.items()
+            }
+            prefilter = dict(self.prefilter) if self.prefilter is not None else None
+
+        total = new_stage()
+        del total["seconds"]
+        for entry in stages.values():
+            entry["seconds"] = round(entry["seconds"], 4)
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+            for key in total:
+                if isinstance(total[key], dict):
+                    for name, count in entry[key].items():
+                        total[key][name] = total[key].get(name, 0) + count
+                else:
+                    total[key] += entry[key]
+        total["cost_usd"] = round(total["cost_usd"], 6)
+        total["wall_seconds"] = round(time.perf_counter() - self.started, 4)
+        return {"stages": stages, "total": total, "fast_path": self.fast_path, "prefilter": prefilter, "filter": self.filter}
+
+
+# Adds the time spent producing each item (e.g. parsing the next PDF page) to stage
+def timed(items: Iterable, metrics: PipelineMetrics, stage: str) -> Iterable:
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            metrics.add_time(stage, time.perf_counter() - start)
+            return
+        metrics.add_time(stage, time.perf_counter() - start)
+        yield item
+
+
+# name: (type, help)
+METRIC_DESCRIPTIONS = {
+    "extraction_stage_seconds_total": ("counter", "Seconds spent in each extraction stage (summed over concurrent calls)."),
+    "extraction_stage_calls_total": ("counter", "LLM calls per extraction stage and model."),
+    "extraction_stage_errors_total": ("counter", "LLM calls per extraction stage that raised."),
+    "extraction_stage_retries_total": ("counter", "Retried LLM requests per extraction stage."),
+    "extraction_stage_cache_hits_total": ("counter", "LLM calls per extraction stage answered by the response cache."),
+    "extraction_stage_tokens_total": ("counter", "Tokens per extraction stage, model and kind (prompt, completion, cached)."),
+    "extraction_stage_cost_usd_total": ("counter", "Estimated cost in USD per extraction stage and model."),
+    "extraction_stage_resumed_total": ("counter", "LLM calls per extraction stage answered by the checkpoint of an earlier job attempt."),
+    "extraction_retry_budget_exhausted_total": ("counter", "Retries and hedges skipped because the extraction's retry budget was spent."),
+    "extraction_breaker_rejections_total": ("counter", "LLM calls failed fast because the circuit breaker was open."),
+    "extraction_hedges_total": ("counter", "Hedged duplicate LLM requests, by whether the duplicate answered first (won) or not (lost)."),
+    "extraction_route_decisions_total": ("counter", "Model routing decisions per extraction stage (cascade, large or forced)."),
+    "extraction_route_escalations_total": ("counter", "Cascaded calls escalated to the large model, per extraction stage and reason."),
+    "extraction_fast_path_total": ("counter", "Text queries the rule-based parser answered (hit) or passed to the LLM (miss)."),
+    "extraction_prefilter_chunks_total": ("counter", "Text chunks the temporal prefilter kept for the LLM or skipped (no date or time)."),
+    "extraction_filter_total": ("counter", "Filter instructions by how they were applied (date, keyword, all locally; llm)."),
+    "extraction_filter_events_total": ("counter", "Events that filter instructions were applied to."),
+    "extraction_filter_candidates_total": ("counter", "Events kept locally, or shortlisted for filter_event when the decision is llm."),
+    "extraction_coalesced_jobs_total": ("counter", "Extraction jobs that ran their own extraction (leader) or attached to an identical running one (follower)."),
+    "extraction_coalescing_ratio": ("gauge", "Share of extraction jobs that attached to an identical running one."),
+    "extraction_jobs_total": ("counter", "Extraction job attempts by resulting status (queued means it will be retried)."),
+    "extraction_job_seconds_total": ("counter", "Seconds spent running extraction job attempts, by resulting status."),
+}
+
+
+# Process-wide running totals, keyed by metric name and label values
+class MetricsRegistry:
+    def __init__(self):
+        self.__values = {}
+        self.__lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.__lock:
+            series = self.__values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def record_call(self, stage: str, response, seconds: float, retries: int, cost: float) -> None:
+        model = response.model
+        self.increment("extraction_stage_seconds_total", seconds, stage=stage)
+        self.increment("extraction_stage_calls_total", 1, stage=stage, model=model)
+        self.increment("extraction_stage_retries_total", retries, stage=stage)
+        self.increment("extraction_stage_tokens_total", response.prompt_tokens, stage=stage, model=model, kind="prompt")
+        self.increment("extraction_stage_tokens_total", response.completion_tokens, stage=stage, model=model, kind="completion")
+        self.increment("extraction_stage_tokens_total", response.cached_tokens, stage=stage, model=model, kind="cached")
+        self.increment("extraction_stage_cost_usd_total", cost, stage=stage, model=model)
+
+    def record_error(self, stage: str, seconds: float, retries: int) -> None:
+        self.increment("extraction_stage_seconds_total", seconds, stage=stage)
+        self.increment("extraction_stage_errors_total", 1, stage=stage)
+        self.increment("extraction_stage_retries_total", retries, stage=stage)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.__lock:
+            self.__values.setdefault(name, {})[key] = value
+
+    def get(self, name: str, **labels: str) -> float:
+        with self.__lock:
+            return self.__values.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__values.clear()
+
+    # Every series as JSON: {name: [[[[label, value], ...], sample], ...]}
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                name: [[[list(label) for label in labels], value] for labels, value in series.items()]
+                for name, series in self.__values.items()
+            }
+
+    # others are (process, snapshot) pairs of other processes' registries
+    def render(self, others: Iterable[tuple[str, dict]] = ()) -> str:
+        with self.__lock:
+            values = {name: dict(series) for name, series in self.__values.items()}
+
+        for process, snapshot in others:
+            for name, series in snapshot.items():
+                kind = METRIC_DESCRIPTIONS.get(name, ("untyped", ""))[0]
+                merged = values.setdefault(name, {})
+                for labels, value in series:
+                    key = tuple(sorted((label, str(label_value)) for label, label_value in labels))
+                    if kind == "counter":
+                        merged[key] = merged.get(key, 0) + value
+                    else:
+                        merged[tuple(sorted(key + (("process", process),)))] = value
+
+        lines = []
+        for name in sorted(values):
+            kind, description = METRIC_DESCRIPTIONS.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values[name].items()):
+                label_text = ",".join(f'{key}="{escape_label(str(val))}"' for key, val in labels)
+                sample = f"{name}{{{label_text}}}" if label_text else name
+                lines.append(f"{sample} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_default_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _default_registry
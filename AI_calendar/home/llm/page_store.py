@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Iterator
+from contextlib import closing, contextmanager
+
+
+# Page-level store for uploaded PDFs, so a re-upload only processes what changed.
+#  - pdf_pages maps a file hash to the hashes of its pages, so an identical re-upload
+#    is not parsed again
+#  - page_text keeps each page's text by page hash
+#  - page_events keeps the events extracted from a page's chunks, per variant
+#    (extraction mode, date anchor and timezone), so unchanged pages of an edited PDF are reused
+class PageStore:
+    def __init__(self, path: str, ttl: float = 7 * 86400):
+        self.path = path
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__stats = {"files_reused": 0, "pages_reused": 0, "pages_extracted": 0}
+
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_pages ("
+                "file_hash TEXT NOT NULL, page_no INTEGER NOT NULL, page_hash TEXT NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (file_hash, page_no))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_text ("
+                "page_hash TEXT PRIMARY KEY, text TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_events ("
+                "page_hash TEXT NOT NULL, variant TEXT NOT NULL, events TEXT NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (page_hash, variant))"
+            )
+
+    # Connection that commits (or rolls back) and is closed when the block exits
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def __count(self, name: str, amount: int = 1) -> None:
+        with self.__lock:
+            self.__stats[name] += amount
+
+    # Page texts of a file seen before, or None
+    def get_pages(self, file_hash: str) -> list[str] | None:
+        now = time.time()
+        with self.__connect() as conn:
+            rows = conn.execute(
+                "SELECT t.text FROM pdf_pages p JOIN page_text t ON t.page_hash = p.page_hash "
+                "WHERE p.file_hash = ? AND p.created_at > ? ORDER BY p.page_no",
+                (file_hash, now - self.ttl)
+            ).fetchall()
+            expected = conn.execute(
+                "SELECT COUNT(*) FROM pdf_pages WHERE file_hash = ?", (file_hash,)
+            ).fetchone()[0]
+
+        if not rows or len(rows) != expected:
+            return None
+        self.__count("files_reused")
+        return [row[0] for row in rows]
+
+    def put_pages(self, file_hash: str, pages: list[str]) -> None:
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute("DELETE FROM pdf_pages WHERE file_hash = ?", (file_hash,))
+            for page_no, text in enumerate(pages):
+                page_hash = page_digest(text)
+                conn.execute(
+                    "INSERT OR REPLACE INTO page_text (page_hash, text, last_access) VALUES (?, ?, ?)",
+                    (page_hash, text, now)
+                )
+                conn.execute(
+                    "INSERT INTO pdf_pages (file_hash, page_no, page_hash, created_at) VALUES (?, ?, ?, ?)",
+                    (file_hash, page_no, page_hash, now)
+                )
+            self.__evict(conn, now)
+
+    # Events already extracted from a page with the same text, or None
+    def get_events(self, page_hash: str, variant: str) -> list[dict] | None:
+        with self.__connect() as conn:
+            row = conn.execute(
+                "SELECT events FROM page_events WHERE page_hash = ? AND variant = ? AND created_at > ?",
+                (page_hash, variant, time.time() - self.ttl)
+            ).fetchone()
+
+        if row is None:
+            self.__count("pages_extracted")
+            return None
+        self.__count("pages_reused")
+        return json.loads(row[0])
+
+    def put_events(self, page_hash: str, variant: str, events: list[dict]) -> None:
+        with self.__connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO page_events (page_hash, variant, events, created_at) VALUES (?, ?, ?, ?)",
+                (page_hash, variant, json.dumps(events), time.time())
+            )
+
+    # For async extractions: the lookups and writes happen off the event loop
+    async def get_pages_async(self, file_hash: str) -> list[str] | None:
+        return await asyncio.to_thread(self.get_pages, file_hash)
+
+    async def put_pages_async(self, file_hash: str, pages: list[str]) -> None:
+        await asyncio.to_thread(self.put_pages, file_hash, pages)
+
+    async def get_events_async(self, page_hash: str, variant: str) -> list[dict] | None:
+        return await asyncio.to_thread(self.get_events, page_hash, variant)
+
+    async def put_events_async(self, page_hash: str, variant: str, events: list[dict]) -> None:
+        await asyncio.to_thread(self.put_events, page_hash, variant, events)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __evict(self, conn: sqlite3.Connection, now: float) -> None:
+        cutoff = now - self.ttl
+        conn.execute("DELETE FROM pdf_pages WHERE created_at <= ?", (cutoff,))
+        conn.execute("DELETE FROM page_events WHERE created_at <= ?", (cutoff,))
+        conn.execute(
+            "DELETE FROM page_text WHERE last_access <= ? "
+            "AND page_hash NOT IN (SELECT page_hash FROM pdf_pages)",
+            (cutoff,)
+        )
+
+
+def page_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+# Process-wide store configured from the environment, or None when PAGE_STORE_ENABLED=0
+def get_default_store() -> PageStore | None:
+    global _default_store
+
+    if os.getenv("PAGE_STORE_ENABLED", "1") == "0":
+        return None
+
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PageStore(
+                path=os.getenv("PAGE_STORE_PATH", os.path.join(os.path.dirname(__file__), "page_store.sqlite3")),
+                ttl=float(os.getenv("PAGE_STORE_TTL", str(7 * 86400))),
+            )
+        return _default_store
@@ -0,0 +1,118 @@
+import os
+import mmap
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
+from pypdf import PdfReader
+
+
+# Single place where uploaded PDFs are turned into text, shared by the views and
+# EventExtraction. Uploads are spooled to a temporary file and memory-mapped, and pages
+# are yielded one at a time so chunking can start before the last page is parsed.
+# Documents with at least PDF_PARALLEL_PAGES pages are parsed in a process pool; if the
+# pool breaks (a worker was killed, or processes can't be started), the pages that are
+# left are parsed in this process.
+
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGES", "40"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = 8
+
+
+# Copies an upload (a Django UploadedFile or any binary file object) to a temporary
+# file and returns its path. The caller owns the file and must delete it.
+def spool_upload(uploaded_file, directory: str = None) -> str:
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            if hasattr(uploaded_file, "chunks"):
+                for block in uploaded_file.chunks():
+                    destination.write(block)
+            else:
+                shutil.copyfileobj(uploaded_file, destination)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+# Reads only the document structure, so views can reject a broken upload right away
+def count_pages(path: str) -> int:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return len(PdfReader(data).pages)
+
+
+def iter_pdf_pages(path: str, workers: int = None) -> Iterator[str]:
+    if workers is None:
+        workers = PDF_WORKERS
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        page_count = len(reader.pages)
+
+        if workers <= 1 or page_count < PARALLEL_PAGE_THRESHOLD:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+    # Every range is submitted up front; results are yielded in page order as they finish
+    pool = None
+    futures = []
+    done = 0
+    try:
+        pool = get_pool(workers)
+        for start in range(0, page_count, PAGES_PER_TASK):
+            futures.append(pool.submit(extract_page_range, path, start, min(start + PAGES_PER_TASK, page_count)))
+        for future in futures:
+            pages = future.result()
+            yield from pages
+            done += len(pages)
+        return
+    except (BrokenProcessPool, OSError) as e:
+        print(f"PDF worker pool failed ({e}); parsing pages {done + 1}-{page_count} in process")
+        discard_pool(pool)
+    finally:
+        for future in futures:
+            future.cancel()
+
+    yield from iter_page_range(path, done, page_count)
+
+
+# Runs in a worker process, so it reopens the file instead of sharing the reader
+def extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    return list(iter_page_range(path, start, stop))
+
+
+def iter_page_range(path: str, start: int, stop: int) -> Iterator[str]:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        for i in range(start, stop):
+            yield reader.pages[i].extract_text() or ""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Web workers are multi-threaded, so the pool uses spawn rather than fork
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+# A broken pool stays broken; the next document gets a new one
+def discard_pool(pool: ProcessPoolExecutor | None) -> None:
+    global _pool
+
+    with _pool_lock:
+        if pool is not None and _pool is pool:
+            _pool = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
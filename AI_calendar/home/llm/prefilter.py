@@ -0,0 +1,48 @@
+import re
+
+
+_months = (
+    r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+)
+_weekdays = (
+    r"(?:mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?"
+    r"|fri(?:day)?|sat(?:urday)?|sun(?:day)?)\.?"
+)
+_units = r"(?:minute|hour|day|week|month|year|semester|weekend)s?"
+
+# Every pattern here has to appear in some form for a chunk to describe a datable event
+TEMPORAL_PATTERNS = [
+    # Apr 22, April 22nd, March 2025, 22 April, 3rd of May
+    rf"\b{_months}\s+\d{{1,4}}(?:st|nd|rd|th)?\b",
+    rf"\b\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{_months}(?!\w)",
+    # Thursday, Thu, Tues.
+    rf"\b{_weekdays}(?!\w)",
+    # 2025-04-22, 4/22, 04/22/2025, 22.04.2025
+    r"\b\d{4}-\d{1,2}-\d{1,2}\b",
+    r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b",
+    r"\b\d{1,2}\.\d{1,2}\.\d{2,4}\b",
+    # 2pm, 2:30 p.m., 14:00, noon
+    r"\b\d{1,2}(?::\d{2})?\s*[ap]\.?m\b\.?",
+    r"\b\d{1,2}:\d{2}\b",
+    r"\b(?:noon|midnight)\b",
+    # today, next Thursday, this week, in 3 days, every week, weekly, week 5
+    r"\b(?:today|tonight|tomorrow|yesterday)\b",
+    rf"\b(?:this|next|last|coming|following)\s+(?:{_weekdays}|{_units})(?!\w)",
+    rf"\bin\s+(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten)\s+{_units}\b",
+    rf"\b(?:every|each)\s+(?:other\s+)?(?:{_weekdays}|{_units})(?!\w)",
+    r"\b(?:daily|weekly|biweekly|monthly|annually)\b",
+    r"\bweek\s*\d{1,2}\b",
+]
+
+
+# Cheap local stage that runs before get_time: chunks with no date, weekday, time or
+# relative time expression cannot produce an event, so they are never sent to the model
+class TemporalPrefilter:
+    def __init__(self, patterns: list[str] = None):
+        if patterns is None:
+            patterns = TEMPORAL_PATTERNS
+        self.pattern = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+    def has_temporal_expression(self, text: str) -> bool:
+        return self.pattern.search(text) is not None
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import threading
+
+
+# Token-bucket model of the OpenAI rate limits: OPENAI_RPM requests and OPENAI_TPM
+# tokens per minute (0 or unset means that limit isn't modelled).
+# A call reserves one request and its estimated tokens up front and then sleeps until
+# the buckets would have held them, so waiting calls go out in order without polling.
+# Bulk calls (PDF extractions) first pass a second pair of buckets refilled at
+# OPENAI_BULK_SHARE of the rates, and only then draw from the shared ones; the rest of
+# every minute stays free for short interactive queries.
+# Reservations use an estimate (the prompt's characters / 4 plus
+# OPENAI_COMPLETION_ESTIMATE); settle() corrects the buckets with the real usage.
+
+COMPLETION_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_ESTIMATE", "256"))
+
+
+def estimate_tokens(request: dict) -> int:
+    characters = sum(len(message["content"]) for message in request["messages"])
+    return characters // 4 + COMPLETION_ESTIMATE
+
+
+class TokenBucket:
+    # Holds at most a minute's worth, refilled continuously
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def __refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Takes amount, even if the level goes below zero, and returns how long the caller
+    # has to wait for the bucket to have held it
+    def reserve(self, amount: float, now: float) -> float:
+        self.__refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    # Seconds until amount more could be taken without waiting
+    def wait_for(self, amount: float, now: float) -> float:
+        self.__refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def give_back(self, amount: float, now: float) -> None:
+        self.__refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    def __init__(self, rpm: float = 0, tpm: float = 0, bulk_share: float = 0.8):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.__shared = self.__buckets(rpm, tpm)
+        self.__bulk = self.__buckets(rpm * bulk_share, tpm * bulk_share)
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __buckets(rpm: float, tpm: float) -> dict:
+        buckets = {}
+        if rpm > 0:
+            buckets["requests"] = TokenBucket(rpm)
+        if tpm > 0:
+            buckets["tokens"] = TokenBucket(tpm)
+        return buckets
+
+    # Bulk calls wait for their own buckets before they count against the shared ones
+    def __stages(self, bulk: bool) -> list[dict]:
+        return [self.__bulk, self.__shared] if bulk else [self.__shared]
+
+    def __reserve(self, buckets: dict, tokens: int) -> float:
+        amounts = {"requests": 1, "tokens": tokens}
+        now = time.monotonic()
+        with self.__lock:
+            return max([bucket.reserve(amounts[name], now) for name, bucket in buckets.items()], default=0.0)
+
+    # Both return the seconds spent waiting
+    def acquire(self, tokens: int, bulk: bool = False) -> float:
+        waited = 0.0
+        for buckets in self.__stages(bulk):
+            delay = self.__reserve(buckets, tokens)
+            if delay > 0:
+                time.sleep(delay)
+                waited += delay
+        return waited
+
+    async def acquire_async(self, tokens: int, bulk: bool = False) -> float:
+        waited = 0.0
+        for buckets in self.__stages(bulk):
+            delay = self.__reserve(buckets, tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+        return waited
+
+    # used is the call's real token count, or 0 if it failed before using any
+    def settle(self, reserved: int, used: int, bulk: bool = False) -> None:
+        now = time.monotonic()
+        with self.__lock:
+            for buckets in self.__stages(bulk):
+                bucket = buckets.get("tokens")
+                if bucket is None:
+                    continue
+                if used > reserved:
+                    bucket.reserve(used - reserved, now)
+                else:
+                    bucket.give_back(reserved - used, now)
+
+    # Seconds until tokens more could be sent at the token limit; 0 without one
+    def drain_seconds(self, tokens: int, bulk: bool = False) -> float:
+        buckets = self.__bulk if bulk else self.__shared
+        bucket = buckets.get("tokens")
+        if bucket is None:
+            return 0.0
+        with self.__lock:
+            return bucket.wait_for(tokens, time.monotonic())
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+# The process-wide limiter for the configured limits, or None when neither is set
+def get_default_limiter() -> RateLimiter | None:
+    rpm = float(os.getenv("OPENAI_RPM", "0"))
+    tpm = float(os.getenv("OPENAI_TPM", "0"))
+    if rpm <= 0 and tpm <= 0:
+        return None
+
+    bulk_share = float(os.getenv("OPENAI_BULK_SHARE", "0.8"))
+    key = (rpm, tpm, bulk_share)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rpm, tpm, bulk_share)
+        return _limiters[key]
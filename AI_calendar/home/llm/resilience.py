@@ -0,0 +1,362 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from openai import APIConnectionError, RateLimitError, InternalServerError
+from home.llm.metrics import get_registry
+
+
+# Guards every call APICaller makes, whichever backend it goes to.
+#  - Connection errors (timeouts included), 429s and 5xx responses are retried up to
+#    OPENAI_MAX_RETRIES times: after the wait the server asked for (Retry-After, or the
+#    x-ratelimit-reset-* header of the exhausted limit on a 429), or otherwise after
+#    jittered exponential backoff. A call the server asks to wait longer than
+#    OPENAI_MAX_RETRY_DELAY for is not retried here; the job is retried later instead.
+#  - All calls of one extraction share a RetryBudget of OPENAI_RETRY_BUDGET retries and
+#    hedges, so a degraded provider can't turn one document into hundreds of requests.
+#  - A CircuitBreaker per backend opens after OPENAI_BREAKER_FAILURES failures in a row
+#    (timeouts, connection errors and 5xx; a 429 means the provider is up). While open,
+#    calls fail at once with CircuitOpen; after OPENAI_BREAKER_RESET seconds a single
+#    trial call decides whether it closes again.
+#  - Hedging (async calls only): a call still unanswered after OPENAI_HEDGE_AFTER seconds,
+#    or after the OPENAI_HEDGE_QUANTILE quantile of the model's recent latencies, gets a
+#    duplicate request, and whichever answers first is used.
+# Per-call timeouts are set on the OpenAI client (OPENAI_TIMEOUT, see backend.py).
+
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def optional_float(name: str) -> float | None:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+class RetryBudget:
+    def __init__(self, retries: int = None):
+        if retries is None:
+            retries = int(os.getenv("OPENAI_RETRY_BUDGET", "10"))
+        self.remaining = retries
+        self.__lock = threading.Lock()
+
+    def spend(self) -> bool:
+        with self.__lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        if failure_threshold is None:
+            failure_threshold = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+        if reset_timeout is None:
+            reset_timeout = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.__opened_at = 0.0
+        self.__trial_running = False
+        self.__lock = threading.Lock()
+
+    # Raises CircuitOpen unless a call may go out now; True if the call is the trial
+    def allow(self) -> bool:
+        with self.__lock:
+            if self.state == self.OPEN:
+                waited = time.monotonic() - self.__opened_at
+                if waited < self.reset_timeout:
+                    raise CircuitOpen(f"LLM provider is failing; calls resume in {self.reset_timeout - waited:.0f}s")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self.__trial_running:
+                    raise CircuitOpen("LLM provider is failing; a trial call is in flight")
+                self.__trial_running = True
+                return True
+            return False
+
+    # The trial call ended without an answer either way (it was cancelled), so the next
+    # call becomes the trial
+    def release_trial(self) -> None:
+        with self.__lock:
+            self.__trial_running = False
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.__trial_running = False
+
+    def record_failure(self) -> None:
+        with self.__lock:
+            self.failures += 1
+            self.__trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.__opened_at = time.monotonic()
+
+
+# Recent call latencies per model, for the hedging delay
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self.__size = size
+        self.__samples = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self.__lock:
+            self.__samples.setdefault(model, deque(maxlen=self.__size)).append(seconds)
+
+    def quantile(self, model: str, q: float) -> float | None:
+        with self.__lock:
+            samples = list(self.__samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, round(q * (len(samples) - 1)))]
+
+
+# Breaker and latencies are shared by every caller of the same backend object
+class BackendHealth:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latencies = LatencyWindow()
+
+
+_health = weakref.WeakKeyDictionary()
+_health_lock = threading.Lock()
+
+
+def get_health(backend) -> BackendHealth:
+    with _health_lock:
+        health = _health.get(backend)
+        if health is None:
+            health = _health[backend] = BackendHealth()
+        return health
+
+
+class ResilientBackend:
+    def __init__(
+        self,
+        inner,
+        max_retries: int = None,
+        budget: RetryBudget = None,
+        health: BackendHealth = None,
+        hedge_after: float = None,
+        hedge_quantile: float = None,
+    ):
+        if max_retries is None:
+            max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        self.inner = inner
+        self.max_retries = max_retries
+        self.budget = budget if budget is not None else RetryBudget()
+        self.health = health if health is not None else get_health(inner)
+        self.hedge_after = hedge_after if hedge_after is not None else optional_float("OPENAI_HEDGE_AFTER")
+        self.hedge_quantile = hedge_quantile if hedge_quantile is not None else optional_float("OPENAI_HEDGE_QUANTILE")
+        self.max_retry_delay = float(os.getenv("OPENAI_MAX_RETRY_DELAY", "60"))
+
+    def complete(self, request: dict, key: str):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            trial = False
+            try:
+                trial = self.__allow()
+                response = self.inner.complete(request, key)
+            except Exception as e:
+                delay = self.__retry_delay(e, attempt)
+                if delay is None:
+                    e.retries = attempt
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            except BaseException:
+                self.__cancelled(trial)
+                raise
+            else:
+                self.__succeeded(request, time.perf_counter() - start)
+                response.retries = attempt
+                return response
+
+    async def complete_async(self, request: dict, key: str):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            trial = False
+            try:
+                trial = self.__allow()
+                response = await self.__hedged(request, key)
+            except Exception as e:
+                delay = self.__retry_delay(e, attempt)
+                if delay is None:
+                    e.retries = attempt
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException:
+                self.__cancelled(trial)
+                raise
+            else:
+                self.__succeeded(request, time.perf_counter() - start)
+                response.retries = attempt
+                return response
+
+    def __allow(self) -> bool:
+        try:
+            return self.health.breaker.allow()
+        except CircuitOpen:
+            get_registry().increment("extraction_breaker_rejections_total")
+            raise
+
+    # A cancelled call (a lost hedge, a sibling chunk failing, a client disconnecting)
+    # says nothing about the provider, but must not keep the trial slot
+    def __cancelled(self, trial: bool) -> None:
+        if trial:
+            self.health.breaker.release_trial()
+
+    def __succeeded(self, request: dict, seconds: float) -> None:
+        self.health.breaker.record_success()
+        self.health.latencies.observe(request["model"], seconds)
+
+    # Seconds to wait before retrying after error, or None to give up
+    def __retry_delay(self, error: Exception, attempt: int) -> float | None:
+        if isinstance(error, CircuitOpen):
+            return None
+        if not isinstance(error, RETRYABLE_ERRORS):
+            # The provider answered; the request itself is at fault
+            self.health.breaker.record_success()
+            return None
+        if isinstance(error, RateLimitError):
+            self.health.breaker.record_success()
+        else:
+            self.health.breaker.record_failure()
+            # Retrying would only be turned away until the breaker resets
+            if self.health.breaker.state == CircuitBreaker.OPEN:
+                return None
+
+        if attempt >= self.max_retries:
+            return None
+        delay = retry_delay(attempt, error)
+        if delay > self.max_retry_delay:
+            return None
+        if not self.budget.spend():
+            get_registry().increment("extraction_retry_budget_exhausted_total")
+            return None
+        return delay
+
+    def __hedge_delay(self, model: str) -> float | None:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if self.hedge_quantile is not None:
+            return self.health.latencies.quantile(model, self.hedge_quantile)
+        return None
+
+    async def __hedged(self, request: dict, key: str):
+        first = asyncio.ensure_future(self.inner.complete_async(request, key))
+        delay = self.__hedge_delay(request["model"])
+        if delay is None:
+            return await first
+
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except BaseException:
+            first.cancel()
+            raise
+        if done or not self.budget.spend():
+            return await first
+
+        second = asyncio.ensure_future(self.inner.complete_async(request, key))
+        response, winner = await first_success([first, second])
+        get_registry().increment("extraction_hedges_total", 1, outcome="won" if winner == 1 else "lost")
+        return response
+
+
+# The result of whichever task succeeds first; the others are cancelled. Raises the first
+# error if every task fails.
+async def first_success(tasks: list[asyncio.Future]) -> tuple[object, int]:
+    pending = set(tasks)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks.index(task)
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Backoff for the given (0-based) attempt: the server's hint when it sent one, plus up
+# to 10% so retries of a burst don't line up; otherwise 0.5s doubling up to 8s, minus up
+# to 25% jitter
+def retry_delay(attempt: int, error: Exception = None) -> float:
+    hint = rate_limit_hint(error) if error is not None else None
+    if hint is not None:
+        return hint * (1 + 0.1 * random.random())
+    return min(0.5 * 2 ** attempt, 8.0) * (1 - 0.25 * random.random())
+
+
+# Seconds the server asked us to wait, from Retry-After(-Ms) or, on a 429, from the reset
+# header of the limit that ran out
+def rate_limit_hint(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        value = headers["retry-after"]
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if isinstance(error, RateLimitError):
+        resets = [
+            parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            for kind in ("requests", "tokens")
+            if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+    return None
+
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+# OpenAI's reset durations look like "20ms", "1.5s" or "6m0s"
+def parse_duration(value: str | None) -> float | None:
+    if not value:
+        return None
+    parts = DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
@@ -0,0 +1,168 @@
+import os
+import threading
+from datetime import datetime
+from home.llm.chunker import estimate_tokens
+from home.llm.prefilter import TemporalPrefilter
+
+
+# Picks the model for every APICaller call.
+# By default a call goes to the mini model first and is escalated to the large model only
+# if the mini answer fails validate_result (no events from text with dates in it,
+# timestamps that don't parse, an event ending before it starts). Per task (pipeline
+# stage) and input size the router keeps a moving escalation rate and each model's
+# moving latency; once the cascade is expected to be slower than asking the large model
+# directly, or escalates too often, that task and size go straight to the large model.
+# Every probe_every-th of those calls still goes through the cascade, so the rate keeps
+# being measured and the task can move back to mini first.
+
+MINI_MODEL = os.getenv("LLM_MINI_MODEL", "gpt-4o-mini-2024-07-18")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o-2024-08-06")
+
+# Tasks whose answer may legitimately be empty, so an empty result is not a failure
+EMPTY_ALLOWED = {"filter_event"}
+
+# Upper bounds (estimated tokens) of the small and medium input-size buckets
+SIZE_BUCKETS = ((500, "small"), (2000, "medium"))
+
+ROUTE_CASCADE = "cascade"
+ROUTE_LARGE = "large"
+ROUTE_FORCED = "forced"
+
+
+class RouteStats:
+    def __init__(self):
+        self.samples = 0
+        self.escalation_rate = 0.0
+        self.direct_calls = 0
+
+
+class ModelRouter:
+    # min_samples cascaded calls are observed before a task and size can be routed
+    # directly; smoothing is the weight of the newest observation in the moving averages
+    def __init__(
+        self,
+        mini_model: str = MINI_MODEL,
+        large_model: str = LARGE_MODEL,
+        min_samples: int = 20,
+        max_escalation_rate: float = 0.5,
+        latency_slack: float = 0.2,
+        probe_every: int = 10,
+        smoothing: float = 0.1
+    ):
+        self.mini_model = mini_model
+        self.large_model = large_model
+        self.min_samples = min_samples
+        self.max_escalation_rate = max_escalation_rate
+        self.latency_slack = latency_slack
+        self.probe_every = probe_every
+        self.smoothing = smoothing
+        self.prefilter = TemporalPrefilter()
+        self.__routes = {}
+        self.__latency = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def size_bucket(text: str) -> str:
+        tokens = estimate_tokens(text)
+        for limit, name in SIZE_BUCKETS:
+            if tokens <= limit:
+                return name
+        return "large"
+
+    # Returns (route name, models to try in order). mini_model=True or False forces a model.
+    def route(self, task: str, text: str, mini_model: bool = None) -> tuple[str, list[str]]:
+        if mini_model is not None:
+            return ROUTE_FORCED, [self.mini_model if mini_model else self.large_model]
+
+        key = (task, self.size_bucket(text))
+        with self.__lock:
+            stats = self.__routes.setdefault(key, RouteStats())
+            if stats.samples < self.min_samples or not self.__prefer_large(stats):
+                return ROUTE_CASCADE, [self.mini_model, self.large_model]
+
+            stats.direct_calls += 1
+            if stats.direct_calls % self.probe_every == 0:
+                return ROUTE_CASCADE, [self.mini_model, self.large_model]
+            return ROUTE_LARGE, [self.large_model]
+
+    def __prefer_large(self, stats: RouteStats) -> bool:
+        if stats.escalation_rate >= self.max_escalation_rate:
+            return True
+
+        mini = self.__latency.get(self.mini_model)
+        large = self.__latency.get(self.large_model)
+        if mini is None or large is None:
+            return False
+        expected_cascade = mini + stats.escalation_rate * large
+        return expected_cascade > large * (1 + self.latency_slack)
+
+    # Outcome of the first step of a cascaded call
+    def observe_cascade(self, task: str, text: str, escalated: bool) -> None:
+        key = (task, self.size_bucket(text))
+        with self.__lock:
+            stats = self.__routes.setdefault(key, RouteStats())
+            stats.samples += 1
+            # A plain mean until there are enough samples for the moving average
+            weight = max(self.smoothing, 1 / stats.samples)
+            stats.escalation_rate += weight * (float(escalated) - stats.escalation_rate)
+
+    def observe_latency(self, model: str, seconds: float) -> None:
+        with self.__lock:
+            previous = self.__latency.get(model)
+            if previous is None:
+                self.__latency[model] = seconds
+            else:
+                self.__latency[model] = previous + self.smoothing * (seconds - previous)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {
+                "routes": {
+                    f"{task}:{size}": {
+                        "samples": stats.samples,
+                        "escalation_rate": round(stats.escalation_rate, 4),
+                        "direct_large": stats.samples >= self.min_samples and self.__prefer_large(stats),
+                    }
+                    for (task, size), stats in self.__routes.items()
+                },
+                "latency": {model: round(seconds, 4) for model, seconds in self.__latency.items()},
+            }
+
+    # Why a parsed answer should be escalated, or None if it looks usable
+    def validate_result(self, task: str, text: str, parsed) -> str | None:
+        events = getattr(parsed, "events", None)
+        if events is None:
+            events = [parsed]
+        elif not events and task not in EMPTY_ALLOWED and self.prefilter.has_temporal_expression(text):
+            return "empty_result"
+
+        for event in events:
+            try:
+                start = parse_timestamp(event.start)
+                end = parse_timestamp(event.end)
+            except ValueError:
+                return "unparseable_timestamp"
+            if end < start:
+                return "end_before_start"
+        return None
+
+
+# Naive and aware timestamps are compared as wall-clock times
+def parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router() -> ModelRouter:
+    global _default_router
+
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter(
+                min_samples=int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "20")),
+                max_escalation_rate=float(os.getenv("LLM_ROUTER_MAX_ESCALATION_RATE", "0.5")),
+            )
+        return _default_router
@@ -0,0 +1,211 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from home.llm.prefilter import TemporalPrefilter
+
+
+# Local stand-in for the OpenAI chat completions endpoint, for load tests and for
+# recording cassettes without an API key. It answers POST /v1/chat/completions with a
+# structured output that satisfies the request's json_schema: one event per date or time
+# expression in the user message (up to max_events), with deterministic times. Usage is
+# estimated at 4 characters per token, and prompt prefix caching is simulated the way
+# OpenAI does it: once a prompt is at least 1024 tokens, the longest previously seen
+# prefix, in 128-token blocks, is reported as cached_tokens.
+# Faults can be injected for testing the call layer (see home/llm/resilience.py):
+#  - fail_next = N makes the next N requests fail with a 500
+#  - faults is a list of faults for the next requests, one per request, in order:
+#    {"status": 429, "headers": {"retry-after-ms": "50"}} answers with that error, and
+#    {"delay": 2.0} answers normally but that many seconds late
+#  - error_rate fails that fraction of the remaining requests with a 500
+# Point the client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+# Usage (from the AI_calendar directory):
+#   python -m home.llm.stub_server --port 8765 --latency 0.4 --jitter 0.2
+
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+class StubOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0, max_events: int = 5):
+        self.latency = latency
+        self.jitter = jitter
+        self.max_events = max_events
+        self.request_count = 0
+        self.fail_next = 0
+        self.faults = []
+        self.error_rate = 0.0
+        self.prefilter = TemporalPrefilter()
+        self.__prefixes = set()
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.__thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def serve_forever(self) -> None:
+        self.__server.serve_forever()
+
+    # Takes the fault to inject into this request, if any
+    def take_fault(self) -> dict | None:
+        with self.__lock:
+            self.request_count += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return {"status": 500}
+            if self.faults:
+                return self.faults.pop(0)
+            if self.error_rate and random.random() < self.error_rate:
+                return {"status": 500}
+            return None
+
+    # Prompt tokens served from the simulated prefix cache; every prefix of this prompt
+    # is cached from now on
+    def cached_tokens(self, prompt: str) -> int:
+        block = CACHE_BLOCK_TOKENS * 4
+        boundaries = range(block, len(prompt) + 1, block)
+        with self.__lock:
+            cached = 0
+            for end in boundaries:
+                if hash(prompt[:end]) not in self.__prefixes:
+                    break
+                cached = end // 4
+            self.__prefixes.update(hash(prompt[:end]) for end in boundaries)
+        return cached if len(prompt) // 4 >= CACHE_MIN_TOKENS else 0
+
+    def complete(self, body: dict) -> dict:
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        user_text = "".join(m["content"] for m in body["messages"] if m["role"] == "user")
+        schema_spec = body.get("response_format", {}).get("json_schema", {})
+        schema = schema_spec.get("schema", {})
+        count = min(len(self.prefilter.pattern.findall(user_text)), self.max_events)
+        content = json.dumps(fake_value(schema, schema.get("$defs", {}), count, 0, ""))
+
+        prompt = "".join(m["content"] for m in body["messages"])
+        prompt_tokens = len(prompt) // 4
+        cached = self.cached_tokens(prompt)
+        return {
+            "id": f"chatcmpl-stub-{self.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+    def make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                headers = {}
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    status, payload = 404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}
+                else:
+                    fault = stub.take_fault() or {}
+                    if "status" in fault:
+                        status, payload = fault["status"], {"error": {"message": "Injected failure", "type": "server_error"}}
+                        headers = fault.get("headers", {})
+                    else:
+                        time.sleep(fault.get("delay", 0))
+                        status, payload = 200, stub.complete(body)
+
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on a slow answer (a timeout or a lost hedge)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+_base_time = datetime(2025, 1, 6, 9, 0)
+
+
+# A value matching a JSON schema. Arrays get `count` items; string fields are filled by
+# name, so events have consistent start and end times.
+def fake_value(schema: dict, defs: dict, count: int, index: int, name: str):
+    if "$ref" in schema:
+        return fake_value(defs[schema["$ref"].split("/")[-1]], defs, count, index, name)
+    if "anyOf" in schema:
+        return fake_value(schema["anyOf"][0], defs, count, index, name)
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            key: fake_value(value, defs, count, index, key)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), defs, count, i, name) for i in range(count)]
+    if kind == "string":
+        start = _base_time + timedelta(days=index, hours=index % 8)
+        if name == "start":
+            return start.isoformat()
+        if name == "end":
+            return (start + timedelta(hours=1)).isoformat()
+        if name == "title":
+            return f"Event {index + 1}"
+        if name == "location":
+            return f"Room {100 + index}"
+        return ""
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return None
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    server = StubOpenAIServer(args.host, args.port, args.latency, args.jitter)
+    server.error_rate = args.error_rate
+    print(f"Stub OpenAI server listening on {server.base_url}")
+    server.serve_forever()
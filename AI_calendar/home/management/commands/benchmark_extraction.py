@@ -0,0 +1,110 @@
+import os
+import time
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from home.models import ExtractionJob
+from home.llm.benchmark import SUITE_NOW, suite_scenarios, run_scenario, print_suite_report
+from home.llm.stub_server import StubOpenAIServer
+
+
+# Runs the benchmark suite's documents through the web endpoints (guest_ai_query, and
+# ai_process_query until its job finishes), against a throwaway test database:
+#   python manage.py benchmark_extraction --replay cassette.json --latency 0.5
+#   python manage.py benchmark_extraction --stub --latency 0.5 --repeat 10
+# The endpoints do not report calls or tokens, so only latency, throughput and events are
+# shown (python -m home.llm.benchmark --suite has the per-call numbers). Latency includes
+# upload handling, extraction and saving.
+class Command(BaseCommand):
+    help = "Benchmark the extraction endpoints with a recorded, stubbed or live LLM backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--replay", metavar="CASSETTE")
+        parser.add_argument("--record", metavar="CASSETTE")
+        parser.add_argument("--stub", action="store_true")
+        parser.add_argument("--latency", type=float, default=0.0)
+        parser.add_argument("--jitter", type=float, default=0.0)
+        parser.add_argument("--job-timeout", type=float, default=300)
+
+    def handle(self, *args, **options):
+        if options["replay"] and (options["record"] or options["stub"]):
+            raise CommandError("--replay cannot be combined with --record or --stub")
+
+        # The views build their extractors from the environment
+        os.environ.update({"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+        os.environ.setdefault("LLM_NOW", SUITE_NOW)
+        stub = None
+        if options["replay"]:
+            os.environ.update({
+                "LLM_BACKEND": "replay",
+                "LLM_CASSETTE": options["replay"],
+                "LLM_REPLAY_LATENCY": str(options["latency"]),
+                "LLM_REPLAY_JITTER": str(options["jitter"]),
+            })
+        else:
+            if options["stub"]:
+                stub = StubOpenAIServer(latency=options["latency"], jitter=options["jitter"]).start()
+                os.environ.update({"OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": stub.base_url})
+            if options["record"]:
+                os.environ.update({"LLM_BACKEND": "record", "LLM_CASSETTE": options["record"]})
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                rows = []
+                for name, source, instruction in suite_scenarios(workdir):
+                    rows.append(run_scenario(f"guest: {name}", guest_run(source, instruction), options["repeat"]))
+                    rows.append(run_scenario(f"job: {name}", job_run(source, instruction, options["job_timeout"]), options["repeat"]))
+            print_suite_report(rows)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+            if stub is not None:
+                stub.stop()
+
+
+def post_query(client: Client, path: str, source: str, instruction: str | None):
+    data = {"query": instruction or ""}
+    if not source.endswith(".pdf"):
+        data["query"] = source if instruction is None else f"{instruction} {source}"
+        return client.post(path, data)
+
+    with open(source, "rb") as file:
+        data["file"] = file
+        return client.post(path, data)
+
+
+def guest_run(source: str, instruction: str | None):
+    def run() -> dict:
+        response = post_query(Client(), "/guest-ai-query/", source, instruction)
+        if response.status_code != 200:
+            raise CommandError(f"guest-ai-query returned {response.status_code}: {response.content[:200]}")
+        return {"events": len(response.json()["events"])}
+    return run
+
+
+def job_run(source: str, instruction: str | None, timeout: float):
+    def run() -> dict:
+        response = post_query(Client(), "/ai-process-query/", source, instruction)
+        if response.status_code != 200:
+            raise CommandError(f"ai-process-query returned {response.status_code}: {response.content[:200]}")
+
+        job_id = response.json()["job_id"]
+        deadline = time.monotonic() + timeout
+        while True:
+            job = ExtractionJob.objects.get(id=job_id)
+            if job.is_finished:
+                break
+            if time.monotonic() > deadline:
+                raise CommandError(f"Job {job_id} did not finish within {timeout} seconds")
+            time.sleep(0.02)
+
+        if job.status != ExtractionJob.STATUS_SUCCEEDED:
+            raise CommandError(f"Job {job_id} failed: {job.error}")
+        return {"events": len(job.result)}
+    return run
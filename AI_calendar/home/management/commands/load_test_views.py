@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, AsyncClient
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from home.llm.benchmark import SUITE_NOW, percentile
+from home.llm.stub_server import StubOpenAIServer
+
+
+# Concurrent capacity of guest_ai_query under WSGI and under ASGI, against the stub
+# OpenAI server and a throwaway test database:
+#   python manage.py load_test_views --requests 200 --workers 8 --latency 0.5
+# All requests are sent at once. Under WSGI a fixed pool of --workers threads (like
+# gunicorn sync workers) each serves one request at a time, so the rest queue; under
+# ASGI every request is a task on one event loop, up to --concurrency at a time.
+# Latency is measured from the start of the burst, so it includes time spent queued.
+# The query has two dates, so it misses the fast path and makes real (stubbed) calls.
+LOAD_TEST_QUERY = "Midterm on March 3rd at 2pm in Room 101. Final exam on May 5th at 9am in Room 202."
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        with self.__lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self.__lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = "Compare how many concurrent guest extractions WSGI and ASGI serve."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--concurrency", type=int, default=500)
+        parser.add_argument("--latency", type=float, default=0.5)
+        parser.add_argument("--jitter", type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        stub = StubOpenAIServer(latency=options["latency"], jitter=options["jitter"]).start()
+        os.environ.update({
+            "LLM_BACKEND": "openai",
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": stub.base_url,
+            "LLM_CACHE_ENABLED": "0",
+            "PAGE_STORE_ENABLED": "0",
+        })
+        os.environ.setdefault("LLM_NOW", SUITE_NOW)
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            rows = [
+                run_wsgi(options["requests"], options["workers"]),
+                asyncio.run(run_asgi(options["requests"], options["concurrency"])),
+            ]
+            print_load_report(rows, stub.request_count)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+            stub.stop()
+
+
+def check(response) -> None:
+    if response.status_code != 200:
+        raise CommandError(f"guest-ai-query returned {response.status_code}: {response.content[:200]}")
+
+
+def run_wsgi(count: int, workers: int) -> dict:
+    in_flight = InFlight()
+    started = time.perf_counter()
+
+    def request() -> float:
+        with in_flight:
+            check(Client().post("/guest-ai-query/", {"query": LOAD_TEST_QUERY}))
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(lambda _: request(), range(count)))
+    return load_row(f"wsgi ({workers} workers)", latencies, time.perf_counter() - started, in_flight.peak)
+
+
+async def run_asgi(count: int, concurrency: int) -> dict:
+    in_flight = InFlight()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    # ThreadSensitiveContext gives each request its own thread for sync code, as the
+    # ASGI handler does
+    async def request() -> float:
+        async with semaphore, ThreadSensitiveContext():
+            with in_flight:
+                check(await AsyncClient().post("/guest-ai-query/", {"query": LOAD_TEST_QUERY}))
+        return time.perf_counter() - started
+
+    latencies = await asyncio.gather(*(request() for _ in range(count)))
+    return load_row("asgi", latencies, time.perf_counter() - started, in_flight.peak)
+
+
+def load_row(mode: str, latencies: list[float], elapsed: float, peak: int) -> dict:
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "peak": peak,
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "elapsed": elapsed,
+    }
+
+
+def print_load_report(rows: list[dict], llm_calls: int) -> None:
+    header = f"{'mode':<20} {'requests':>8} {'in flight':>9} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'total (s)':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['mode']:<20} {row['requests']:>8} {row['peak']:>9} {row['per_second']:>8.2f} "
+            f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['elapsed']:>9.2f}"
+        )
+    print(f"{llm_calls} calls to the stub LLM server")
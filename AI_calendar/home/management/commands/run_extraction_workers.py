@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from home.jobs import JobWorkerPool, get_setting
+from home.worker_metrics import MetricsFlusher
+
+
+# Runs extraction workers outside the web process:
+#   python manage.py run_extraction_workers --workers 8
+# Set EXTRACTION_RUN_IN_PROCESS = False so web processes only enqueue.
+# The workers' metrics are flushed to the database for the web process's /metrics/.
+class Command(BaseCommand):
+    help = "Run a pool of extraction job workers until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=get_setting("EXTRACTION_WORKERS", 4))
+        parser.add_argument("--poll-interval", type=float, default=get_setting("EXTRACTION_POLL_INTERVAL", 2.0))
+        parser.add_argument("--bulk-workers", type=int, default=get_setting("EXTRACTION_BULK_WORKERS", None))
+
+    def handle(self, *args, **options):
+        pool = JobWorkerPool(
+            workers=options["workers"],
+            poll_interval=options["poll_interval"],
+            bulk_workers=options["bulk_workers"],
+        )
+        flusher = MetricsFlusher()
+        pool.start()
+        flusher.start()
+        self.stdout.write(f"Started {options['workers']} extraction workers")
+
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping extraction workers")
+            pool.stop()
+        finally:
+            flusher.stop()
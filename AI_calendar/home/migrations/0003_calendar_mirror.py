@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_job_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('google_event_id', models.CharField(max_length=1024)),
+                ('summary', models.TextField(blank=True)),
+                ('start', models.CharField(max_length=64)),
+                ('end', models.CharField(max_length=64)),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('location', models.TextField(blank=True)),
+                ('description', models.TextField(blank=True)),
+                ('creator', models.CharField(blank=True, max_length=254)),
+                ('html_link', models.URLField(blank=True, max_length=1000)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start_at'],
+                'indexes': [models.Index(fields=['user', 'calendar_id', 'start_at'], name='home_calend_user_id_990f60_idx'), models.Index(fields=['user', 'end_at', 'start_at'], name='home_calend_user_id_0bf71f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'calendar_id', 'google_event_id'), name='unique_calendar_event')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncedCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('color', models.CharField(default='#3788d8', max_length=16)),
+                ('primary', models.BooleanField(default=False)),
+                ('sync_token', models.TextField(blank=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='synced_calendars', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'calendar_id'), name='unique_synced_calendar')],
+            },
+        ),
+    ]
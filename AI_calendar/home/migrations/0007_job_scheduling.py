@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_job_timezone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='estimated_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Interactive'), (1, 'Bulk')], default=0),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='virtual_finish',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='extractionjob',
+            index=models.Index(fields=['status', 'priority', 'virtual_finish'], name='home_extrac_status_a72ae2_idx'),
+        ),
+    ]
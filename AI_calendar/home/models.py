@@ -1,3 +1,272 @@
+import zlib
+import uuid
+import hashlib
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+# One ai_process_query request. Jobs live in the database so any web process can
+# enqueue them and any worker (in-process pool or run_extraction_workers) can run them.
+class ExtractionJob(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    # Short text queries are claimed before bulk PDF extractions
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BULK = 1
+    PRIORITY_CHOICES = [
+        (PRIORITY_INTERACTIVE, "Interactive"),
+        (PRIORITY_BULK, "Bulk"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_key = models.CharField(max_length=40, blank=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+
+    query = models.TextField(blank=True)
+    pdf_path = models.CharField(max_length=500, blank=True)
+    # The browser's IANA timezone, for relative dates; empty means LLM_TIMEZONE
+    user_timezone = models.CharField(max_length=64, blank=True)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    # Fair scheduling (see home/jobs.py): the user or session the job is charged to, its
+    # estimated LLM tokens, and its finish tag in the owner-fair virtual clock
+    owner = models.CharField(max_length=64, blank=True, db_index=True)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_INTERACTIVE)
+    estimated_tokens = models.PositiveIntegerField(default=0)
+    virtual_finish = models.FloatField(default=0.0)
+
+    result = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+
+    # Bumped on every change, so streams and long polls only need to compare one integer
+    version = models.PositiveIntegerField(default=0)
+    progress = models.JSONField(default=dict, blank=True)
+    partial_events = models.JSONField(default=list, blank=True)
+
+    # Per-stage time, calls, tokens and cost of the last attempt (see home/llm/metrics.py)
+    metrics = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["status", "priority", "virtual_finish"]),
+        ]
+
+    def __str__(self):
+        return f"ExtractionJob {self.id} ({self.status})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": str(self.id),
+            "status": self.status,
+            "attempts": self.attempts,
+            "processing": not self.is_finished,
+            "suggested_events": self.result,
+            "partial_events": self.partial_events,
+            "progress": self.progress,
+            "version": self.version,
+            "metrics": self.metrics,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+# A user's Google calendar, mirrored locally by home/calendar_sync.py. sync_token is the
+# nextSyncToken of the last events sync, so the next one only asks Google for changes.
+class SyncedCalendar(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="synced_calendars")
+    calendar_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, blank=True)
+    color = models.CharField(max_length=16, default="#3788d8")
+    primary = models.BooleanField(default=False)
+    sync_token = models.TextField(blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "calendar_id"], name="unique_synced_calendar"),
+        ]
+
+    def __str__(self):
+        return f"{self.name or self.calendar_id} ({self.user})"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.calendar_id,
+            "name": self.name,
+            "color": self.color,
+        }
+
+
+# One event of a SyncedCalendar. start and end keep Google's dateTime or (all-day) date
+# string; start_at and end_at are the parsed values the index view filters and sorts on.
+class CalendarEvent(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="calendar_events")
+    calendar_id = models.CharField(max_length=255)
+    google_event_id = models.CharField(max_length=1024)
+
+    summary = models.TextField(blank=True)
+    start = models.CharField(max_length=64)
+    end = models.CharField(max_length=64)
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+    location = models.TextField(blank=True)
+    description = models.TextField(blank=True)
+    creator = models.CharField(max_length=254, blank=True)
+    html_link = models.URLField(max_length=1000, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["start_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "calendar_id", "google_event_id"], name="unique_calendar_event"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "calendar_id", "start_at"]),
+            models.Index(fields=["user", "end_at", "start_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.summary} ({self.start})"
+
+    # Same shape as the events the index template has always received from the API
+    def to_dict(self, color: str = "#3788d8") -> dict:
+        return {
+            "summary": self.summary,
+            "start": self.start,
+            "end": self.end,
+            "location": self.location,
+            "description": self.description,
+            "creator": self.creator,
+            "calendarId": self.calendar_id,
+            "backgroundColor": color,
+            "htmlLink": self.html_link,
+            "googleEventId": self.google_event_id,
+        }
+
+
+# Large text (extracted PDF text) stored once per distinct content, keyed by its SHA-256
+# and zlib-compressed above COMPRESS_MIN_BYTES
+class TextBlob(models.Model):
+    COMPRESS_MIN_BYTES = 1024
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    compressed = models.BooleanField(default=False)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"TextBlob {self.digest[:12]} ({self.size} bytes)"
+
+    @classmethod
+    def store(cls, text: str) -> "TextBlob":
+        raw = text.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        compressed = len(raw) >= cls.COMPRESS_MIN_BYTES
+        blob, _ = cls.objects.get_or_create(
+            digest=digest,
+            defaults={
+                "data": zlib.compress(raw) if compressed else raw,
+                "compressed": compressed,
+                "size": len(raw),
+            }
+        )
+        return blob
+
+    @property
+    def text(self) -> str:
+        raw = bytes(self.data)
+        return (zlib.decompress(raw) if self.compressed else raw).decode("utf-8")
+
+
+# One query in the chat history. Guests' turns belong to their session, signed-in users'
+# turns to the user. Suggestions are the result of the turn's extraction job; the full
+# file text is only loaded on request, the history lists file_preview.
+class ChatTurn(models.Model):
+    PREVIEW_LENGTH = 300
+
+    session_key = models.CharField(max_length=40, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    query = models.TextField(blank=True)
+    job = models.ForeignKey(ExtractionJob, null=True, blank=True, on_delete=models.SET_NULL)
+    file_text = models.ForeignKey(TextBlob, null=True, blank=True, on_delete=models.PROTECT)
+    file_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["session_key", "created_at"]),
+            models.Index(fields=["user", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"ChatTurn {self.id} ({self.query[:40]})"
+
+    def set_file_text(self, text: str) -> None:
+        self.file_text = TextBlob.store(text) if text else None
+        self.file_preview = text[:self.PREVIEW_LENGTH]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "query": self.query,
+            "file_text": self.file_preview,
+            "has_file": self.file_text_id is not None,
+            "job_id": str(self.job_id) if self.job_id else None,
+            "status": self.job.status if self.job is not None else None,
+            "suggested_events": self.job.result if self.job is not None else [],
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+# Scheduling state of one job owner (see home/jobs.py). enqueue_job locks the owner's
+# row, so the admission check, finish tag and insert of concurrent enqueues by the same
+# owner happen one after another
+class ExtractionOwner(models.Model):
+    owner = models.CharField(max_length=64, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ExtractionOwner {self.owner}"
+
+
+# The metrics registry of a process that runs extraction workers outside the web
+# processes (run_extraction_workers), flushed periodically so /metrics/ can include it
+class MetricsSnapshot(models.Model):
+    process = models.CharField(max_length=255, unique=True)
+    values = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"MetricsSnapshot {self.process}"
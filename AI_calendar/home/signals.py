@@ -1,7 +1,8 @@
 # home/signals.py
-from allauth.socialaccount.signals import social_account_added
+from allauth.socialaccount.signals import social_account_added, social_account_updated
 from allauth.socialaccount.models import SocialToken
 from django.dispatch import receiver
+from home.google_services import get_service_pool
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,3 +17,10 @@ def fetch_and_log_token(sender, request, sociallogin, **kwargs):
         logger.debug(f" Token found: {token.token}")
     except SocialToken.DoesNotExist:
         logger.error(f" No token found for account: {account}")
+
+
+# A new sign-in brings new tokens; drop the pooled credentials built from the old ones
+@receiver(social_account_added)
+@receiver(social_account_updated)
+def reset_pooled_credentials(sender, request, sociallogin, **kwargs):
+    get_service_pool().invalidate(sociallogin.account.user)
@@ -1,3 +1,1536 @@
-from django.test import TestCase
+import os
+import asyncio
+import json
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import email
+import tempfile
+import threading
+import time
+import sqlite3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from contextlib import nullcontext
+from unittest.mock import patch
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from asgiref.sync import sync_to_async
+import httplib2
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.db.models import F
+from googleapiclient.discovery import build
+from home.calendar_sync import sync_user_calendars, load_events, is_sync_due, store_event, remove_event
+from home.google_services import CalendarServicePool
+from home.models import SyncedCalendar, CalendarEvent, ChatTurn, TextBlob, ExtractionJob, MetricsSnapshot
+from home.worker_metrics import MetricsFlusher, process_name
+from home.llm.backend import OpenAIBackend, RecordingBackend, ReplayBackend, CassetteMiss, Checkpoint, LLMResponse, get_default_backend
+from home.llm.event_llm import EventExtraction, APICaller, EventWrapper, Event, EventTime, ExtractInfo
+from home.llm.cache import ResponseCache
+from home.llm.event_filter import EventFilter
+from home.llm.dedup import EventDeduplicator
+from home.llm.prefilter import TemporalPrefilter
+from home.llm.chunker import TextChunker, estimate_tokens
+from home.llm.pdf_ingest import iter_pdf_pages, get_pool, discard_pool
+from home.llm.page_store import PageStore
+from home.llm.router import ModelRouter
+from home.llm.fast_path import FastPathParser
+from home.llm.metrics import get_registry, MetricsRegistry
+from home.llm.rate_limit import RateLimiter
+from home.llm.resilience import CircuitOpen, CircuitBreaker, BackendHealth, ResilientBackend
+from openai import InternalServerError
+from home.llm.benchmark import make_pdf
+from home.jobs import run_job, get_coalescer, enqueue_job, claim_next_job, requeue_stale_jobs, complete_job, retry_or_fail, Heartbeat, QueueFull
+from home.llm.stub_server import StubOpenAIServer
+from allauth.socialaccount.models import SocialAccount, SocialToken
 
 # Create your tests here.
+
+
+# Minimal stand-in for the Calendar API: calendarList, events.list with syncToken and
+# nextPageToken, events.insert/delete, and multipart batch requests. Every change to an event bumps a global revision; a sync token is the
+# revision it was issued at, so a delta is every event changed after it.
+class FakeCalendarServer:
+    def __init__(self, page_size: int = 2):
+        self.page_size = page_size
+        self.calendars = {}
+        self.revision = 0
+        self.expired_tokens = set()
+        self.requests = []
+        self.batches = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/calendar/v3/"
+
+    @property
+    def batch_uri(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/batch"
+
+    def add_calendar(self, calendar_id: str, summary: str, primary: bool = False) -> None:
+        self.calendars[calendar_id] = {"summary": summary, "primary": primary, "events": {}}
+
+    def put_event(self, calendar_id: str, event_id: str, summary: str, start: str, end: str, status: str = "confirmed") -> None:
+        self.revision += 1
+        self.calendars[calendar_id]["events"][event_id] = {
+            "id": event_id,
+            "status": status,
+            "summary": summary,
+            "start": {"dateTime": start},
+            "end": {"dateTime": end},
+            "revision": self.revision,
+        }
+
+    def cancel_event(self, calendar_id: str, event_id: str) -> None:
+        event = self.calendars[calendar_id]["events"][event_id]
+        self.put_event(calendar_id, event_id, event["summary"], event["start"]["dateTime"], event["end"]["dateTime"], "cancelled")
+
+    def list_calendars(self, query: dict) -> tuple[int, dict]:
+        items = [
+            {"id": calendar_id, "summary": calendar["summary"], "primary": calendar["primary"], "backgroundColor": "#123456"}
+            for calendar_id, calendar in self.calendars.items()
+        ]
+        return 200, {"items": items}
+
+    def list_events(self, calendar_id: str, query: dict) -> tuple[int, dict]:
+        sync_token = query.get("syncToken", [""])[0]
+        if sync_token in self.expired_tokens:
+            return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+
+        events = sorted(self.calendars[calendar_id]["events"].values(), key=lambda event: event["revision"])
+        if sync_token:
+            since = int(sync_token)
+            events = [event for event in events if event["revision"] > since]
+        else:
+            # A full listing leaves out cancelled events
+            events = [event for event in events if event["status"] != "cancelled"]
+
+        offset = int(query.get("pageToken", ["0"])[0])
+        page = events[offset:offset + self.page_size]
+        body = {"items": [{k: v for k, v in event.items() if k != "revision"} for event in page]}
+        if offset + self.page_size < len(events):
+            body["nextPageToken"] = str(offset + self.page_size)
+        else:
+            body["nextSyncToken"] = str(self.revision)
+        return 200, body
+
+    def insert_event(self, calendar_id: str, body: dict) -> tuple[int, dict]:
+        if calendar_id == "primary":
+            calendar_id = next(cid for cid, calendar in self.calendars.items() if calendar["primary"])
+        event_id = f"n{self.revision + 1}"
+        self.put_event(calendar_id, event_id, body["summary"], body["start"]["dateTime"], body["end"]["dateTime"])
+        event = dict(self.calendars[calendar_id]["events"][event_id])
+        del event["revision"]
+        event["htmlLink"] = f"https://calendar.example.com/{event_id}"
+        return 200, event
+
+    def delete_event(self, calendar_id: str, event_id: str) -> tuple[int, dict]:
+        events = self.calendars.get(calendar_id, {}).get("events", {})
+        if event_id not in events or events[event_id]["status"] == "cancelled":
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        self.cancel_event(calendar_id, event_id)
+        return 204, None
+
+    # Serves one API call, sent directly or as a part of a batch
+    def dispatch(self, method: str, target: str, body: bytes) -> tuple[int, dict | None]:
+        url = urlparse(target)
+        query = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        self.requests.append((method, url.path, query))
+
+        if method == "GET" and parts[2:] == ["users", "me", "calendarList"]:
+            return self.list_calendars(query)
+        if len(parts) >= 5 and parts[2] == "calendars" and parts[4] == "events":
+            if method == "GET" and len(parts) == 5:
+                return self.list_events(parts[3], query)
+            if method == "POST" and len(parts) == 5:
+                return self.insert_event(parts[3], json.loads(body))
+            if method == "DELETE" and len(parts) == 6:
+                return self.delete_event(parts[3], parts[5])
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    # multipart/mixed batch: every part is an HTTP request, answered by a part with the
+    # Content-ID "response-<request Content-ID>"
+    def dispatch_batch(self, content_type: str, body: bytes) -> tuple[bytes, str]:
+        self.batches += 1
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        boundary = "fake_batch_boundary"
+        out = []
+        for part in message.get_payload():
+            head, _, inner_body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+            method, target, _ = head.split("\n")[0].split(" ")
+            status, result = self.dispatch(method, target, inner_body.encode())
+            content = "" if result is None else json.dumps(result)
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} Fake\r\nContent-Type: application/json\r\n\r\n{content}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return "".join(out).encode(), f"multipart/mixed; boundary={boundary}"
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self, method: str):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == "/batch":
+                    data, content_type = fake.dispatch_batch(self.headers["Content-Type"], body)
+                    status = 200
+                else:
+                    status, result = fake.dispatch(method, self.path, body)
+                    data = b"" if result is None else json.dumps(result).encode()
+                    content_type = "application/json"
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_DELETE(self):
+                self.handle_request("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakeCalendarTestCase(TestCase):
+    def setUp(self):
+        self.fake = FakeCalendarServer()
+        self.fake.add_calendar("me@example.com", "Me", primary=True)
+        self.fake.add_calendar("team@example.com", "Team")
+        for i in range(5):
+            self.fake.put_event("me@example.com", f"e{i}", f"Event {i}", f"2099-01-0{i + 1}T10:00:00-05:00", f"2099-01-0{i + 1}T11:00:00-05:00")
+        self.fake.put_event("team@example.com", "t0", "Standup", "2099-01-02T09:00:00-05:00", "2099-01-02T09:15:00-05:00")
+        self.fake.start()
+
+        self.service = build(
+            "calendar", "v3",
+            http=httplib2.Http(),
+            static_discovery=True,
+            client_options={"api_endpoint": self.fake.endpoint}
+        )
+        self.user = User.objects.create_user("alice", "alice@example.com", "password")
+
+        settings_override = override_settings(GOOGLE_BATCH_URI=self.fake.batch_uri)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def event_requests(self) -> list[dict]:
+        return [query for method, path, query in self.fake.requests if method == "GET" and path.endswith("/events")]
+
+
+class CalendarSyncTests(FakeCalendarTestCase):
+
+    def test_full_sync_follows_pages_and_stores_tokens(self):
+        sync_user_calendars(self.service, self.user)
+
+        events, calendars = load_events(self.user)
+        self.assertEqual([c["id"] for c in calendars], ["me@example.com", "team@example.com"])
+        self.assertEqual(
+            [e["summary"] for e in events],
+            ["Event 0", "Standup", "Event 1", "Event 2", "Event 3", "Event 4"]
+        )
+        self.assertEqual(events[1]["backgroundColor"], "#123456")
+
+        # 5 events at 2 per page take 3 listings, the team calendar 1; both calendars share
+        # the first batch, so there are 3 round trips
+        self.assertEqual(len(self.event_requests()), 4)
+        self.assertEqual(self.fake.batches, 3)
+        self.assertTrue(all("syncToken" not in query for query in self.event_requests()))
+        self.assertEqual(
+            set(SyncedCalendar.objects.values_list("sync_token", flat=True)), {str(self.fake.revision)}
+        )
+        self.assertFalse(is_sync_due(self.user))
+
+    def test_incremental_sync_applies_only_changes(self):
+        sync_user_calendars(self.service, self.user)
+        token = str(self.fake.revision)
+        self.fake.requests.clear()
+
+        self.fake.put_event("me@example.com", "e1", "Event 1 moved", "2099-02-01T10:00:00-05:00", "2099-02-01T11:00:00-05:00")
+        self.fake.cancel_event("me@example.com", "e2")
+        self.fake.put_event("me@example.com", "e9", "New event", "2099-01-01T08:00:00-05:00", "2099-01-01T09:00:00-05:00")
+        sync_user_calendars(self.service, self.user)
+
+        for query in self.event_requests():
+            self.assertEqual(query["syncToken"], [token])
+        events, _ = load_events(self.user)
+        self.assertEqual(
+            [e["summary"] for e in events],
+            ["New event", "Event 0", "Standup", "Event 3", "Event 4", "Event 1 moved"]
+        )
+        self.assertEqual(CalendarEvent.objects.filter(user=self.user).count(), 6)
+
+    def test_expired_sync_token_falls_back_to_full_sync(self):
+        sync_user_calendars(self.service, self.user)
+        self.fake.expired_tokens.add(str(self.fake.revision))
+        self.fake.cancel_event("me@example.com", "e0")
+        self.fake.requests.clear()
+
+        sync_user_calendars(self.service, self.user)
+
+        queries = self.event_requests()
+        self.assertIn("syncToken", queries[0])
+        self.assertTrue(any("timeMin" in query for query in queries[2:]))
+        events, _ = load_events(self.user)
+        self.assertNotIn("Event 0", [e["summary"] for e in events])
+        self.assertEqual(len(events), 5)
+
+    def test_write_through_resolves_primary_calendar(self):
+        sync_user_calendars(self.service, self.user)
+
+        store_event(self.user, "primary", {
+            "id": "new",
+            "summary": "Added",
+            "start": {"dateTime": "2099-03-01T10:00:00-05:00"},
+            "end": {"dateTime": "2099-03-01T11:00:00-05:00"},
+        })
+        self.assertTrue(CalendarEvent.objects.filter(calendar_id="me@example.com", google_event_id="new").exists())
+
+        remove_event(self.user, "primary", "new")
+        self.assertFalse(CalendarEvent.objects.filter(google_event_id="new").exists())
+
+
+class BulkCalendarViewTests(FakeCalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        sync_user_calendars(self.service, self.user)
+        self.client.force_login(self.user)
+        patcher = patch("home.views.calendar_service", side_effect=lambda user: nullcontext(self.service))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_json(self, url: str, body: dict):
+        return self.client.post(url, json.dumps(body), content_type="application/json")
+
+    def test_bulk_add_reports_each_event(self):
+        self.fake.batches = 0
+        events = [
+            {"title": f"Suggested {i}", "start": f"2099-04-{i + 1:02d}T10:00:00", "end": f"2099-04-{i + 1:02d}T11:00:00"}
+            for i in range(3)
+        ]
+        events.insert(1, {"title": "No times"})
+
+        response = self.post_json("/add-events/", {"events": events}).json()
+
+        self.assertEqual(response["added"], 3)
+        self.assertEqual([r["ok"] for r in response["results"]], [True, False, True, True])
+        self.assertIn("Missing required fields", response["results"][1]["error"])
+        self.assertEqual(self.fake.batches, 1)
+        self.assertEqual(
+            CalendarEvent.objects.filter(calendar_id="me@example.com", summary__startswith="Suggested").count(), 3
+        )
+
+    def test_bulk_delete_reports_each_event(self):
+        self.fake.batches = 0
+        response = self.post_json("/delete-events/", {"events": [
+            {"eventId": "e0", "calendarId": "me@example.com"},
+            {"eventId": "missing", "calendarId": "me@example.com"},
+            {"eventId": "t0", "calendarId": "team@example.com"},
+        ]}).json()
+
+        self.assertEqual(response["deleted"], 2)
+        self.assertEqual([r["ok"] for r in response["results"]], [True, False, True])
+        self.assertTrue(response["results"][1]["error"].startswith("404"))
+        self.assertEqual(self.fake.batches, 1)
+        self.assertFalse(CalendarEvent.objects.filter(google_event_id__in=["e0", "t0"]).exists())
+
+    def test_malformed_bulk_payloads_are_rejected(self):
+        for url in ("/add-events/", "/delete-events/"):
+            for body in ({"events": {"a": 1}}, {"events": "e0"}, ["e0"]):
+                self.assertEqual(self.post_json(url, body).status_code, 400)
+
+        response = self.post_json("/add-events/", {"events": [
+            "x", {"title": "Suggested", "start": "2099-04-01T10:00:00", "end": "2099-04-01T11:00:00"}
+        ]}).json()
+        self.assertEqual([r["ok"] for r in response["results"]], [False, True])
+        self.assertEqual(response["results"][0]["error"], "Expected an event object")
+
+        response = self.post_json("/delete-events/", {"events": [["e0"], {"eventId": "e0", "calendarId": "me@example.com"}]}).json()
+        self.assertEqual([r["ok"] for r in response["results"]], [False, True])
+        self.assertEqual(response["deleted"], 1)
+
+
+# The single-event views and the index page are async; the test client runs them through
+# async_to_sync, the async client on its own event loop
+class AsyncCalendarViewTests(FakeCalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        patcher = patch("home.views.calendar_service", side_effect=lambda user: nullcontext(self.service))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_index_syncs_and_renders_the_mirror(self):
+        response = self.client.get("/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["events"]), 6)
+        self.assertFalse(is_sync_due(self.user))
+
+    async def test_add_and_delete_one_event(self):
+        await sync_to_async(sync_user_calendars)(self.service, self.user)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post("/add-event/", {
+            "title": "Office hours", "start": "2099-05-01T10:00:00", "end": "2099-05-01T11:00:00"
+        })
+        event_id = response.json()["eventId"]
+        self.assertTrue(await CalendarEvent.objects.filter(google_event_id=event_id).aexists())
+
+        response = await self.async_client.post(
+            "/delete-event/", json.dumps({"eventId": event_id, "calendarId": "me@example.com"}), content_type="application/json"
+        )
+        self.assertEqual(response.json(), {"message": "Event deleted"})
+        self.assertFalse(await CalendarEvent.objects.filter(google_event_id=event_id).aexists())
+
+    async def test_guests_cannot_change_calendars(self):
+        response = await self.async_client_class().post("/add-event/", {"title": "x"})
+        self.assertEqual(response.status_code, 403)
+
+
+class CalendarServicePoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bob", "bob@example.com", "password")
+        account = SocialAccount.objects.create(user=self.user, provider="google", uid="123")
+        self.token = SocialToken.objects.create(account=account, token="access-1", token_secret="refresh-1")
+        self.pool = CalendarServicePool(max_users=1)
+
+    def test_second_request_reuses_service_without_queries(self):
+        with self.pool.service(self.user) as first:
+            pass
+        with self.assertNumQueries(0):
+            with self.pool.service(self.user) as second:
+                pass
+
+        self.assertIs(first, second)
+        stats = self.pool.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["builds"]), (1, 1, 1))
+
+    def test_refreshed_token_is_written_back(self):
+        with self.pool.service(self.user) as service:
+            # What google-auth does to the shared Credentials when it refreshes
+            service._http.credentials.token = "access-2"
+
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.token, "access-2")
+        self.assertEqual(self.pool.get_stats()["tokens_written_back"], 1)
+
+    def test_least_recently_used_user_is_evicted(self):
+        other = User.objects.create_user("carol", "carol@example.com", "password")
+        account = SocialAccount.objects.create(user=other, provider="google", uid="456")
+        SocialToken.objects.create(account=account, token="access-3", token_secret="refresh-3")
+
+        with self.pool.service(self.user):
+            pass
+        with self.pool.service(other):
+            pass
+
+        stats = self.pool.get_stats()
+        self.assertEqual((stats["users"], stats["evictions"]), (1, 1))
+
+    def test_missing_token_raises(self):
+        SocialToken.objects.all().delete()
+        with self.assertRaises(SocialToken.DoesNotExist):
+            with self.pool.service(self.user):
+                pass
+
+
+class ChatHistoryTests(TestCase):
+    def test_large_text_is_compressed_and_stored_once(self):
+        text = "Week 5: Midterm on March 3rd at 2pm. " * 200
+        turns = []
+        for query in ("first", "second"):
+            turn = ChatTurn(session_key="s", query=query)
+            turn.set_file_text(text)
+            turn.save()
+            turns.append(turn)
+
+        self.assertEqual(TextBlob.objects.count(), 1)
+        blob = TextBlob.objects.get()
+        self.assertTrue(blob.compressed)
+        self.assertLess(len(bytes(blob.data)), blob.size // 10)
+        self.assertEqual(blob.text, text)
+        self.assertEqual(turns[0].file_preview, text[:ChatTurn.PREVIEW_LENGTH])
+
+    def test_history_is_paginated_newest_first_and_kept_out_of_the_session(self):
+        user = User.objects.create_user("dana", "dana@example.com", "password")
+        self.client.force_login(user)
+        for i in range(5):
+            job = ExtractionJob.objects.create(query=f"q{i}", result=[{"title": f"event {i}"}])
+            ChatTurn.objects.create(user=user, query=f"q{i}", job=job)
+
+        first = self.client.get("/chat-history/?page_size=2").json()
+        last = self.client.get("/chat-history/?page_size=2&page=3").json()
+
+        self.assertEqual([t["query"] for t in first["history"]], ["q3", "q4"])
+        self.assertEqual(first["history"][1]["suggested_events"], [{"title": "event 4"}])
+        self.assertTrue(first["has_more"])
+        self.assertEqual([t["query"] for t in last["history"]], ["q0"])
+        self.assertFalse(last["has_more"])
+        self.assertNotIn("chat_history", self.client.session.keys())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = ResponseCache(self.path, ttl=0.2)
+        cache.set("key", '{"events": []}')
+        self.assertEqual(cache.get("key"), '{"events": []}')
+        self.assertEqual(ResponseCache(self.path, ttl=0.2).get("key"), '{"events": []}')
+
+        time.sleep(0.3)
+        self.assertIsNone(cache.get("key"))
+        self.assertIsNone(ResponseCache(self.path, ttl=0.2).get("key"))
+        self.assertEqual(cache.get_stats()["misses"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.path, memory_entries=2, max_bytes=250)
+        cache.set("a", "a" * 100)
+        cache.set("b", "b" * 100)
+        # A hit from another process's cache makes "a" the most recently used on disk too
+        time.sleep(0.01)
+        self.assertEqual(ResponseCache(self.path).get("a"), "a" * 100)
+        time.sleep(0.01)
+        cache.set("c", "c" * 100)
+
+        self.assertEqual(cache.get_stats()["memory_entries"], 2)
+        reader = ResponseCache(self.path)
+        self.assertIsNone(reader.get("b"))
+        self.assertEqual(reader.get("a"), "a" * 100)
+        self.assertEqual(reader.get("c"), "c" * 100)
+        # Adding "c" pushed "a", the oldest entry here, out of the memory tier
+        self.assertEqual(cache.get("a"), "a" * 100)
+        self.assertEqual(cache.get_stats()["disk_hits"], 1)
+
+    async def test_async_access_keeps_sqlite_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+        connect = sqlite3.connect
+
+        def tracking_connect(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return connect(*args, **kwargs)
+
+        cache = ResponseCache(self.path)
+        reader = ResponseCache(self.path)
+        with patch("home.llm.cache.sqlite3.connect", tracking_connect):
+            await cache.set_async("key", '{"events": []}')
+            self.assertEqual(await reader.get_async("key"), '{"events": []}')
+            self.assertEqual(await cache.get_async("key"), '{"events": []}')
+
+        # One write and one disk read; the memory hit needs no connection
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0", "LLM_NOW": "2025-01-06T09:00:00-05:00"})
+class RecordReplayTests(TestCase):
+    text = "Midterm on March 3rd at 2pm in Room 101. Final exam on May 5th at 9am."
+
+    def setUp(self):
+        self.stub = StubOpenAIServer().start()
+        self.addCleanup(self.stub.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cassette_path = os.path.join(directory.name, "cassette.json")
+
+    def test_replay_returns_recorded_events_without_calling_the_server(self):
+        recorder = RecordingBackend(OpenAIBackend(api_key="stub", base_url=self.stub.base_url), self.cassette_path)
+        recorded = EventExtraction(backend=recorder).extract(None, self.text)
+        calls = self.stub.request_count
+
+        replay = EventExtraction(backend=ReplayBackend(self.cassette_path))
+        replayed = replay.extract(None, self.text)
+
+        self.assertGreater(calls, 0)
+        self.assertEqual(self.stub.request_count, calls)
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replay.get_usage()["calls"], calls)
+
+    def test_unrecorded_request_raises(self):
+        with self.assertRaises(CassetteMiss):
+            EventExtraction(backend=ReplayBackend(self.cassette_path)).extract(None, self.text)
+
+    async def test_guest_extractions_share_one_client_on_the_event_loop(self):
+        with patch.dict(os.environ, {"LLM_BACKEND": "openai", "OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": self.stub.base_url}):
+            self.assertIs(get_default_backend(), get_default_backend())
+            responses = await asyncio.gather(*(
+                self.async_client.post("/guest-ai-query/", {"query": self.text}) for _ in range(5)
+            ))
+
+        counts = [len(response.json()["events"]) for response in responses]
+        self.assertGreater(counts[0], 0)
+        self.assertEqual(counts, [counts[0]] * 5)
+        self.assertEqual(self.stub.request_count, 5)
+
+
+@patch.dict(os.environ, {
+    "LLM_CACHE_ENABLED": "0",
+    "PAGE_STORE_ENABLED": "0",
+    "LLM_NOW": "2025-01-06T09:00:00-05:00",
+    "LLM_BACKEND": "openai",
+    "OPENAI_API_KEY": "stub",
+})
+# Jobs publish progress from worker threads, which need committed rows
+class ExtractionMetricsTests(TransactionTestCase):
+    def setUp(self):
+        self.stub = StubOpenAIServer().start()
+        self.addCleanup(self.stub.stop)
+        get_registry().clear()
+
+    def test_stages_record_calls_tokens_and_retries(self):
+        self.stub.fail_next = 1
+        backend = OpenAIBackend(api_key="stub", base_url=self.stub.base_url)
+        extractor = EventExtraction(high_precision=True, backend=backend, fast_path=False)
+        extractor.extract(None, "Midterm on March 3rd at 2pm in Room 101.")
+
+        metrics = extractor.get_metrics()
+        stages = metrics["stages"]
+        self.assertEqual(
+            {"chunking", "get_time", "get_location", "get_description", "get_title", "dedup"},
+            set(stages)
+        )
+        self.assertEqual(stages["get_time"]["calls"], 1)
+        self.assertEqual(stages["get_time"]["models"], {"gpt-4o-mini-2024-07-18": 1})
+        self.assertEqual(metrics["total"]["retries"], 1)
+        self.assertEqual(metrics["total"]["calls"], self.stub.request_count - 1)
+        self.assertGreater(metrics["total"]["prompt_tokens"], 0)
+        self.assertGreater(metrics["total"]["cost_usd"], 0)
+
+    def test_job_keeps_its_summary_and_metrics_endpoint_reports_totals(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pdf_path = os.path.join(directory.name, "syllabus.pdf")
+        make_pdf(pdf_path, ["Midterm on March 3rd at 2pm in Room 101."])
+        job = ExtractionJob.objects.create(pdf_path=pdf_path, status=ExtractionJob.STATUS_RUNNING, attempts=1)
+
+        with patch.dict(os.environ, {"OPENAI_BASE_URL": self.stub.base_url}):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.metrics["total"]["calls"], 1)
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        body = response.content.decode()
+        self.assertIn('extraction_jobs_total{status="succeeded"} 1', body)
+        self.assertIn('extraction_stage_calls_total{model="gpt-4o-mini-2024-07-18",stage="get_full_event"} 1', body)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_adds_the_worker_processes(self):
+        worker = MetricsRegistry()
+        worker.increment("extraction_jobs_total", 2, status="succeeded")
+        worker.set("extraction_coalescing_ratio", 0.5)
+        MetricsSnapshot.objects.create(process="worker-host:42", values=worker.snapshot())
+
+        get_registry().increment("extraction_jobs_total", 1, status="succeeded")
+        # The web process's own snapshot is not counted twice
+        flusher = MetricsFlusher(interval=60)
+        flusher.start()
+        flusher.stop()
+        self.assertTrue(MetricsSnapshot.objects.filter(process=process_name()).exists())
+
+        body = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        self.assertIn('extraction_jobs_total{status="succeeded"} 3', body)
+        self.assertIn('extraction_coalescing_ratio{process="worker-host:42"} 0.5', body)
+
+    def test_identical_concurrent_jobs_share_one_extraction(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.stub.latency = 0.5
+        jobs = []
+        for i in range(3):
+            pdf_path = os.path.join(directory.name, f"upload{i}.pdf")
+            make_pdf(pdf_path, ["Midterm on March 3rd at 2pm in Room 101."])
+            jobs.append(ExtractionJob.objects.create(
+                pdf_path=pdf_path, status=ExtractionJob.STATUS_RUNNING, attempts=1, locked_by=f"worker{i}"
+            ))
+
+        with patch.dict(os.environ, {"OPENAI_BASE_URL": self.stub.base_url}):
+            leader = threading.Thread(target=run_job, args=(jobs[0],))
+            leader.start()
+            while get_coalescer().in_flight() == 0:
+                time.sleep(0.01)
+            # Followers return at once and are finished by the leader
+            run_job(jobs[1])
+            run_job(jobs[2])
+            leader.join()
+
+        for job in jobs:
+            job.refresh_from_db()
+        self.assertEqual([job.status for job in jobs], [ExtractionJob.STATUS_SUCCEEDED] * 3)
+        self.assertEqual(self.stub.request_count, 1)
+        self.assertGreater(len(jobs[0].result), 0)
+        self.assertEqual(jobs[1].result, jobs[0].result)
+        self.assertEqual(jobs[2].partial_events, jobs[0].result)
+        self.assertEqual(jobs[2].metrics, {"coalesced_with": str(jobs[0].id)})
+        self.assertEqual(get_coalescer().in_flight(), 0)
+        self.assertAlmostEqual(get_registry().get("extraction_coalescing_ratio"), 2 / 3)
+
+
+# Answers every request for a model with that model's canned content
+# The job endpoints poll the table from the async views, so updates have to be committed
+@override_settings(EXTRACTION_RUN_IN_PROCESS=False, JOB_STREAM_INTERVAL=0.05, JOB_LONG_POLL_TIMEOUT=0.5)
+class JobPushTests(TransactionTestCase):
+    def setUp(self):
+        self.job = ExtractionJob.objects.create(query="Dentist tomorrow at 3pm", status=ExtractionJob.STATUS_RUNNING)
+
+    def update_later(self, delay: float, **fields):
+        async def update():
+            await asyncio.sleep(delay)
+            await ExtractionJob.objects.filter(id=self.job.id).aupdate(version=F("version") + 1, **fields)
+        return asyncio.ensure_future(update())
+
+    async def test_long_poll_returns_on_change_or_timeout(self):
+        url = f"/jobs/{self.job.id}/?version={self.job.version}"
+
+        started = time.monotonic()
+        response = await self.async_client.get(url)
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+        self.assertEqual(response.json()["version"], self.job.version)
+
+        update = self.update_later(0.1, progress={"done": 1, "queued": 2})
+        started = time.monotonic()
+        response = await self.async_client.get(url)
+        await update
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(response.json()["version"], self.job.version + 1)
+        self.assertEqual(response.json()["progress"], {"done": 1, "queued": 2})
+
+    async def test_event_stream_pushes_every_change_until_the_job_finishes(self):
+        response = await self.async_client.get(f"/jobs/{self.job.id}/events/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        updates = [
+            self.update_later(0.1, partial_events=[{"title": "Dentist"}]),
+            self.update_later(0.3, status=ExtractionJob.STATUS_SUCCEEDED, result=[{"title": "Dentist"}]),
+        ]
+        messages = [message.decode() async for message in response.streaming_content]
+        await asyncio.gather(*updates)
+
+        statuses = [json.loads(message.split("data: ", 1)[1]) for message in messages if message.startswith("id: ")]
+        self.assertEqual([status["status"] for status in statuses], ["running", "running", "succeeded"])
+        self.assertEqual(statuses[1]["partial_events"], [{"title": "Dentist"}])
+        self.assertEqual(statuses[2]["suggested_events"], [{"title": "Dentist"}])
+        self.assertEqual(messages[-1], f"id: {statuses[2]['version']}\nevent: status\ndata: {json.dumps(statuses[2])}\n\n")
+
+    async def test_other_sessions_jobs_are_not_found(self):
+        await ExtractionJob.objects.filter(id=self.job.id).aupdate(session_key="someone-else")
+        self.assertEqual((await self.async_client.get(f"/jobs/{self.job.id}/")).status_code, 404)
+        self.assertEqual((await self.async_client.get(f"/jobs/{self.job.id}/events/")).status_code, 404)
+
+
+class ScriptedBackend:
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.requests = []
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        self.requests.append(request["model"])
+        return LLMResponse(json.dumps(self.answers[request["model"]]), request["model"], 100, 20)
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        return self.complete(request, key)
+
+
+class CapturingBackend:
+    def __init__(self, answer: dict):
+        self.answer = answer
+        self.requests = []
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        self.requests.append(request)
+        return LLMResponse(json.dumps(self.answer), request["model"], 100, 20)
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        return self.complete(request, key)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0", "LLM_NOW": "2025-01-06T09:41:27.123456-05:00"})
+class PromptLayoutTests(TestCase):
+    text = "Midterm on March 3rd at 2pm in Room 101. Final exam on May 5th at 9am in Room 202. " * 60
+    events = [
+        EventTime(start="2025-03-03T14:00:00", end="2025-03-03T15:00:00"),
+        EventTime(start="2025-05-05T09:00:00", end="2025-05-05T10:00:00"),
+    ]
+    answer = {"start": "2025-03-03T14:00:00", "end": "2025-03-03T15:00:00", "location": "Room 101"}
+
+    def locate(self, caller: APICaller) -> None:
+        for event in self.events:
+            asyncio.run(ExtractInfo.get_location(self.text, event.model_dump_json(), caller))
+
+    def test_calls_of_a_stage_share_everything_up_to_the_event(self):
+        backend = CapturingBackend(self.answer)
+        self.locate(APICaller(cache=None, backend=backend, router=ModelRouter(min_samples=1000)))
+
+        first, second = [request["messages"] for request in backend.requests]
+        self.assertEqual(first[:2], second[:2])
+        self.assertEqual(first[1]["content"], self.text)
+        self.assertTrue(first[0]["content"].endswith("\nToday is 2025-01-06, Monday, UTC-05:00."))
+        self.assertEqual(first[2]["content"], 'Event: {"start":"2025-03-03T14:00:00","end":"2025-03-03T15:00:00"}')
+
+    def test_cached_prompt_tokens_are_recorded_per_stage(self):
+        stub = StubOpenAIServer().start()
+        self.addCleanup(stub.stop)
+        caller = APICaller(cache=None, backend=OpenAIBackend(api_key="stub", base_url=stub.base_url), router=ModelRouter(min_samples=1000))
+        extractor = EventExtraction()
+        extractor.reset_stats()
+        caller.metrics = extractor.metrics
+
+        self.locate(caller)
+
+        stage = extractor.get_metrics()["stages"]["get_location"]
+        self.assertEqual(stage["calls"], 2)
+        self.assertGreater(stage["cached_tokens"], 1024)
+        self.assertEqual(stage["cached_tokens"] + stage["uncached_tokens"], stage["prompt_tokens"])
+        self.assertEqual(caller.get_usage()["cached_tokens"], stage["cached_tokens"])
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+class ModelRoutingTests(TestCase):
+    text = "Midterm on March 3rd at 2pm in Room 101."
+    good = {"events": [{"title": "Midterm", "start": "2025-03-03T14:00:00", "end": "2025-03-03T15:00:00", "location": "Room 101", "description": ""}]}
+    backwards = {"events": [{"title": "Midterm", "start": "2025-03-03T14:00:00", "end": "2025-03-03T13:00:00", "location": "Room 101", "description": ""}]}
+
+    def caller(self, router: ModelRouter, mini_answer: dict) -> tuple[APICaller, ScriptedBackend]:
+        backend = ScriptedBackend({router.mini_model: mini_answer, router.large_model: self.good})
+        return APICaller(cache=None, backend=backend, router=router), backend
+
+    @patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0"})
+    def test_mini_answer_is_kept_when_it_validates(self):
+        router = ModelRouter()
+        caller, backend = self.caller(router, self.good)
+
+        result = caller.get_events("Extract events.", self.text, EventWrapper, stage="get_full_event")
+
+        self.assertEqual(backend.requests, [router.mini_model])
+        self.assertEqual(result.events[0].title, "Midterm")
+
+    @patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0"})
+    def test_invalid_mini_answer_escalates_and_is_recorded(self):
+        router = ModelRouter()
+        caller, backend = self.caller(router, self.backwards)
+        extractor = EventExtraction(backend=backend, prefilter=False)
+        extractor.reset_stats()
+        caller.metrics = extractor.metrics
+
+        result = caller.get_events("Extract events.", self.text, EventWrapper, stage="get_full_event")
+
+        self.assertEqual(backend.requests, [router.mini_model, router.large_model])
+        self.assertEqual(result.events[0].end, "2025-03-03T15:00:00")
+        stage = extractor.get_metrics()["stages"]["get_full_event"]
+        self.assertEqual(stage["escalations"], {"end_before_start": 1})
+        self.assertEqual(stage["routes"], {"cascade": 1})
+
+    @patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0"})
+    def test_tasks_that_keep_escalating_go_straight_to_the_large_model(self):
+        router = ModelRouter(min_samples=3, probe_every=5)
+        caller, backend = self.caller(router, {"events": []})
+        for _ in range(3):
+            caller.get_events("Extract events.", self.text, EventWrapper, stage="get_full_event")
+        backend.requests.clear()
+
+        for _ in range(5):
+            caller.get_events("Extract events.", self.text, EventWrapper, stage="get_full_event")
+
+        # Four direct calls, then one probe through the cascade
+        self.assertEqual(backend.requests, [router.large_model] * 4 + [router.mini_model, router.large_model])
+        self.assertTrue(router.get_stats()["routes"]["get_full_event:small"]["direct_large"])
+
+    def test_empty_filter_result_is_not_a_failure(self):
+        router = ModelRouter()
+        empty = EventWrapper(events=[])
+        self.assertEqual(router.validate_result("get_full_event", self.text, empty), "empty_result")
+        self.assertIsNone(router.validate_result("filter_event", self.text, empty))
+        self.assertIsNone(router.validate_result("get_full_event", "No dates here.", empty))
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+class FastPathTests(TestCase):
+    # A Monday morning in New York
+    now = datetime(2025, 1, 6, 9, 0, tzinfo=ZoneInfo("America/New_York"))
+
+    def test_simple_query_becomes_a_full_event(self):
+        event = FastPathParser().parse("I have a meeting on this thursday at 2pm for 1 hour at Starbucks about the CS 2340 project.", self.now)
+
+        self.assertEqual(event, {
+            "title": "Meeting about the CS 2340 project",
+            "start": "2025-01-09T14:00:00",
+            "end": "2025-01-09T15:00:00",
+            "location": "Starbucks",
+            "description": "",
+        })
+
+    def test_ranges_and_rooms(self):
+        event = FastPathParser().parse("Dentist tomorrow 9:30-10:15am in Room 204", self.now)
+
+        self.assertEqual((event["start"], event["end"], event["location"]), ("2025-01-07T09:30:00", "2025-01-07T10:15:00", "Room 204"))
+
+    def test_ambiguous_queries_are_left_to_the_llm(self):
+        parser = FastPathParser()
+        for query in (
+            "meeting next thursday at 2pm",
+            "gym every monday 6am",
+            "Midterm on March 3rd at 2pm. Final on May 5th at 9am.",
+            "meeting thursday",
+            "Week 5 quiz on friday at 10am",
+        ):
+            self.assertIsNone(parser.parse(query, self.now), query)
+
+    # 02:00 UTC on Tuesday is still Monday evening in Los Angeles
+    @patch.dict(os.environ, {"LLM_NOW": "2025-01-07T02:00:00+00:00", "LLM_BACKEND": "replay", "LLM_CASSETTE": "missing.json"})
+    def test_guest_text_query_is_answered_locally_in_the_browser_timezone(self):
+        get_registry().clear()
+        response = self.client.post("/guest-ai-query/", {"query": "Call mom tomorrow at 7pm", "timezone": "America/Los_Angeles"})
+
+        events = response.json()["events"]
+        self.assertEqual([(e["title"], e["start"]) for e in events], [("Call mom", "2025-01-07T19:00:00")])
+        self.assertEqual(get_registry().get("extraction_fast_path_total", result="hit"), 1)
+
+
+class FilterBackend:
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, request: dict, key: str) -> LLMResponse:
+        self.prompts.append(request["messages"][1]["content"])
+        return LLMResponse(json.dumps({"events": []}), request["model"], 100, 20)
+
+    async def complete_async(self, request: dict, key: str) -> LLMResponse:
+        return self.complete(request, key)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+class EventFilterTests(TestCase):
+    now = datetime(2025, 1, 6, 9, 0)
+    topics = ["graphs", "dynamic programming", "hashing", "sorting", "greedy algorithms"]
+
+    def events(self, count: int = 20) -> list[Event]:
+        return [
+            Event(
+                title=f"Lecture on {self.topics[i % len(self.topics)]}",
+                start=f"2025-01-{6 + i:02d}T10:00:00",
+                end=f"2025-01-{6 + i:02d}T11:00:00",
+                location=f"Room {100 + i}",
+                description="",
+            )
+            for i in range(count)
+        ]
+
+    def test_keyword_and_date_instructions_are_applied_locally(self):
+        event_filter = EventFilter(max_candidates=5)
+
+        decision = event_filter.shortlist("Only keep the lectures on graphs.", self.events(), self.now)
+        self.assertEqual((decision.kind, decision.needs_llm), ("keyword", False))
+        self.assertTrue(all("graphs" in event.title for event in decision.events))
+        self.assertEqual(len(decision.events), 4)
+
+        decision = event_filter.shortlist("events this week", self.events(), self.now)
+        self.assertEqual((decision.kind, decision.needs_llm), ("date", False))
+        self.assertEqual([event.start[:10] for event in decision.events], [f"2025-01-{day:02d}" for day in range(6, 13)])
+
+        decision = event_filter.shortlist("hashing lectures between Jan 10 and Jan 20", self.events(), self.now)
+        self.assertEqual([event.start[:10] for event in decision.events], ["2025-01-13", "2025-01-18"])
+
+    def test_from_and_since_include_the_day_and_after_does_not(self):
+        event_filter = EventFilter()
+        for instruction, first in [
+            ("events from Jan 20", "2025-01-20"), ("since Jan 20", "2025-01-20"), ("after Jan 20", "2025-01-21"),
+        ]:
+            decision = event_filter.shortlist(instruction, self.events(), self.now)
+            self.assertEqual(decision.kind, "date", instruction)
+            self.assertEqual(decision.events[0].start[:10], first, instruction)
+
+    def test_unclear_instructions_send_a_shortlist_to_the_llm(self):
+        event_filter = EventFilter(max_candidates=3)
+
+        decision = event_filter.shortlist("everything except hashing", self.events(), self.now)
+        self.assertEqual((decision.kind, decision.needs_llm), ("llm", True))
+        self.assertEqual(len(decision.events), 3)
+        self.assertTrue(all("hashing" in event.title for event in decision.events))
+
+        # Nothing in the ranking stands out, so the LLM judges every event
+        decision = event_filter.shortlist("the ones about trees", self.events(), self.now)
+        self.assertEqual((decision.kind, len(decision.events)), ("llm", 20))
+
+    @patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "LLM_NOW": "2025-01-06T09:00:00"})
+    def test_only_candidates_reach_filter_event(self):
+        get_registry().clear()
+        backend = FilterBackend()
+        extraction = EventExtraction(backend=backend)
+        extraction.event_filter = EventFilter(max_candidates=3)
+        extraction.reset_stats()
+
+        kept = asyncio.run(extraction.filter_events("Only keep the lectures on sorting.", self.events()))
+        self.assertEqual(len(kept), 4)
+        self.assertEqual(backend.prompts, [])
+
+        asyncio.run(extraction.filter_events("anything but sorting", self.events()))
+        self.assertEqual(len(backend.prompts), 1)
+        self.assertEqual(backend.prompts[0].count("Lecture on"), 3)
+        self.assertEqual(extraction.stats["filter_candidates"], 3)
+        self.assertEqual(get_registry().get("extraction_filter_total", decision="keyword"), 1)
+        self.assertEqual(get_registry().get("extraction_filter_candidates_total", decision="llm"), 3)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0", "LLM_NOW": "2025-01-06T09:00:00-05:00"})
+class TextChunkerTests(TestCase):
+    def test_chunks_fit_the_budget_and_overlap_by_whole_sentences(self):
+        sentences = [f"Sentence number {i} is here." for i in range(10)]
+        chunks = list(TextChunker(max_tokens=20, overlap_tokens=8).iter_chunks(" ".join(sentences)))
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 20)
+        for sentence in sentences:
+            self.assertTrue(any(sentence in chunk for chunk in chunks), sentence)
+        # Each chunk starts with the sentence the previous one ended with
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertTrue(chunk.startswith(previous.split(". ")[-1]))
+
+    def test_long_lines_are_cut_between_words(self):
+        words = [f"word{i}" for i in range(80)]
+        chunks = list(TextChunker(max_tokens=20, overlap_tokens=8).iter_chunks(" ".join(words)))
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 20)
+            self.assertTrue(set(chunk.split()) <= set(words))
+        self.assertEqual([w for chunk in chunks for w in chunk.split()], words)
+
+    def test_page_breaks_start_a_new_chunk_without_overlap(self):
+        text = "Midterm on March 3rd.\fFinal on May 5th."
+        self.assertEqual(list(TextChunker(page_break=True).iter_chunks(text)), ["Midterm on March 3rd.", "Final on May 5th."])
+        self.assertEqual(list(TextChunker().iter_chunks(text)), ["Midterm on March 3rd.\n\nFinal on May 5th."])
+
+        # Pages are read lazily: the first page's chunk comes before the second page is read
+        read = []
+
+        def pages():
+            for page in ["Midterm on March 3rd.", "Final on May 5th."]:
+                read.append(page)
+                yield page
+
+        chunks = TextChunker(page_break=True).iter_chunks(pages())
+        self.assertEqual(next(chunks), "Midterm on March 3rd.")
+        self.assertEqual(len(read), 1)
+
+
+# A process pool whose workers die after the first page range
+class BrokenPool:
+    def __init__(self):
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args) -> Future:
+        self.submitted += 1
+        future = Future()
+        if self.submitted == 1:
+            future.set_result(fn(*args))
+        else:
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        return future
+
+    def shutdown(self, **options) -> None:
+        self.shut_down = True
+
+
+class PdfIngestTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "syllabus.pdf")
+        make_pdf(self.path, [f"Week {i}: lecture {i} on Monday at 10am." for i in range(20)])
+        self.pages = list(iter_pdf_pages(self.path, workers=1))
+
+    def test_short_documents_are_parsed_in_process(self):
+        self.assertEqual(self.pages[3].strip(), "Week 3: lecture 3 on Monday at 10am.")
+        with patch("home.llm.pdf_ingest.get_pool", side_effect=AssertionError("no pool for a short document")):
+            self.assertEqual(list(iter_pdf_pages(self.path, workers=4)), self.pages)
+
+    @patch("home.llm.pdf_ingest.PARALLEL_PAGE_THRESHOLD", 10)
+    def test_long_documents_are_parsed_in_the_pool_in_page_order(self):
+        self.addCleanup(lambda: discard_pool(get_pool(2)))
+        self.assertEqual(list(iter_pdf_pages(self.path, workers=2)), self.pages)
+
+    @patch("home.llm.pdf_ingest.PARALLEL_PAGE_THRESHOLD", 10)
+    def test_broken_pool_falls_back_to_parsing_in_process(self):
+        pool = BrokenPool()
+        with patch("home.llm.pdf_ingest.get_pool", return_value=pool):
+            self.assertEqual(list(iter_pdf_pages(self.path, workers=2)), self.pages)
+        self.assertEqual(pool.submitted, 3)
+        self.assertTrue(pool.shut_down)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "LLM_NOW": "2025-01-06T09:00:00-05:00"})
+class PageStoreTests(TestCase):
+    pages = [
+        "Midterm on March 3rd at 2pm in Room 101.",
+        "Project demo on April 8th at 11am in Lab 2.",
+        "Final exam on May 5th at 9am in Room 202.",
+    ]
+
+    def setUp(self):
+        self.stub = StubOpenAIServer().start()
+        self.addCleanup(self.stub.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store = PageStore(os.path.join(directory.name, "pages.sqlite3"))
+
+    def extract(self, pages: list[str], name: str, timezone: str = None) -> EventExtraction:
+        path = os.path.join(self.directory, name)
+        make_pdf(path, pages)
+        backend = OpenAIBackend(api_key="stub", base_url=self.stub.base_url)
+        extractor = EventExtraction(backend=backend, page_store=self.store, timezone=timezone)
+        extractor.extract_pdf(None, path)
+        return extractor
+
+    def test_reuploaded_and_edited_pdfs_only_extract_new_pages(self):
+        self.extract(self.pages, "v1.pdf")
+        calls = self.stub.request_count
+        self.assertEqual(calls, 3)
+
+        again = self.extract(self.pages, "v1-copy.pdf")
+        self.assertEqual(self.stub.request_count, calls)
+        self.assertEqual(again.get_stats()["pages_reused"], 3)
+        self.assertEqual(self.store.get_stats()["files_reused"], 1)
+
+        edited = self.extract(self.pages[:2] + ["Final exam moved to May 6th at 9am in Room 202."], "v2.pdf")
+        self.assertEqual(self.stub.request_count, calls + 1)
+        self.assertEqual(edited.get_stats()["pages_reused"], 2)
+
+    def test_pages_are_not_reused_across_timezones(self):
+        self.extract(self.pages, "ny.pdf", "America/New_York")
+        la = self.extract(self.pages, "la.pdf", "America/Los_Angeles")
+
+        self.assertEqual(la.get_stats()["pages_reused"], 0)
+        self.assertEqual(self.stub.request_count, 6)
+
+
+@patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+class TemporalPrefilterTests(TestCase):
+    def test_dates_times_and_relative_expressions_are_recognised(self):
+        prefilter = TemporalPrefilter()
+        for text in [
+            "Midterm on March 3rd", "due 22 April", "Quiz on Thu.", "2025-04-22", "lab at 2:30 p.m.",
+            "meet at noon", "see you tomorrow", "next week", "in two weeks", "every other Friday", "Week 5 reading",
+        ]:
+            self.assertTrue(prefilter.has_temporal_expression(text), text)
+        for text in [
+            "Read the chapter notes before class.", "Office in Room 101", "Maybe someday", "Question 3.5 and 4",
+            "Marching band",
+        ]:
+            self.assertFalse(prefilter.has_temporal_expression(text), text)
+
+    def test_chunks_without_dates_are_never_sent(self):
+        stub = StubOpenAIServer().start()
+        self.addCleanup(stub.stop)
+        text = "Midterm on March 3rd at 2pm in Room 101. " + "Read the chapter notes before class. " * 120
+        extractor = EventExtraction(backend=OpenAIBackend(api_key="stub", base_url=stub.base_url), fast_path=False)
+
+        extractor.extract(None, text)
+
+        stats = extractor.get_stats()
+        prefilter = extractor.get_metrics()["prefilter"]
+        self.assertGreater(stats["chunks_skipped"], 0)
+        self.assertEqual(prefilter, {"kept": stats["chunks"] - stats["chunks_skipped"], "skipped": stats["chunks_skipped"]})
+        self.assertEqual(stub.request_count, prefilter["kept"])
+
+
+class DeduplicationTests(TestCase):
+    def event(self, title: str, start: str, end: str, location: str = "", description: str = "") -> Event:
+        return Event(title=title, start=start, end=end, location=location, description=description)
+
+    def test_overlapping_events_with_the_same_title_are_merged(self):
+        events = [
+            self.event("Midterm Exam", "2025-03-03T14:00:00", "2025-03-03T15:00:00", "Room 101"),
+            self.event("Homework 3 due", "2025-03-03T14:00:00", "2025-03-03T15:00:00"),
+            # The same midterm, in UTC, with the description the first one lacks
+            self.event("midterm exam!", "2025-03-03T19:00:00Z", "2025-03-03T20:00:00Z", "", "Bring a calculator"),
+            self.event("Homework 4 due", "2025-03-03T14:00:00", "2025-03-03T15:00:00"),
+            # Same title and time, different rooms
+            self.event("Midterm Exam", "2025-04-03T14:00:00", "2025-04-03T15:00:00", "Room 101"),
+            self.event("Midterm Exam", "2025-04-03T14:30:00", "2025-04-03T15:00:00", "Gym"),
+        ]
+
+        merged, ambiguous = EventDeduplicator(timezone="America/New_York").deduplicate(events)
+
+        self.assertEqual(
+            [(ev.title, ev.location, ev.description) for ev in merged],
+            [
+                ("midterm exam!", "Room 101", "Bring a calculator"),
+                ("Homework 3 due", "", ""),
+                ("Homework 4 due", "", ""),
+                ("Midterm Exam", "Room 101", ""),
+                ("Midterm Exam", "Gym", ""),
+            ],
+        )
+        self.assertEqual(ambiguous, [])
+
+    @patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0"})
+    def test_extraction_compares_times_in_the_users_timezone(self):
+        events = [
+            self.event("Office hours", "2025-03-03T14:00:00", "2025-03-03T15:00:00"),
+            self.event("Office hours", "2025-03-03T22:00:00Z", "2025-03-03T23:00:00Z"),
+        ]
+        deduplicator = EventExtraction(backend=ScriptedBackend({}), timezone="America/Los_Angeles").deduplicator
+
+        merged, _ = deduplicator.deduplicate(events)
+        self.assertEqual(len(merged), 1)
+
+    def test_similar_titles_are_reported_as_an_ambiguous_cluster(self):
+        events = [
+            self.event("Chemistry lab", "2025-03-04T10:00:00", "2025-03-04T12:00:00"),
+            self.event("Chemistry lecture", "2025-03-04T11:00:00", "2025-03-04T12:00:00"),
+            self.event("Chemistry lecture", "2025-03-05T11:00:00", "2025-03-05T12:00:00"),
+        ]
+
+        merged, ambiguous = EventDeduplicator().deduplicate(events)
+
+        self.assertEqual(len(merged), 3)
+        self.assertEqual([[ev.title for ev in group] for group in ambiguous], [["Chemistry lab", "Chemistry lecture"]])
+        self.assertEqual(ambiguous[0][1].start, "2025-03-04T11:00:00")
+
+    def test_indexed_sweep_still_finds_repeats_and_typos(self):
+        events = [self.event("Lab 3", "2025-03-04T10:00:00", "2025-03-04T12:00:00")]
+        # Repeats of the same event, one of them ending later than the first
+        events += [self.event("Office hours", "2025-03-04T10:00:00", "2025-03-04T11:00:00") for _ in range(50)]
+        events.append(self.event("Office hours", "2025-03-04T10:00:00", "2025-03-04T13:00:00", "Room 5"))
+        events += [self.event(f"Lab {i}", "2025-03-04T10:00:00", "2025-03-04T12:00:00") for i in range(4, 100)]
+        events += [
+            self.event("Offcie hours", "2025-03-04T12:30:00", "2025-03-04T13:00:00"),
+            self.event("lab 3", "2025-03-04T11:00:00", "2025-03-04T12:00:00", "Room 3"),
+        ]
+
+        merged, _ = EventDeduplicator().deduplicate(events)
+
+        titles = [ev.title for ev in merged]
+        self.assertEqual(titles.count("Office hours") + titles.count("Offcie hours"), 1)
+        self.assertEqual(len(merged), 1 + 97)
+        self.assertEqual(merged[0].location, "Room 3")
+
+
+class StreamingExtractionTests(TestCase):
+    text = "Midterm on March 3rd at 2pm in Room 101. Final exam on May 5th at 9am."
+
+    def event(self, title: str, start: str) -> Event:
+        return Event(title=title, start=start, end=start[:11] + "23:00:00", location="Room 101", description="")
+
+    def test_only_events_new_to_the_stream_are_emitted(self):
+        deduplicator = EventDeduplicator()
+        emitted = [self.event("Midterm exam", "2025-03-03T14:00:00")]
+        batch = [
+            self.event("Midterm Exam", "2025-03-03T14:00:00"),
+            self.event("Final exam", "2025-05-05T09:00:00"),
+            self.event("Final Exam", "2025-05-05T09:00:00"),
+        ]
+
+        new = deduplicator.deduplicate_new(batch, emitted)
+        self.assertEqual([ev.start for ev in new], ["2025-05-05T09:00:00"])
+        self.assertEqual(deduplicator.deduplicate_new([], emitted), [])
+
+    async def test_guest_query_streams_ndjson_batches(self):
+        stub = StubOpenAIServer().start()
+        self.addCleanup(stub.stop)
+        stub_env = {
+            "LLM_BACKEND": "openai", "OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": stub.base_url,
+            "LLM_CACHE_ENABLED": "0", "PAGE_STORE_ENABLED": "0",
+        }
+        with patch.dict(os.environ, stub_env):
+            streamed = await self.async_client.post(
+                "/guest-ai-query/", {"query": self.text}, headers={"Accept": "application/x-ndjson"}
+            )
+            self.assertEqual(streamed["Content-Type"], "application/x-ndjson")
+            body = b"".join([chunk async for chunk in streamed.streaming_content])
+            whole = await self.async_client.post("/guest-ai-query/", {"query": self.text})
+
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        events = [ev for line in lines[:-1] for ev in line["events"]]
+        self.assertEqual(lines[-1], {"done": True, "count": len(events)})
+        self.assertGreater(len(events), 0)
+        self.assertEqual(len(events), len(whole.json()["events"]))
+
+
+@override_settings(EXTRACTION_RUN_IN_PROCESS=False, EXTRACTION_QUEUE_PER_OWNER=3, EXTRACTION_RETRY_AFTER=10)
+class FairSchedulingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def enqueue_pdf(self, session_key: str) -> ExtractionJob:
+        pdf_path = os.path.join(self.directory, f"{session_key}{ExtractionJob.objects.count()}.pdf")
+        make_pdf(pdf_path, ["Midterm on March 3rd at 2pm in Room 101."])
+        return enqueue_job(session_key, None, "", pdf_path)
+
+    def claim_order(self, allow_bulk: bool = True) -> list[ExtractionJob]:
+        claimed = []
+        while (job := claim_next_job("worker", allow_bulk)) is not None:
+            claimed.append(job.id)
+        return claimed
+
+    def test_owners_take_turns_and_text_queries_go_first(self):
+        a1, a2, a3 = (self.enqueue_pdf("a") for _ in range(3))
+        b1 = self.enqueue_pdf("b")
+        text = enqueue_job("a", None, "Dentist tomorrow at 3pm")
+
+        self.assertEqual(self.claim_order(allow_bulk=False), [text.id])
+        self.assertEqual(self.claim_order(), [a1.id, b1.id, a2.id, a3.id])
+
+    def test_saturated_owner_gets_a_fast_429(self):
+        for _ in range(3):
+            self.enqueue_pdf("a")
+        with self.assertRaises(QueueFull) as raised:
+            self.enqueue_pdf("a")
+        self.assertEqual(raised.exception.retry_after, 10)
+        self.enqueue_pdf("b")
+
+        with self.settings(EXTRACTION_QUEUE_DEPTH=0):
+            response = self.client.post("/ai-process-query/", {"query": "Dentist tomorrow at 3pm"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+        self.assertEqual(response.json()["retry_after"], 10)
+
+    @override_settings(EXTRACTION_TOKENS_PER_PAGE=3000, EXTRACTION_MAX_BACKLOG_SECONDS=30)
+    @patch.dict(os.environ, {"OPENAI_TPM": "6000", "OPENAI_BULK_SHARE": "0.5"})
+    def test_pdf_backlog_is_limited_by_the_token_rate(self):
+        # Bulk work gets 3000 tokens a minute after a first minute's worth, so a second
+        # one-page PDF would wait a minute, 30 seconds past the limit
+        self.enqueue_pdf("a")
+        with self.assertRaises(QueueFull) as raised:
+            self.enqueue_pdf("b")
+        self.assertEqual(raised.exception.retry_after, 30)
+        enqueue_job("b", None, "Dentist tomorrow at 3pm")
+
+    def test_upload_is_removed_when_no_job_is_created(self):
+        upload_dir = os.path.join(self.directory, "uploads")
+        pdf_path = os.path.join(self.directory, "syllabus.pdf")
+        make_pdf(pdf_path, ["Midterm on March 3rd at 2pm in Room 101."])
+
+        with self.settings(EXTRACTION_UPLOAD_DIR=upload_dir), \
+                patch("home.views.ChatTurn.objects.create", side_effect=RuntimeError("database is down")), \
+                open(pdf_path, "rb") as upload:
+            with self.assertRaises(RuntimeError):
+                self.client.post("/ai-process-query/", {"query": "", "file": upload})
+
+        self.assertEqual(os.listdir(upload_dir), [])
+        self.assertFalse(ExtractionJob.objects.exists())
+
+
+@override_settings(EXTRACTION_RUN_IN_PROCESS=False, EXTRACTION_LOCK_TIMEOUT=60)
+class JobLockTests(TestCase):
+    def claim_stale(self, worker_id: str) -> ExtractionJob:
+        job = claim_next_job(worker_id)
+        ExtractionJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(minutes=5))
+        return job
+
+    def test_heartbeat_keeps_a_long_job_from_being_requeued(self):
+        enqueue_job("a", None, "Dentist tomorrow at 3pm")
+        job = self.claim_stale("worker-a")
+
+        Heartbeat(lambda: [job]).beat()
+        self.assertEqual(requeue_stale_jobs(timezone.now()), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (ExtractionJob.STATUS_RUNNING, "worker-a"))
+
+    def test_worker_that_lost_the_lock_does_not_overwrite_the_new_attempt(self):
+        enqueue_job("a", None, "Dentist tomorrow at 3pm")
+        stale = self.claim_stale("worker-a")
+        self.assertEqual(requeue_stale_jobs(timezone.now()), 1)
+        current = claim_next_job("worker-b")
+
+        self.assertFalse(complete_job(stale, [], {}, ""))
+        self.assertFalse(retry_or_fail(stale, RuntimeError("timed out")))
+        current.refresh_from_db()
+        self.assertEqual((current.status, current.locked_by, current.error), (ExtractionJob.STATUS_RUNNING, "worker-b", ""))
+
+        self.assertTrue(complete_job(current, [], {}, ""))
+        current.refresh_from_db()
+        self.assertEqual((current.status, current.locked_by), (ExtractionJob.STATUS_SUCCEEDED, ""))
+
+
+class RateLimiterTests(TestCase):
+    def test_bulk_calls_leave_the_rest_of_the_limit_to_interactive_ones(self):
+        limiter = RateLimiter(tpm=6000, bulk_share=0.5)
+
+        self.assertEqual(limiter.acquire(3000, bulk=True), 0)
+        self.assertAlmostEqual(limiter.drain_seconds(3000, bulk=True), 60, delta=0.1)
+        self.assertEqual(limiter.drain_seconds(3000), 0)
+        self.assertEqual(limiter.acquire(3000), 0)
+
+        # A call that used less than it reserved gives the difference back
+        limiter.settle(3000, 1000)
+        self.assertEqual(limiter.drain_seconds(2000), 0)
+
+
+@patch.dict(os.environ, {
+    "LLM_CACHE_ENABLED": "0",
+    "PAGE_STORE_ENABLED": "0",
+    "LLM_NOW": "2025-01-06T09:00:00-05:00",
+    "LLM_BACKEND": "openai",
+    "OPENAI_API_KEY": "stub",
+})
+class ResilienceTests(TransactionTestCase):
+    text = "Midterm on March 3rd at 2pm in Room 101."
+
+    def setUp(self):
+        self.stub = StubOpenAIServer().start()
+        self.addCleanup(self.stub.stop)
+        get_registry().clear()
+
+    def extract(self, **backend_options) -> EventExtraction:
+        backend = OpenAIBackend(api_key="stub", base_url=self.stub.base_url, **backend_options)
+        extractor = EventExtraction(backend=backend, fast_path=False)
+        extractor.extract(None, self.text)
+        return extractor
+
+    def test_rate_limited_call_waits_as_long_as_the_server_asks(self):
+        self.stub.faults = [{"status": 429, "headers": {"retry-after-ms": "300", "x-ratelimit-reset-requests": "20s"}}]
+        started = time.perf_counter()
+        extractor = self.extract()
+
+        self.assertGreaterEqual(time.perf_counter() - started, 0.3)
+        self.assertEqual(extractor.get_metrics()["total"]["retries"], 1)
+        self.assertEqual(self.stub.request_count, 2)
+
+    def test_slow_call_times_out_and_is_retried(self):
+        self.stub.faults = [{"delay": 2.0}]
+        started = time.perf_counter()
+        extractor = self.extract(timeout=0.3)
+
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertEqual(extractor.get_metrics()["total"]["retries"], 1)
+
+    @patch.dict(os.environ, {"OPENAI_HEDGE_AFTER": "0.2"})
+    def test_hedged_request_answers_for_a_slow_call(self):
+        self.stub.faults = [{"delay": 2.0}]
+        started = time.perf_counter()
+        extractor = self.extract()
+
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertEqual(extractor.get_metrics()["total"]["calls"], 1)
+        self.assertEqual(self.stub.request_count, 2)
+        self.assertEqual(get_registry().get("extraction_hedges_total", outcome="won"), 1)
+
+    @patch.dict(os.environ, {"OPENAI_MAX_RETRIES": "5", "OPENAI_RETRY_BUDGET": "1"})
+    def test_retries_stop_when_the_budget_is_spent(self):
+        self.stub.fail_next = 3
+        with self.assertRaises(Exception):
+            self.extract()
+        self.assertEqual(self.stub.request_count, 2)
+        self.assertEqual(get_registry().get("extraction_retry_budget_exhausted_total"), 1)
+
+    @patch.dict(os.environ, {"OPENAI_MAX_RETRIES": "5", "OPENAI_BREAKER_FAILURES": "2", "OPENAI_BREAKER_RESET": "0.5"})
+    def test_breaker_fails_fast_and_closes_after_a_good_trial_call(self):
+        self.stub.fail_next = 10
+        backend = OpenAIBackend(api_key="stub", base_url=self.stub.base_url)
+        with self.assertRaises(InternalServerError):
+            EventExtraction(backend=backend, fast_path=False).extract(None, self.text)
+        self.assertEqual(self.stub.request_count, 2)
+        for _ in range(2):
+            with self.assertRaises(CircuitOpen):
+                EventExtraction(backend=backend, fast_path=False).extract(None, self.text)
+        self.assertEqual(self.stub.request_count, 2)
+
+        time.sleep(0.5)
+        self.stub.fail_next = 0
+        self.assertGreater(len(EventExtraction(backend=backend, fast_path=False).extract(None, self.text)), 0)
+        self.assertEqual(get_registry().get("extraction_breaker_rejections_total"), 2)
+
+    def test_cancelled_trial_call_frees_the_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        health = BackendHealth()
+        health.breaker = breaker
+        backend = ResilientBackend(OpenAIBackend(api_key="stub", base_url=self.stub.base_url), health=health)
+        self.stub.faults = [{"delay": 2.0}]
+        request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": self.text}], "response_format": EventWrapper}
+
+        async def cancel_trial():
+            trial = asyncio.ensure_future(backend.complete_async(request, "key"))
+            await asyncio.sleep(0.2)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+        asyncio.run(cancel_trial())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    @patch.dict(os.environ, {"OPENAI_MAX_RETRIES": "0"})
+    def test_retried_job_resumes_from_its_checkpoint(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Two chunks, so two calls
+        filler = "Read the chapter notes before class. " * 60
+        query = f"Midterm on March 3rd at 2pm in Room 101. {filler}Final exam on May 5th at 9am in Room 202."
+        job = ExtractionJob.objects.create(query=query, status=ExtractionJob.STATUS_RUNNING, attempts=1)
+
+        # One chunk's call succeeds and the other's fails, so the first attempt fails
+        self.stub.faults = [{}, {"status": 500}]
+        with patch.dict(os.environ, {"OPENAI_BASE_URL": self.stub.base_url}), \
+                self.settings(EXTRACTION_CHECKPOINT_DIR=directory.name, EXTRACTION_COALESCE=False):
+            run_job(job)
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExtractionJob.STATUS_QUEUED)
+
+            job.status = ExtractionJob.STATUS_RUNNING
+            job.attempts = 2
+            job.save()
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_SUCCEEDED)
+        self.assertEqual(self.stub.request_count, 3)
+        self.assertEqual(job.metrics["total"]["resumed"], 1)
+        self.assertEqual(job.metrics["total"]["calls"], 1)
+        self.assertEqual(os.listdir(directory.name), [])
+
+    def test_checkpoint_appends_and_skips_a_line_cut_off_by_a_crash(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "job.jsonl")
+        checkpoint = Checkpoint(path)
+        checkpoint.put("a", LLMResponse("{}", "gpt-4o-mini"))
+        asyncio.run(checkpoint.put_async("b", LLMResponse("[]", "gpt-4o-mini")))
+        with open(path, "a", encoding="utf-8") as file:
+            file.write('{"key": "c", "respo')
+
+        resumed = Checkpoint(path)
+        resumed.put("d", LLMResponse("{}", "gpt-4o"))
+        reloaded = Checkpoint(path)
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.get("b").content, "[]")
+        self.assertEqual(reloaded.get("d").model, "gpt-4o")
+        self.assertIsNone(reloaded.get("c"))
@@ -6,11 +6,18 @@ urlpatterns = [
     path('', views.index, name='home.index'),
     path('add-event/', views.add_event_to_google, name='add_event_to_google'),
     path('delete-event/', views.delete_event_from_google, name='delete_event_from_google'),
+    path('add-events/', views.add_events_to_google, name='add_events_to_google'),
+    path('delete-events/', views.delete_events_from_google, name='delete_events_from_google'),
+    path('google-service-stats/', views.google_service_stats, name='google_service_stats'),
+    path('metrics/', views.metrics, name='metrics'),
     path('ai-process-query/', views.ai_process_query, name='ai_process_query'),
     path('chat-history/', views.get_chat_history, name='chat_history'),
+    path('chat-history/<int:turn_id>/file-text/', views.get_chat_file_text, name='chat_file_text'),
     path('suggested-events/', views.get_event_suggestions, name='get_event_suggestions'),
     path('about/', views.about, name='home.about'),
     path('poll-llm-status/', views.poll_llm_status, name='poll_llm_status'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/events/', views.job_events, name='job_events'),
     path('plus/', views.plus, name='home.plus'),
     path('contact/', views.contact, name='home.contact'),
     path('tutorial/', views.tutorial, name='home.tutorial'),
@@ -1,81 +1,87 @@
 from django.shortcuts import render
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 from django.conf import settings
 from allauth.socialaccount.models import SocialToken, SocialAccount
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.db import transaction
 import json
+import time
+import asyncio
 import datetime
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-import PyPDF2
-from io import BytesIO
 from django.views.decorators.http import require_GET
 import os
+from zoneinfo import ZoneInfo
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
+from home.llm.pdf_ingest import spool_upload, count_pages
+from home.jobs import enqueue_job, estimate_job_tokens, QueueFull
+from home.models import ExtractionJob, ChatTurn
+from home.calendar_batch import execute_batch, describe_error
+from home.google_services import calendar_service, get_service_pool
+from home.llm.metrics import get_registry
+from home.worker_metrics import other_process_metrics
+from home.calendar_sync import is_sync_due, sync_user_calendars, load_events, store_event, remove_event
 
 load_dotenv()
 
+CHAT_PAGE_SIZE = 20
+CHAT_MAX_PAGE_SIZE = 100
 
 
-def add_event_to_google(request):
-    if request.method == "POST":
-        if not request.user.is_authenticated:
-            return JsonResponse({"error": "User not authenticated"}, status=403)
 
-        try:
-            token = SocialToken.objects.get(account__user=request.user, account__provider='google')
-        except SocialToken.DoesNotExist:
-            return JsonResponse({"error": "Google token not found for user"}, status=404)
+# Request body for events().insert, or None when a required field is missing
+def make_google_event(title, start, end, location, description) -> dict | None:
+    if not (title and start and end):
+        return None
 
-        credentials = Credentials(
-            token=token.token,
-            refresh_token=token.token_secret,
-            token_uri='https://oauth2.googleapis.com/token',
-            client_id=settings.GOOGLE_CLIENT_ID,
-            client_secret=settings.GOOGLE_CLIENT_SECRET,
-            scopes=['https://www.googleapis.com/auth/calendar']
-        )
+    return {
+        'summary': title,
+        'location': location,
+        'description': description,
+        'start': {
+            'dateTime': start,
+            'timeZone': 'America/New_York',
+        },
+        'end': {
+            'dateTime': end,
+            'timeZone': 'America/New_York',
+        },
+        'reminders': {
+            'useDefault': True,
+        },
+    }
 
-        service = build('calendar', 'v3', credentials=credentials)
+
+# The views below are async: under ASGI a request waiting on Google or the LLM holds no
+# worker thread. Blocking work (Calendar API calls through the service pool, the ORM,
+# PDF parsing) runs via sync_to_async, in a thread of the request's own context.
+
+async def add_event_to_google(request):
+    if request.method == "POST":
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"error": "User not authenticated"}, status=403)
 
         event_data = request.POST
 
-        title = event_data.get("title")
-        start = event_data.get("start")
-        end = event_data.get("end")
-        location = event_data.get("location")
-        description = event_data.get("description")
+        event = make_google_event(
+            event_data.get("title"),
+            event_data.get("start"),
+            event_data.get("end"),
+            event_data.get("location"),
+            event_data.get("description")
+        )
 
-        if not (title and start and end):
+        if event is None:
             return JsonResponse({"error": "Missing required fields (title, start, end)"}, status=400)
 
-        event = {
-            'summary': title,
-            'location': location,
-            'description': description,
-            'start': {
-                'dateTime': start,
-                'timeZone': 'America/New_York',
-            },
-            'end': {
-                'dateTime': end,
-                'timeZone': 'America/New_York',
-            },
-            'reminders': {
-                'useDefault': True,
-            },
-        }
-
         try:
             print("Sending event to Google Calendar:", json.dumps(event, indent=2))
-            created_event = service.events().insert(calendarId='primary', body=event).execute()
-
-            # Fetch back the full event to confirm saved values
-            fetched_event = service.events().get(calendarId='primary', eventId=created_event['id']).execute()
-            print("Event confirmed in Google Calendar:", json.dumps(fetched_event, indent=2))
+            created_event = await sync_to_async(insert_event)(user, event)
 
             return JsonResponse({
                 "message": "Event added to Google Calendar",
@@ -83,6 +89,9 @@ def add_event_to_google(request):
                 "link": created_event.get("htmlLink")
             })
 
+        except SocialToken.DoesNotExist:
+            return JsonResponse({"error": "Google token not found for user"}, status=404)
+
         except Exception as e:
             print("Failed to create event:", e)
             return JsonResponse({"error": str(e)}, status=500)
@@ -90,9 +99,79 @@ def add_event_to_google(request):
     return JsonResponse({"error": "Invalid request method"}, status=400)
 
 
-def delete_event_from_google(request):
+def insert_event(user, event: dict) -> dict:
+    with calendar_service(user) as service:
+        created_event = service.events().insert(calendarId='primary', body=event).execute()
+
+        # insert already returns the stored event; reading it back is only for debugging
+        if settings.GOOGLE_CONFIRM_INSERTS:
+            fetched_event = service.events().get(calendarId='primary', eventId=created_event['id']).execute()
+            print("Event confirmed in Google Calendar:", json.dumps(fetched_event, indent=2))
+    store_event(user, 'primary', created_event)
+    return created_event
+
+
+# The events list of a bulk request's JSON body, or None when the body isn't one
+def read_event_items(request) -> list | None:
+    try:
+        items = json.loads(request.body).get("events", [])
+    except (ValueError, AttributeError):
+        return None
+    return items if isinstance(items, list) else None
+
+
+# Adds many events in batch requests. Body: {"events": [{title, start, end, location,
+# description}, ...]}; the response has one result per event, in the same order.
+@require_POST
+def add_events_to_google(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not authenticated"}, status=403)
+
+    items = read_event_items(request)
+    if items is None:
+        return JsonResponse({"error": "Expected a JSON body with an events list"}, status=400)
+
+    results = [None] * len(items)
+    bodies, positions = [], []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {"ok": False, "error": "Expected an event object"}
+            continue
+        event = make_google_event(
+            item.get("title"), item.get("start"), item.get("end"), item.get("location"), item.get("description")
+        )
+        if event is None:
+            results[i] = {"ok": False, "error": "Missing required fields (title, start, end)"}
+            continue
+        bodies.append(event)
+        positions.append(i)
+
+    try:
+        with calendar_service(request.user) as service:
+            requests = [service.events().insert(calendarId='primary', body=event) for event in bodies]
+            responses = execute_batch(service, requests)
+    except SocialToken.DoesNotExist:
+        return JsonResponse({"error": "Google token not found for user"}, status=404)
+    except Exception as e:
+        print("Failed to create events:", e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    for i, (created_event, exception) in zip(positions, responses):
+        if exception is not None:
+            results[i] = {"ok": False, "error": describe_error(exception)}
+            continue
+        store_event(request.user, 'primary', created_event)
+        results[i] = {"ok": True, "eventId": created_event["id"], "link": created_event.get("htmlLink")}
+
+    added = sum(1 for result in results if result["ok"])
+    print(f"Added {added} of {len(results)} events to Google Calendar")
+    return JsonResponse({"added": added, "results": results})
+
+
+async def delete_event_from_google(request):
     if request.method == "POST":
-        if not request.user.is_authenticated:
+        user = await request.auser()
+        if not user.is_authenticated:
             return JsonResponse({"error": "User not authenticated"}, status=403)
 
         try:
@@ -103,18 +182,7 @@ def delete_event_from_google(request):
             if not event_id:
                 return JsonResponse({"error": "Missing event ID"}, status=400)
 
-            token = SocialToken.objects.get(account__user=request.user, account__provider='google')
-            credentials = Credentials(
-                token=token.token,
-                refresh_token=token.token_secret,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=settings.GOOGLE_CLIENT_ID,
-                client_secret=settings.GOOGLE_CLIENT_SECRET,
-                scopes=['https://www.googleapis.com/auth/calendar']
-            )
-
-            service = build('calendar', 'v3', credentials=credentials)
-            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+            await sync_to_async(delete_event)(user, calendar_id, event_id)
             return JsonResponse({"message": "Event deleted"})
 
         except Exception as e:
@@ -124,72 +192,103 @@ def delete_event_from_google(request):
     return JsonResponse({"error": "Invalid request method"}, status=400)
 
 
-def index(request):
+def delete_event(user, calendar_id: str, event_id: str) -> None:
+    with calendar_service(user) as service:
+        service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+    remove_event(user, calendar_id, event_id)
+
+
+# Deletes many events in batch requests. Body: {"events": [{eventId, calendarId}, ...]};
+# the response has one result per event, in the same order.
+@require_POST
+def delete_events_from_google(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not authenticated"}, status=403)
+
+    items = read_event_items(request)
+    if items is None:
+        return JsonResponse({"error": "Expected a JSON body with an events list"}, status=400)
+
+    results = [None] * len(items)
+    positions = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {"ok": False, "error": "Expected an event object"}
+            continue
+        if not item.get("eventId"):
+            results[i] = {"ok": False, "error": "Missing event ID"}
+            continue
+        positions.append(i)
+
+    try:
+        with calendar_service(request.user) as service:
+            requests = [
+                service.events().delete(calendarId=items[i].get("calendarId", "primary"), eventId=items[i]["eventId"])
+                for i in positions
+            ]
+            responses = execute_batch(service, requests)
+    except SocialToken.DoesNotExist:
+        return JsonResponse({"error": "Google token not found for user"}, status=404)
+    except Exception as e:
+        print("Failed to delete events:", e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    for i, (_, exception) in zip(positions, responses):
+        if exception is not None:
+            results[i] = {"ok": False, "error": describe_error(exception)}
+            continue
+        remove_event(request.user, items[i].get("calendarId", "primary"), items[i]["eventId"])
+        results[i] = {"ok": True, "eventId": items[i]["eventId"]}
+
+    deleted = sum(1 for result in results if result["ok"])
+    print(f"Deleted {deleted} of {len(results)} events from Google Calendar")
+    return JsonResponse({"deleted": deleted, "results": results})
+
+
+# Events come from the local mirror; Google is only asked for changes, and at most once
+# per CALENDAR_SYNC_INTERVAL
+async def index(request):
     events = []
     all_calendars = []
 
-    if request.user.is_authenticated:
+    user = await request.auser()
+    if user.is_authenticated:
         try:
-            print("Checking Google account and tokens for:", request.user.email)
-            token = SocialToken.objects.get(account__user=request.user, account__provider='google')
-
-            credentials = Credentials(
-                token=token.token,
-                refresh_token=token.token_secret,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=settings.GOOGLE_CLIENT_ID,
-                client_secret=settings.GOOGLE_CLIENT_SECRET,
-                scopes=['https://www.googleapis.com/auth/calendar']
-            )
-
-            service = build('calendar', 'v3', credentials=credentials)
-            calendar_list = service.calendarList().list().execute()
-
-            for calendar_entry in calendar_list.get('items', []):
-                calendar_id = calendar_entry['id']
-                all_calendars.append({
-                    'id': calendar_id,
-                    'name': calendar_entry['summary'],
-                    'color': calendar_entry.get('backgroundColor', '#3788d8')
-                })
-
-                result = service.events().list(
-                    calendarId=calendar_id,
-                    timeMin=(datetime.datetime.utcnow() - datetime.timedelta(minutes=5)).isoformat() + 'Z',
-                    maxResults=100,
-                    singleEvents=True,
-                    orderBy='startTime'
-                ).execute()
-
-                for event in result.get('items', []):
-                    start = event.get('start', {}).get('dateTime') or event.get('start', {}).get('date')
-                    end = event.get('end', {}).get('dateTime') or event.get('end', {}).get('date')
-
-                    if not start or not end:
-                        continue
-
-                    events.append({
-                        'summary': event.get('summary', 'No Title'),
-                        'start': start,
-                        'end': end,
-                        'location': event.get('location', ''),
-                        'description': event.get('description', ''),
-                        'creator': event.get('creator', {}).get('email', ''),
-                        'calendarId': calendar_id,
-                        'backgroundColor': calendar_entry.get('backgroundColor', '#3788d8'),
-                        'htmlLink': event.get('htmlLink', ''),
-                        'googleEventId': event.get('id'),
-                    })
-
+            await sync_to_async(sync_if_due)(user)
         except Exception as e:
-            print("Error fetching calendar data:", e)
+            print("Error syncing calendar data:", e)
+
+        events, all_calendars = await sync_to_async(load_events)(user)
 
-    return render(request, 'home/index.html', {
+    # The templates read request.user, which loads lazily from the database
+    return await sync_to_async(render)(request, 'home/index.html', {
         'events': events,
-        'calendars': all_calendars,
-        'chat_history': request.session.get("chat_history", [])
+        'calendars': all_calendars
     })
 
+
+def sync_if_due(user) -> None:
+    if is_sync_due(user):
+        print("Syncing Google calendars for:", user.email)
+        with calendar_service(user) as service:
+            sync_user_calendars(service, user)
+
+# Setup time per Calendar request with and without a pooled service (staff only)
+@require_GET
+def google_service_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Not allowed"}, status=403)
+    return JsonResponse(get_service_pool().get_stats())
+
+# Extraction stage and job counters in the Prometheus text format: this process's, plus
+# the last flushed ones of run_extraction_workers processes (see home/worker_metrics.py)
+def metrics(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    bearer = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not request.user.is_staff and not (token and constant_time_compare(bearer, token)):
+        return HttpResponse("Not allowed\n", status=403, content_type="text/plain")
+    return HttpResponse(get_registry().render(other_process_metrics()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def about(request):
     template_data = {}
     template_data['title'] = 'About'
@@ -212,119 +311,211 @@ def tutorial(request):
 
 @csrf_exempt
 @require_POST
-def ai_process_query(request):
+async def ai_process_query(request):
     print("ai_process_query view triggered")
-    user = "auth" if request.user.is_authenticated else "guest"
-    prefix = f"{user}_"
-    #user = request.user
+    user = await request.auser()
 
     #if not SocialToken.objects.filter(account__user=user, account__provider='google').exists():
         #return JsonResponse({"error": "Only Google-authenticated users can use this feature."}, status=403)
 
     query = request.POST.get("query", "").strip()
     uploaded_file = request.FILES.get("file")
-    session_history = request.session.get("chat_history", [])
-    extracted_text = ""
+    pdf_path = None
 
+    # The PDF is parsed page by page by the job worker; here it is only spooled and checked
     if uploaded_file and uploaded_file.name.endswith('.pdf'):
         try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(uploaded_file.read()))
-            for page in pdf_reader.pages:
-                extracted_text += page.extract_text() or ""
+            os.makedirs(settings.EXTRACTION_UPLOAD_DIR, exist_ok=True)
+            pdf_path = await sync_to_async(spool_and_check)(uploaded_file, settings.EXTRACTION_UPLOAD_DIR)
         except Exception as e:
             return JsonResponse({"error": f"PDF read error: {str(e)}"}, status=400)
 
-    session_history.append({
+    # Once its job is committed, the upload belongs to the job (the worker removes it);
+    # if the job was not created, for whatever reason, nothing else will
+    job = None
+    try:
+        job = await sync_to_async(queue_query)(request, user, query, pdf_path)
+    except QueueFull as e:
+        print("ai_process_query rejected:", e)
+        return too_many_requests(e.retry_after)
+    finally:
+        if job is None and pdf_path:
+            os.remove(pdf_path)
+
+    print("ai_process_query view completed, extraction job", job.id, "queued.")
+
+    return JsonResponse({
+        "message": "Query received. LLM processing started.",
         "query": query,
-        "file_text": extracted_text,
-        "suggested_events": []  
+        "processing": True,
+        "job_id": str(job.id),
+        "suggested_events": []
     })
 
-    request.session["chat_history"] = session_history
-    request.session["event_suggestions"] = []
-    request.session["llm_processing"] = True
-    request.session.modified = True  # ensure session is saved
 
-    def simulate_llm_generation(session_key, query, extracted_text=""):
-        print("simulate_llm_generation using EventExtraction class")
+# Fast rejection for a saturated queue or rate limit; clients retry after retry_after
+def too_many_requests(retry_after: int) -> JsonResponse:
+    response = JsonResponse({
+        "error": f"Too many requests are being processed. Please try again in {retry_after} seconds.",
+        "retry_after": retry_after,
+    }, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
 
-        from django.contrib.sessions.backends.db import SessionStore
-        from home.llm.event_llm import EventExtraction  # path based on your file location
 
-        try:
-            extractor = EventExtraction()
-            instruction = query if query else None
-            events = extractor.extract(instruction, extracted_text)
-
-            normalized = []
-            for ev in events:
-                normalized.append({
-                    "title": ev["title"],
-                    "start": ev["start"],
-                    "end": ev["end"],
-                    "location": ev["location"],
-                    "description": ev["description"],
-                    "backgroundColor": "#3788d8",
-                    "calendarId": "primary",
-                    "extendedProps": {
-                        "location": ev["location"],
-                        "description": ev["description"],
-                        "creator": "",
-                        "htmlLink": "",
-                        "googleEventId": ""
-                    }
-                })
-
-            session = SessionStore(session_key=session_key)
-            session["event_suggestions"] = normalized
-            session["llm_processing"] = False
-
-            history = session.get("chat_history", [])
-            if history:
-                history[-1]["suggested_events"] = normalized
-            session["chat_history"] = history
-            session.save()
-
-            print(" Events saved to session")
+# Spools an uploaded PDF and checks that it parses; nothing is left behind if it doesn't
+def spool_and_check(uploaded_file, directory: str = None) -> str:
+    pdf_path = spool_upload(uploaded_file, directory)
+    try:
+        count_pages(pdf_path)
+    except Exception:
+        os.remove(pdf_path)
+        raise
+    return pdf_path
+
+
+def queue_query(request, user, query: str, pdf_path: str | None) -> ExtractionJob:
+    # Jobs are tied to the session, so make sure it has a key before enqueueing
+    if not request.session.session_key:
+        request.session.save()
+
+    # The job and its chat turn are created together, so either both exist or the caller
+    # still owns pdf_path
+    with transaction.atomic():
+        job = enqueue_job(request.session.session_key, user, query, pdf_path, request_timezone(request))
+
+        ChatTurn.objects.create(
+            session_key=request.session.session_key,
+            user=user if user.is_authenticated else None,
+            query=query,
+            job=job
+        )
 
-        except Exception as e:
-            print(" simulate_llm_generation failed:", str(e))
-            session = SessionStore(session_key=session_key)
-            session["event_suggestions"] = []
-            session["llm_processing"] = False
-            session.save()
+    # The session only remembers which job is current; history and results live in the DB
+    request.session["extraction_job_id"] = str(job.id)
+    return job
 
+# Job views are async and never load the session, so a waiting client costs one cheap
+# version query per interval instead of a worker thread and a session read per poll
+async def get_owned_job(request, job_id) -> ExtractionJob | None:
+    job = await ExtractionJob.objects.filter(id=job_id).afirst()
 
+    # Only the session that created the job may read it (session_key comes from the cookie)
+    if job is None or (job.session_key and job.session_key != request.session.session_key):
+        return None
+    return job
 
 
-    from threading import Thread
-    Thread(target=simulate_llm_generation, args=(request.session.session_key, query, extracted_text)).start()
-    print("ai_process_query view completed, LLM processing started in background.")
+# Waits until the job's version differs from job.version, or until deadline
+async def wait_for_change(job: ExtractionJob, deadline: float) -> ExtractionJob:
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.JOB_STREAM_INTERVAL)
+        version = await ExtractionJob.objects.filter(id=job.id).values_list("version", flat=True).afirst()
+        if version is not None and version != job.version:
+            return await ExtractionJob.objects.aget(id=job.id)
+    return job
+
+
+# ?version=N turns this into a long poll (the fallback for clients without EventSource):
+# the response is held until the job moves past version N or JOB_LONG_POLL_TIMEOUT passes
+@csrf_exempt
+@require_GET
+async def job_status(request, job_id):
+    job = await get_owned_job(request, job_id)
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+
+    since = request.GET.get("version", "")
+    if since.isdigit() and job.version <= int(since) and not job.is_finished:
+        job = await wait_for_change(job, time.monotonic() + settings.JOB_LONG_POLL_TIMEOUT)
+
+    return JsonResponse(job.to_dict())
+
+
+# Server-sent event stream of a job: a "status" event with the job's state (including
+# partial suggestions) on every change, until the job finishes
+@csrf_exempt
+@require_GET
+async def job_events(request, job_id):
+    job = await get_owned_job(request, job_id)
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+
+    response = StreamingHttpResponse(stream_job(job), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def stream_job(job: ExtractionJob):
+    yield format_job_event(job)
+
+    deadline = time.monotonic() + settings.JOB_STREAM_TIMEOUT
+    while not job.is_finished and time.monotonic() < deadline:
+        # Wake up at least every 15 seconds, so proxies see traffic on an idle stream
+        changed = await wait_for_change(job, min(deadline, time.monotonic() + 15))
+        if changed is job:
+            yield ": keep-alive\n\n"
+            continue
+        job = changed
+        yield format_job_event(job)
+
+
+def format_job_event(job: ExtractionJob) -> str:
+    return f"id: {job.version}\nevent: status\ndata: {json.dumps(job.to_dict())}\n\n"
+
+# Signed-in users see their turns from any session, guests those of their session
+def chat_turns_for(request):
+    if request.user.is_authenticated:
+        return ChatTurn.objects.filter(user=request.user)
+    if not request.session.session_key:
+        return ChatTurn.objects.none()
+    return ChatTurn.objects.filter(session_key=request.session.session_key, user=None)
 
-    return JsonResponse({
-        "message": "Query received. LLM processing started.",
-        "query": query,
-        "processing": True,
-        "suggested_events": []
-    })
 
+# Newest turns first: page 1 holds the latest page_size turns, listed oldest to newest
 @csrf_exempt
 @require_GET
 def get_chat_history(request):
-    user = "auth" if request.user.is_authenticated else "guest"
-    key = f"{user}_chat_history"
+    try:
+        page_number = max(int(request.GET.get("page", 1)), 1)
+        page_size = min(max(int(request.GET.get("page_size", CHAT_PAGE_SIZE)), 1), CHAT_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "page and page_size must be integers"}, status=400)
+
+    turns = chat_turns_for(request).select_related("job").order_by("-created_at", "-id")
+    total = turns.count()
+    offset = (page_number - 1) * page_size
+    page = list(turns[offset:offset + page_size])
+    page.reverse()
+
     return JsonResponse({
-        "history": request.session.get("chat_history", [])
+        "history": [turn.to_dict() for turn in page],
+        "page": page_number,
+        "page_size": page_size,
+        "total": total,
+        "has_more": offset + page_size < total
     })
 
+# Full extracted text of one turn, decompressed on demand
+@csrf_exempt
+@require_GET
+def get_chat_file_text(request, turn_id):
+    turn = chat_turns_for(request).select_related("file_text").filter(id=turn_id).first()
+    if turn is None:
+        return JsonResponse({"error": "Chat entry not found"}, status=404)
+    return JsonResponse({"file_text": turn.file_text.text if turn.file_text else ""})
+
+def current_job(request) -> ExtractionJob | None:
+    job_id = request.session.get("extraction_job_id")
+    return ExtractionJob.objects.filter(id=job_id).first() if job_id else None
+
 @csrf_exempt
 @require_GET
 def get_event_suggestions(request):
-    user = "auth" if request.user.is_authenticated else "guest"
-    key = f"{user}_chat_history"
-    print("Returning suggested events:", request.session.get("event_suggestions", []))
+    job = current_job(request)
     return JsonResponse({
-        "suggested_events": request.session.get("event_suggestions", [])
+        "suggested_events": job.result if job is not None else []
     })
 
 
@@ -332,73 +523,150 @@ def get_event_suggestions(request):
 @csrf_exempt
 @require_GET
 def poll_llm_status(request):
-    user = "auth" if request.user.is_authenticated else "guest"
-    key_processing = f"{user}_llm_processing"
-    key_suggestions = f"{user}_event_suggestions"    
-    print("poll_llm_status hit at", datetime.datetime.now().time(), "processing =", request.session.get("llm_processing", False))
+    job = current_job(request)
+    if job is not None:
+        return JsonResponse({
+            "processing": not job.is_finished,
+            "status": job.status,
+            "suggested_events": job.result
+        })
+
     return JsonResponse({
-        "processing": request.session.get("llm_processing", False),
-        "suggested_events": request.session.get("event_suggestions", [])
+        "processing": False,
+        "suggested_events": []
     })
     
+# The IANA timezone the browser sent with a query, or "" if missing or unknown
+def request_timezone(request) -> str:
+    name = request.POST.get("timezone", "")
+    if not name or len(name) > 64:
+        return ""
+    try:
+        ZoneInfo(name)
+    except (ValueError, KeyError):
+        return ""
+    return name
+
+# Extraction runs on the request's event loop with the process-wide async OpenAI client,
+# so under ASGI hundreds of guest extractions can wait on the API in one process
 @csrf_exempt
 @require_POST
-def guest_ai_query(request):
+async def guest_ai_query(request):
     print("📩 Guest AI Query triggered")
 
     query = request.POST.get("query", "").strip()
     uploaded_file = request.FILES.get("file")
-    extracted_text = ""
+    pdf_path = None
 
     if not query and not uploaded_file:
         return JsonResponse({"error": "Query or file required."}, status=400)
 
-    # Extract text from PDF file if present
+    # Spool the PDF to disk; its pages are parsed lazily while extraction runs
     if uploaded_file and uploaded_file.name.endswith('.pdf'):
         try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(uploaded_file.read()))
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    extracted_text += text
+            pdf_path = await sync_to_async(spool_and_check)(uploaded_file)
         except Exception as e:
             print("PDF read error:", e)
             return JsonResponse({"error": f"PDF read error: {str(e)}"}, status=400)
 
-    try:
-        from home.llm.event_llm import EventExtraction
-        extractor = EventExtraction()
+    # Guest PDFs run right away rather than queued, so they are turned away while the
+    # bulk share of the OpenAI limits is already booked that far ahead
+    if pdf_path:
+        retry_after = await sync_to_async(guest_pdf_retry_after)(pdf_path)
+        if retry_after:
+            os.remove(pdf_path)
+            return too_many_requests(retry_after)
+
+    from home.llm.event_llm import EventExtraction
+    extractor = EventExtraction(timezone=request_timezone(request) or None, bulk=pdf_path is not None)
+    print(f"Extracting events with query='{query}' and PDF upload={pdf_path is not None}")
+
+    # With a PDF, the query is an instruction for filtering its events
+    instruction = query if pdf_path and query else None
+    if "application/x-ndjson" in request.headers.get("Accept", ""):
+        response = StreamingHttpResponse(stream_guest_events(extractor, instruction, query, pdf_path), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
-        instruction = query if query else None
-        print(f"Extracting events with query='{instruction}' and PDF content length={len(extracted_text)}")
-        events = extractor.extract(instruction, extracted_text)
+    try:
+        if pdf_path:
+            events = await extractor.extract_pdf_async(instruction, pdf_path)
+        else:
+            events = await extractor.extract_async(None, query)
 
         if not isinstance(events, list):
             raise ValueError("LLM did not return a list of events")
 
-        normalized = []
-        for ev in events:
-            normalized.append({
-                "title": ev.get("title", "Untitled"),
-                "start": ev.get("start", ""),
-                "end": ev.get("end", ""),
-                "location": ev.get("location", ""),
-                "description": ev.get("description", ""),
-                "backgroundColor": "#3788d8",
-                "calendarId": "primary",
-                "extendedProps": {
-                    "location": ev.get("location", ""),
-                    "description": ev.get("description", ""),
-                    "creator": "",
-                    "htmlLink": "",
-                    "googleEventId": ""
-                }
-            })
+        normalized = [normalize_guest_event(ev) for ev in events]
 
         print(f"{len(normalized)} events extracted.")
-        request.session.modified = True
         return JsonResponse({"events": normalized})
 
     except Exception as e:
         print("Guest LLM extraction failed:", e)
         return JsonResponse({"error": str(e)}, status=500)
+
+    finally:
+        if pdf_path:
+            os.remove(pdf_path)
+
+
+# Seconds until the bulk token bucket could take this PDF within
+# EXTRACTION_MAX_BACKLOG_SECONDS, or 0 when it can start now
+def guest_pdf_retry_after(pdf_path: str) -> int:
+    from home.llm.rate_limit import get_default_limiter
+
+    limiter = get_default_limiter()
+    if limiter is None:
+        return 0
+    seconds = limiter.drain_seconds(estimate_job_tokens("", pdf_path), bulk=True)
+    excess = seconds - settings.EXTRACTION_MAX_BACKLOG_SECONDS
+    return max(1, int(excess + 0.5)) if excess > 0 else 0
+
+
+# NDJSON body of a streamed guest query: an {"events": [...]} line per finished chunk
+# with events in it, then {"done": true, "count": N}, or {"error": ...} if extraction
+# failed part way (the status is already 200 by then)
+async def stream_guest_events(extractor, instruction: str | None, query: str, pdf_path: str | None):
+    count = 0
+    try:
+        if pdf_path:
+            stream = extractor.stream_pdf_async(instruction, pdf_path)
+        else:
+            stream = extractor.stream_async(None, query)
+
+        async for events in stream:
+            if events:
+                count += len(events)
+                yield json.dumps({"events": [normalize_guest_event(ev) for ev in events]}) + "\n"
+
+        print(f"{count} events streamed.")
+        yield json.dumps({"done": True, "count": count}) + "\n"
+
+    except Exception as e:
+        print("Guest LLM extraction failed:", e)
+        yield json.dumps({"error": str(e)}) + "\n"
+
+    finally:
+        if pdf_path:
+            os.remove(pdf_path)
+
+
+def normalize_guest_event(ev: dict) -> dict:
+    return {
+        "title": ev.get("title", "Untitled"),
+        "start": ev.get("start", ""),
+        "end": ev.get("end", ""),
+        "location": ev.get("location", ""),
+        "description": ev.get("description", ""),
+        "backgroundColor": "#3788d8",
+        "calendarId": "primary",
+        "extendedProps": {
+            "location": ev.get("location", ""),
+            "description": ev.get("description", ""),
+            "creator": "",
+            "htmlLink": "",
+            "googleEventId": ""
+        }
+    }
@@ -0,0 +1,66 @@
+import os
+import socket
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from home.models import MetricsSnapshot
+from home.llm.metrics import get_registry
+
+
+# Extraction counters of worker processes started with run_extraction_workers live in
+# those processes' registries. Each of them writes a snapshot of its registry to the
+# MetricsSnapshot table every METRICS_FLUSH_INTERVAL seconds and when it stops, and
+# /metrics/ renders its own registry plus the snapshots of the other processes.
+# Snapshots of processes that stopped more than METRICS_SNAPSHOT_TTL seconds ago are
+# dropped, so their counters eventually leave the totals (a counter reset to Prometheus).
+
+
+def process_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def flush_metrics() -> None:
+    MetricsSnapshot.objects.update_or_create(
+        process=process_name(), defaults={"values": get_registry().snapshot()}
+    )
+
+
+# (process, snapshot) of every other process that flushed recently enough
+def other_process_metrics() -> list[tuple[str, dict]]:
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "METRICS_SNAPSHOT_TTL", 7 * 86400))
+    MetricsSnapshot.objects.filter(updated_at__lt=cutoff).delete()
+    snapshots = MetricsSnapshot.objects.exclude(process=process_name()).order_by("process")
+    return [(snapshot.process, snapshot.values) for snapshot in snapshots]
+
+
+# Flushes the registry every interval seconds on a background thread, and once more on stop
+class MetricsFlusher:
+    def __init__(self, interval: float = None):
+        if interval is None:
+            interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 15)
+        self.interval = interval
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+    def run(self) -> None:
+        try:
+            while not self.__stop.wait(self.interval):
+                self.flush()
+            self.flush()
+        finally:
+            connection.close()
+
+    def flush(self) -> None:
+        try:
+            flush_metrics()
+        except Exception as e:
+            print("Failed to flush worker metrics:", str(e))